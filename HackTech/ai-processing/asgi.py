@@ -0,0 +1,468 @@
+# asgi.py
+# Async serving mode: same endpoints and request/response contract as main.py, for an ASGI server, e.g.
+#   uvicorn asgi:app --host 0.0.0.0 --port 5000 --workers 4
+#   gunicorn asgi:app -k uvicorn.workers.UvicornWorker -w 4 -b 0.0.0.0:5000
+
+import os
+import json
+import asyncio
+import time
+import logging
+import threading
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from llm.gpt_async import aget_structured_text_for_cv, aget_structured_text_for_job, close_http_session
+from llm.gpt_async import astream_structured_text_for_cv, astream_structured_text_for_job
+from llm.gpt import get_structured_text_for_cv, get_structured_text_for_job
+from llm.cache import response_cache
+from llm.documents import astructure_with_dedup, astream_with_dedup, structure_with_dedup
+from llm.jobs import job_queue, job_response, valid_webhook_url, JobWorkers
+from llm.scores import score_store, astored_match, top_matches, track_document
+from llm.matching import amatch_pair, arank_and_score, score_batch, failure_message, BATCH_WORKERS, SCORING_MODE, SCORING_MODES
+from llm.embeddings import embedding_index, SEMANTIC_TOP_N, SEMANTIC_TOP_N_MAX
+from llm.prefilter import PREFILTER_ENABLED
+from llm.resilience import resilience_stats
+from llm.extraction import extraction_stats
+from llm.singleflight import single_flight
+from llm.timing import begin_request, request_tokens, server_timing, token_header, stage
+from llm.scheduler import scheduler, set_priority, ROUTE_PRIORITIES
+from llm.metrics import request_latency, render_metrics, METRICS_CONTENT_TYPE
+
+# Configure logging
+logging.basicConfig(level=logging.DEBUG)  # Set to DEBUG to capture all log levels
+logger = logging.getLogger(__name__)
+logging.disable(logging.CRITICAL)
+
+ASGI_WORKERS = int(os.getenv("ASGI_WORKERS", "4"))
+
+# Async job mode: the job workers are threads running the synchronous pipeline, off the event loop
+def structure_and_track(kind: str, text: str, structure):
+    structured, dedup = structure_with_dedup(kind, text, structure)
+    if structured:
+        track_document(kind, structured)
+    return structured, dedup
+
+JOB_HANDLERS = {
+    "cv": lambda text: structure_and_track("cv", text, get_structured_text_for_cv),
+    "job": lambda text: structure_and_track("job", text, get_structured_text_for_job),
+}
+JOB_RESULT_KEYS = {"cv": "structured_cv", "job": "structured_job"}
+job_workers = JobWorkers(job_queue, JOB_HANDLERS, JOB_RESULT_KEYS) if job_queue else None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if job_workers:
+        job_workers.start()
+    yield
+    if job_workers:
+        job_workers.stop()
+    # Close the pooled OpenAI connections of this worker
+    await close_http_session()
+
+app = FastAPI(lifespan=lifespan)
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+@app.middleware("http")
+async def add_server_timing(request: Request, call_next):
+    # Per-stage durations (parse, serialize, llm, decode) for benchmarks/load_test.py
+    start = time.perf_counter()
+    stages = begin_request()
+    tokens = request_tokens()
+    set_priority(ROUTE_PRIORITIES.get(request.url.path, "normal"))
+    response = await call_next(request)
+    if stages:
+        response.headers["Server-Timing"] = server_timing(stages)
+    if tokens:
+        response.headers["X-LLM-Tokens"] = token_header(tokens)
+    # Streamed responses are timed to their headers
+    elapsed = time.perf_counter() - start
+    endpoint = getattr(request.scope.get("route"), "path", "unmatched")
+    request_latency.observe(elapsed, endpoint=endpoint, status=response.status_code)
+    logger.info("%s %s %s in %.1f ms, stages %s, tokens %s", request.method, endpoint, response.status_code,
+                elapsed * 1000, stages, tokens)
+    return response
+
+async def _json_payload(request: Request):
+    try:
+        with stage("parse"):
+            return await request.json()
+    except ValueError:
+        return None
+
+@app.post("/structure-cv")
+async def structure_cv(request: Request):
+    incoming_json = await _json_payload(request)
+
+    if not incoming_json:
+        logger.error("No JSON payload received.")
+        return JSONResponse({"structured_cv": None, "error": "No data provided."}, status_code=400)
+
+    text_cv = incoming_json.get("text_cv")
+
+    if not text_cv:
+        logger.error("Missing 'text_cv' in request data.")
+        return JSONResponse({"structured_cv": None, "error": "Missing 'text_cv' in request data."}, status_code=400)
+
+    logger.info("Received /structure-cv request.")
+
+    try:
+        structured_text, dedup = await astructure_with_dedup("cv", text_cv, aget_structured_text_for_cv)
+        if not structured_text:
+            logger.error("Failed to structure CV text.")
+            return JSONResponse({"structured_cv": None, "error": "Failed to process CV text."}, status_code=500)
+        await asyncio.to_thread(track_document, "cv", structured_text)
+        logger.info("Structured CV obtained.")
+
+        return JSONResponse({"structured_cv": structured_text, "dedup": dedup}, status_code=200)
+
+    except Exception as e:
+        logger.error("Error in /structure-cv: %s", e)
+        return JSONResponse({"structured_cv": None, "error": str(e)}, status_code=500)
+
+@app.post("/structure-job")
+async def structure_job(request: Request):
+    incoming_json = await _json_payload(request)
+
+    if not incoming_json:
+        logger.error("No JSON payload received.")
+        return JSONResponse({"structured_job": None, "error": "No data provided."}, status_code=400)
+
+    text_job = incoming_json.get("text_job")
+
+    if not text_job:
+        logger.error("Missing 'text_job' in request data.")
+        return JSONResponse({"structured_job": None, "error": "Missing 'text_job' in request data."}, status_code=400)
+
+    logger.info("Received /structure-job request.")
+
+    try:
+        structured_job, dedup = await astructure_with_dedup("job", text_job, aget_structured_text_for_job)
+        if not structured_job:
+            logger.error("Failed to structure job description.")
+            return JSONResponse({"structured_job": None, "error": "Failed to process job description."}, status_code=500)
+        await asyncio.to_thread(track_document, "job", structured_job)
+        logger.info("Structured job description obtained.")
+
+        return JSONResponse({"structured_job": structured_job, "dedup": dedup}, status_code=200)
+
+    except Exception as e:
+        logger.error("Error in /structure-job: %s", e)
+        return JSONResponse({"structured_job": None, "error": str(e)}, status_code=500)
+
+def stream_structure(dedup, sections, kind: str, result_key: str, failure: str) -> StreamingResponse:
+    """NDJSON response: one line per top-level section as soon as it is complete, then the whole document."""
+    async def generate():
+        start = time.perf_counter()
+        structured = {}
+        try:
+            async for key, value in sections:
+                structured[key] = value
+                yield json.dumps({"section": key, "value": value, "elapsed": round(time.perf_counter() - start, 3)}) + "\n"
+        except Exception as e:
+            logger.error("Streaming %s failed after %d sections: %s", kind, len(structured), e)
+            yield json.dumps({"done": True, result_key: None, "error": str(e)}) + "\n"
+            return
+        if not structured:
+            yield json.dumps({"done": True, result_key: None, "error": failure}) + "\n"
+            return
+        await asyncio.to_thread(track_document, kind, structured)
+        yield json.dumps({"done": True, result_key: structured, "dedup": dedup,
+                          "elapsed": round(time.perf_counter() - start, 3)}) + "\n"
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+@app.post("/structure-cv/stream")
+async def structure_cv_stream(request: Request):
+    incoming_json = await _json_payload(request)
+
+    if not incoming_json:
+        logger.error("No JSON payload received.")
+        return JSONResponse({"structured_cv": None, "error": "No data provided."}, status_code=400)
+
+    text_cv = incoming_json.get("text_cv")
+
+    if not text_cv:
+        logger.error("Missing 'text_cv' in request data.")
+        return JSONResponse({"structured_cv": None, "error": "Missing 'text_cv' in request data."}, status_code=400)
+
+    logger.info("Received /structure-cv/stream request.")
+
+    try:
+        dedup, sections = await astream_with_dedup("cv", text_cv, astream_structured_text_for_cv)
+        return stream_structure(dedup, sections, "cv", "structured_cv", "Failed to process CV text.")
+    except Exception as e:
+        logger.error("Error in /structure-cv/stream: %s", e)
+        return JSONResponse({"structured_cv": None, "error": str(e)}, status_code=500)
+
+@app.post("/structure-job/stream")
+async def structure_job_stream(request: Request):
+    incoming_json = await _json_payload(request)
+
+    if not incoming_json:
+        logger.error("No JSON payload received.")
+        return JSONResponse({"structured_job": None, "error": "No data provided."}, status_code=400)
+
+    text_job = incoming_json.get("text_job")
+
+    if not text_job:
+        logger.error("Missing 'text_job' in request data.")
+        return JSONResponse({"structured_job": None, "error": "Missing 'text_job' in request data."}, status_code=400)
+
+    logger.info("Received /structure-job/stream request.")
+
+    try:
+        dedup, sections = await astream_with_dedup("job", text_job, astream_structured_text_for_job)
+        return stream_structure(dedup, sections, "job", "structured_job", "Failed to process job description.")
+    except Exception as e:
+        logger.error("Error in /structure-job/stream: %s", e)
+        return JSONResponse({"structured_job": None, "error": str(e)}, status_code=500)
+
+async def submit_job(request: Request, kind: str, text_key: str):
+    """Queue a structuring job and answer right away with its id; the result comes from /jobs/{job_id}."""
+    result_key = JOB_RESULT_KEYS[kind]
+    if not job_queue:
+        return JSONResponse({result_key: None, "error": "Structuring jobs are disabled."}, status_code=503)
+
+    incoming_json = await _json_payload(request)
+    if not incoming_json:
+        logger.error("No JSON payload received.")
+        return JSONResponse({result_key: None, "error": "No data provided."}, status_code=400)
+    text = incoming_json.get(text_key)
+    if not text:
+        logger.error("Missing '%s' in request data.", text_key)
+        return JSONResponse({result_key: None, "error": f"Missing '{text_key}' in request data."}, status_code=400)
+    webhook_url = incoming_json.get("webhook_url")
+    # Resolves the host, so off the event loop
+    if webhook_url and not await asyncio.to_thread(valid_webhook_url, webhook_url):
+        return JSONResponse({result_key: None, "error": "Invalid 'webhook_url'."}, status_code=400)
+
+    job_id = await asyncio.to_thread(job_queue.submit, kind, text, webhook_url)
+    logger.info("Queued structuring job %s (%s).", job_id, kind)
+    return JSONResponse({"job_id": job_id, "status": "queued", "status_url": f"/jobs/{job_id}"}, status_code=202)
+
+@app.post("/structure-cv/jobs")
+async def queue_cv_structuring(request: Request):
+    return await submit_job(request, "cv", "text_cv")
+
+@app.post("/structure-job/jobs")
+async def queue_job_structuring(request: Request):
+    return await submit_job(request, "job", "text_job")
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    job = await asyncio.to_thread(job_queue.get, job_id) if job_queue else None
+    if not job:
+        return JSONResponse({"job_id": job_id, "error": "Unknown job."}, status_code=404)
+    return JSONResponse(job_response(job, JOB_RESULT_KEYS[job["kind"]]), status_code=200)
+
+@app.post("/match")
+async def match(request: Request):
+    incoming_json = await _json_payload(request)
+
+    if not incoming_json:
+        logger.error("No JSON payload received.")
+        return JSONResponse({"score": None, "error": "No data provided."}, status_code=400)
+
+    structured_job = incoming_json.get("structured_job")
+    structured_cv = incoming_json.get("structured_cv")
+
+    if not structured_job or not structured_cv:
+        logger.error("Missing 'structured_job' or 'structured_cv' in request data.")
+        return JSONResponse({"score": None, "error": "Missing 'structured_job' or 'structured_cv' in request data."}, status_code=400)
+
+    scoring_mode = incoming_json.get("scoring_mode", SCORING_MODE)
+    if scoring_mode not in SCORING_MODES:
+        logger.error("Invalid 'scoring_mode' in request data.")
+        return JSONResponse({"score": None, "error": f"'scoring_mode' must be one of {', '.join(SCORING_MODES)}."}, status_code=400)
+
+    logger.info("Received /match-cv request.")
+
+    try:
+        use_prefilter = bool(incoming_json.get("prefilter", PREFILTER_ENABLED))
+        ascore = lambda: amatch_pair(structured_cv, structured_job, use_prefilter=use_prefilter, mode=scoring_mode)
+        # Pairs already scored with the same documents and prompts come from the score store
+        if incoming_json.get("use_store", True):
+            result = await astored_match(structured_cv, structured_job, scoring_mode, use_prefilter, ascore)
+        else:
+            result = await ascore()
+
+        if result.get("failed_dimensions"):
+            logger.error("Scoring failed for dimensions: %s", result["failed_dimensions"])
+            return JSONResponse({**result, "error": failure_message(result)}, status_code=500)
+
+        # Validate score
+        if not (0 <= result["score"] <= 100):
+            logger.error("Invalid score format received from OpenAI API.")
+            return JSONResponse({"score": None, "error": "Invalid score format received from OpenAI API."}, status_code=500)
+
+        logger.info("Score obtained successfully.")
+
+        return JSONResponse(result, status_code=200)
+
+    except Exception as e:
+        logger.error("Error in /match: %s", e)
+        return JSONResponse({"score": None, "error": str(e)}, status_code=500)
+
+@app.post("/match-batch")
+async def match_batch(request: Request):
+    incoming_json = await _json_payload(request)
+
+    if not incoming_json:
+        logger.error("No JSON payload received.")
+        return JSONResponse({"results": None, "error": "No data provided."}, status_code=400)
+
+    structured_job = incoming_json.get("structured_job")
+    structured_cvs = incoming_json.get("structured_cvs")
+
+    if not structured_job or not structured_cvs or not isinstance(structured_cvs, list):
+        logger.error("Missing 'structured_job' or 'structured_cvs' in request data.")
+        return JSONResponse({"results": None, "error": "Missing 'structured_job' or 'structured_cvs' list in request data."}, status_code=400)
+
+    max_concurrency = incoming_json.get("max_concurrency", BATCH_WORKERS)
+    if not isinstance(max_concurrency, int) or max_concurrency < 1:
+        logger.error("Invalid 'max_concurrency' in request data.")
+        return JSONResponse({"results": None, "error": "'max_concurrency' must be a positive integer."}, status_code=400)
+
+    scoring_mode = incoming_json.get("scoring_mode", SCORING_MODE)
+    if scoring_mode not in SCORING_MODES:
+        logger.error("Invalid 'scoring_mode' in request data.")
+        return JSONResponse({"results": None, "error": f"'scoring_mode' must be one of {', '.join(SCORING_MODES)}."}, status_code=400)
+
+    use_prefilter = bool(incoming_json.get("prefilter", PREFILTER_ENABLED))
+
+    # Only the CVs most similar to the job by embeddings reach the LLM; 0 scores them all
+    semantic_top_n = incoming_json.get("semantic_top_n", SEMANTIC_TOP_N)
+    if not isinstance(semantic_top_n, int) or semantic_top_n < 0:
+        logger.error("Invalid 'semantic_top_n' in request data.")
+        return JSONResponse({"results": None, "error": "'semantic_top_n' must be a non-negative integer."}, status_code=400)
+
+    logger.info("Received /match-batch request for %d CVs.", len(structured_cvs))
+
+    async def generate():
+        # The batch runs on score_batch's worker threads; each result is awaited in a thread in this request's
+        # context, so the workers it starts inherit the "bulk" priority
+        start = time.perf_counter()
+        failed = short_circuited = skipped = 0
+        cancelled = threading.Event()
+        results = score_batch(structured_cvs, structured_job, max_concurrency, use_prefilter, scoring_mode,
+                              semantic_top_n, cancelled)
+        waiting = False
+        try:
+            while True:
+                waiting = True
+                result = await asyncio.to_thread(next, results, None)
+                waiting = False
+                if result is None:
+                    break
+                skipped += bool(result.get("skipped"))
+                failed += result.get("score") is None and not result.get("skipped")
+                short_circuited += bool(result.get("short_circuited"))
+                yield json.dumps(result) + "\n"
+        finally:
+            # The client went away: no further CV is started. A next() still running in its thread cannot be
+            # interrupted; it returns once the CVs in flight are done and the batch ends by itself
+            cancelled.set()
+            if not waiting:
+                results.close()
+        yield json.dumps({"summary": {"count": len(structured_cvs), "failed": failed, "short_circuited": short_circuited,
+                                      "skipped": skipped, "elapsed": round(time.perf_counter() - start, 3)}}) + "\n"
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+@app.post("/rank")
+async def rank(request: Request):
+    # Best CVs for a job among every structured CV seen: one vector query, then LLM scoring of the top N only
+    incoming_json = await _json_payload(request)
+
+    if not incoming_json:
+        logger.error("No JSON payload received.")
+        return JSONResponse({"results": None, "error": "No data provided."}, status_code=400)
+
+    if not embedding_index:
+        return JSONResponse({"results": None, "error": "Semantic ranking is disabled."}, status_code=503)
+
+    structured_job = incoming_json.get("structured_job")
+    if not structured_job or not isinstance(structured_job, dict):
+        logger.error("Missing 'structured_job' in request data.")
+        return JSONResponse({"results": None, "error": "Missing 'structured_job' in request data."}, status_code=400)
+
+    top_n = incoming_json.get("top_n", 10)
+    if not isinstance(top_n, int) or not 1 <= top_n <= SEMANTIC_TOP_N_MAX:
+        logger.error("Invalid 'top_n' in request data.")
+        return JSONResponse({"results": None, "error": f"'top_n' must be an integer between 1 and {SEMANTIC_TOP_N_MAX}."}, status_code=400)
+
+    scoring_mode = incoming_json.get("scoring_mode", SCORING_MODE)
+    if scoring_mode not in SCORING_MODES:
+        logger.error("Invalid 'scoring_mode' in request data.")
+        return JSONResponse({"results": None, "error": f"'scoring_mode' must be one of {', '.join(SCORING_MODES)}."}, status_code=400)
+
+    max_concurrency = incoming_json.get("max_concurrency", BATCH_WORKERS)
+    if not isinstance(max_concurrency, int) or max_concurrency < 1:
+        logger.error("Invalid 'max_concurrency' in request data.")
+        return JSONResponse({"results": None, "error": "'max_concurrency' must be a positive integer."}, status_code=400)
+
+    use_prefilter = bool(incoming_json.get("prefilter", PREFILTER_ENABLED))
+    logger.info("Received /rank request for the top %d CVs.", top_n)
+
+    try:
+        result = await arank_and_score(structured_job, top_n, max_concurrency, use_prefilter, scoring_mode)
+        return JSONResponse(result, status_code=200)
+    except Exception as e:
+        logger.error("Error in /rank: %s", e)
+        return JSONResponse({"results": None, "error": str(e)}, status_code=500)
+
+async def top_k(request: Request, kind: str, doc_id: str):
+    if not score_store:
+        return JSONResponse({"results": None, "error": "The score store is disabled."}, status_code=503)
+    try:
+        k = int(request.query_params.get("k", 10))
+    except ValueError:
+        k = 0
+    if k < 1:
+        return JSONResponse({"results": None, "error": "'k' must be a positive integer."}, status_code=400)
+    scoring_mode = request.query_params.get("scoring_mode", SCORING_MODE)
+    if scoring_mode not in SCORING_MODES:
+        return JSONResponse({"results": None, "error": f"'scoring_mode' must be one of {', '.join(SCORING_MODES)}."}, status_code=400)
+    return JSONResponse(await asyncio.to_thread(top_matches, kind, doc_id, k, scoring_mode), status_code=200)
+
+@app.get("/scores/job/{job_id}/top")
+async def top_cvs_for_job(request: Request, job_id: str):
+    # Best stored CVs for a job, without any LLM call
+    return await top_k(request, "job", job_id)
+
+@app.get("/scores/cv/{cv_id}/top")
+async def top_jobs_for_cv(request: Request, cv_id: str):
+    # Best stored jobs for a CV, without any LLM call
+    return await top_k(request, "cv", cv_id)
+
+@app.get("/cache-stats")
+async def cache_stats():
+    if not response_cache:
+        return JSONResponse({"enabled": False}, status_code=200)
+    return JSONResponse({"enabled": True, **await asyncio.to_thread(response_cache.stats)}, status_code=200)
+
+@app.get("/llm-stats")
+async def llm_stats():
+    # Retry, hedge and circuit breaker counters of the OpenAI client, collapsed calls, rate-limit queue, and how answers were parsed
+    # (per worker process, like /metrics)
+    return JSONResponse({**resilience_stats(), "single_flight": single_flight.stats(), "scheduler": scheduler.stats(),
+                         "extraction": extraction_stats()}, status_code=200)
+
+@app.get("/metrics")
+async def metrics():
+    # Request/stage latency histograms and token counters, for Prometheus to scrape
+    # (per worker process: scrape every worker, or run with --workers 1)
+    return PlainTextResponse(render_metrics(), media_type=METRICS_CONTENT_TYPE)
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run("asgi:app", host="0.0.0.0", port=5000, workers=ASGI_WORKERS)
@@ -0,0 +1,363 @@
+# llm_stub.py
+# Local stand-in for the LLM upstreams, for offline load testing. Standard library only.
+# Speaks the OpenAI chat/embeddings API and the Ollama generate/embeddings API:
+#
+#   python -m benchmarks.llm_stub --port 8089 --latency-ms 800 --error-rate 0.02
+#
+#   ai-processing:      LLM_API_BASE=http://localhost:8089/v1
+#   nlp_faq_assistant:  OPENAI_BASE_URL=http://localhost:8089/v1 OLLAMA_HOST=localhost OLLAMA_PORT=8089 OLLAMA_MODEL=stub
+#
+# Modes: "synthesize" answers every call with schema-valid JSON derived from the prompt (default),
+# "record" forwards to the real upstream and saves the answers, "replay" serves the saved answers by
+# request hash and synthesizes the ones it has not seen.
+
+import os
+import re
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+import urllib.request
+import urllib.error
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STUB_MODES = ("synthesize", "record", "replay")
+STUB_UPSTREAM = os.getenv("STUB_UPSTREAM", "https://api.openai.com")   # Where "record" forwards OpenAI calls
+STUB_UPSTREAM_KEY = os.getenv("STUB_UPSTREAM_KEY", "")                  # Used when the client sends no Authorization
+STUB_EMBEDDING_DIM = int(os.getenv("STUB_EMBEDDING_DIM", "256"))
+STREAM_FIRST_TOKEN_SHARE = 0.1  # Part of a streamed call's latency spent before the first chunk
+STREAM_CHUNK_CHARS = 16         # Characters per streamed chunk, roughly four tokens
+
+########################## RECORDINGS ####################################
+
+def request_key(path: str, body: dict) -> str:
+    """Hash of everything that determines the answer; streaming flags and client options are left out."""
+    relevant = {key: body.get(key) for key in ("model", "messages", "input", "prompt", "temperature", "max_tokens")}
+    return hashlib.sha256(json.dumps([path, relevant], sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class Recordings:
+    """Recorded upstream answers, one JSON line per request: {"key", "path", "status", "response"}."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._answers = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._answers[entry["key"]] = entry
+
+    def get(self, key: str):
+        return self._answers.get(key)
+
+    def add(self, key: str, path: str, status: int, response: dict):
+        entry = {"key": key, "path": path, "status": status, "response": response}
+        with self._lock:
+            self._answers[key] = entry
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def __len__(self):
+        return len(self._answers)
+
+########################## SYNTHESIS #####################################
+
+def _document_id(text: str, default: str):
+    match = re.search(r'"id"\s*:\s*"([^"]*)"', text) or re.search(r"^\s*id:\s*(\S+)", text)
+    return match.group(1) if match else default
+
+def _score_ids(messages: list):
+    user = [message["content"] for message in messages if message["role"] == "user"]
+    job = next((text for text in user if text.startswith("The job is:")), "")
+    cv = next((text for text in user if text.startswith("The CV is:")), "")
+    return _document_id(job, "job"), _document_id(cv, "cv")
+
+def _words(text: str, rng: random.Random, count: int) -> str:
+    vocabulary = re.findall(r"[A-Za-z]{4,}", text) or ["lorem", "ipsum", "dolor", "amet"]
+    return " ".join(rng.choice(vocabulary) for _ in range(count))
+
+def synthesize_chat(messages: list, rng: random.Random) -> str:
+    """Answer in the output format the system prompt asks for, so the caller's parsing and validation run."""
+    system = next((message["content"] for message in messages if message["role"] == "system"), "")
+    user = "\n".join(message["content"] for message in messages if message["role"] == "user")
+
+    if "Combined Output Format" in system:
+        job_id, cv_id = _score_ids(messages)
+        answer = {"job_id": job_id, "cv_id": cv_id}
+        for dimension in ("domain", "tehnical", "general"):
+            answer[dimension] = {"score": rng.randint(0, 100), "reasoning": _words(user, rng, 30)}
+    elif '"score": number' in system:
+        job_id, cv_id = _score_ids(messages)
+        answer = {"job_id": job_id, "cv_id": cv_id, "score": rng.randint(0, 100), "reasoning": _words(user, rng, 30)}
+    elif '"first_name"' in system:
+        answer = {
+            "id": _document_id(user, "cv"),
+            "first_name": "Stub", "last_name": "Candidate",
+            "technical_skills": [{"name": word, "strength": rng.randint(1, 10)} for word in _words(user, rng, 6).split()],
+            "soft_skills": _words(user, rng, 3).split(),
+            "education": [{"name": _words(user, rng, 4), "duration": rng.choice([2.0, 3.0, 4.0])}],
+            "work_experience": [{"function": _words(user, rng, 3), "duration": round(rng.uniform(0.5, 8), 1)}
+                                for _ in range(rng.randint(1, 3))],
+            "projects": [_words(user, rng, 8)],
+            "contests": [], "certifications": [], "volunteering": [],
+            "foreign_languages": ["English C1"],
+        }
+    elif "'job_title'" in system:
+        answer = {
+            "id": _document_id(user, "job"),
+            "job_title": _words(user, rng, 3),
+            "company_overview": _words(user, rng, 20),
+            "key_responsibilities": [_words(user, rng, 8) for _ in range(3)],
+            "required_qualifications": [_words(user, rng, 6) for _ in range(3)],
+            "preferred_skills": _words(user, rng, 4).split(),
+            "benefits": [_words(user, rng, 4)],
+        }
+    else:
+        # Free-text assistants (the FAQ service)
+        return _words(user, rng, 40)
+    return json.dumps(answer)
+
+def synthesize_embedding(text: str) -> list:
+    """Hashed bag of words, L2-normalized: texts sharing words get close vectors, like a real model."""
+    vector = [0.0] * STUB_EMBEDDING_DIM
+    for word in re.findall(r"\w+", text.lower()):
+        digest = hashlib.md5(word.encode("utf-8")).digest()
+        vector[int.from_bytes(digest[:4], "little") % STUB_EMBEDDING_DIM] += 1.0 if digest[4] & 1 else -1.0
+    norm = sum(value * value for value in vector) ** 0.5 or 1.0
+    return [value / norm for value in vector]
+
+def _usage(prompt: str, completion: str) -> dict:
+    prompt_tokens, completion_tokens = (len(prompt) + 3) // 4, (len(completion) + 3) // 4
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens}
+
+def chat_completion(body: dict, rng: random.Random) -> dict:
+    content = synthesize_chat(body.get("messages", []), rng)
+    prompt = "".join(message.get("content", "") for message in body.get("messages", []))
+    return {
+        "id": f"chatcmpl-stub-{rng.getrandbits(48):012x}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "stub"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": _usage(prompt, content),
+    }
+
+def embeddings(body: dict) -> dict:
+    inputs = body.get("input", [])
+    inputs = [inputs] if isinstance(inputs, str) else inputs
+    return {
+        "object": "list",
+        "model": body.get("model", "stub"),
+        "data": [{"object": "embedding", "index": index, "embedding": synthesize_embedding(str(text))}
+                 for index, text in enumerate(inputs)],
+        "usage": _usage("".join(map(str, inputs)), ""),
+    }
+
+########################## SERVER ########################################
+
+class StubConfig:
+    def __init__(self, mode="synthesize", latency_ms=0.0, latency_sigma=0.5, tail_rate=0.0, tail_ms=30000.0,
+                 error_rate=0.0, error_statuses=(429, 500, 503), recordings=None, seed=None):
+        self.mode = mode
+        self.latency_ms = latency_ms           # Median latency of a call
+        self.latency_sigma = latency_sigma     # Spread of the log-normal latency distribution
+        self.tail_rate = tail_rate             # Share of calls that get stuck for tail_ms
+        self.tail_ms = tail_ms
+        self.error_rate = error_rate           # Share of calls answered with one of error_statuses
+        self.error_statuses = error_statuses
+        self.recordings = recordings
+        self.seed = seed                       # Fixed seed: the same request always gets the same synthesized answer
+        self.stats = {"requests": 0, "errors": 0, "replayed": 0, "recorded": 0, "synthesized": 0}
+        self.lock = threading.Lock()
+
+    def count(self, name: str):
+        with self.lock:
+            self.stats[name] += 1
+
+    def latency(self) -> float:
+        if random.random() < self.tail_rate:
+            return self.tail_ms / 1000
+        if self.latency_ms <= 0:
+            return 0.0
+        return random.lognormvariate(0, self.latency_sigma) * self.latency_ms / 1000
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the real APIs
+    disable_nagle_algorithm = True # Headers and body are separate writes; Nagle would add ~40ms per call
+    config: StubConfig = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: dict):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_ndjson(self, lines: list):
+        data = "".join(json.dumps(line) + "\n" for line in lines).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_chat_stream(self, completion: dict, latency: float):
+        """Send a chat completion as server-sent events, spreading the rest of `latency` over the chunks."""
+        content = completion["choices"][0]["message"]["content"]
+        pieces = [content[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(content), STREAM_CHUNK_CHARS)] or [""]
+        delay = latency * (1 - STREAM_FIRST_TOKEN_SHARE) / len(pieces)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def send(data: str):
+            event = f"data: {data}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(event):x}\r\n".encode("ascii") + event + b"\r\n")
+
+        base = {"id": completion["id"], "object": "chat.completion.chunk", "created": completion["created"],
+                "model": completion["model"]}
+        for index, piece in enumerate(pieces):
+            delta = {"role": "assistant", "content": piece} if index == 0 else {"content": piece}
+            send(json.dumps({**base, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}))
+            time.sleep(delay)
+        send(json.dumps({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}))
+        send("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/v1/models":
+            # What clients use to check a key without paying for a completion
+            return self._send_json(200, {"object": "list", "data": [{"id": "stub", "object": "model"}]})
+        if self.path.rstrip("/") == "/stats":
+            with self.config.lock:
+                stats = dict(self.config.stats)
+            return self._send_json(200, {**stats, "mode": self.config.mode,
+                                         "recordings": len(self.config.recordings or ())})
+        self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def do_POST(self):
+        config = self.config
+        config.count("requests")
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            return self._send_json(400, {"error": {"message": "Body is not valid JSON."}})
+        path = self.path.rstrip("/")
+        key = request_key(path, body)
+
+        if config.mode == "record" and path.startswith("/v1/"):
+            return self._record(path, key, body)
+
+        latency = config.latency()
+        streaming = path == "/v1/chat/completions" and body.get("stream")
+        # A streamed answer starts early and spends the rest of its latency generating
+        time.sleep(latency * STREAM_FIRST_TOKEN_SHARE if streaming else latency)
+        if random.random() < config.error_rate:
+            config.count("errors")
+            status = random.choice(config.error_statuses)
+            return self._send_json(status, {"error": {"message": f"Injected stub error {status}.", "type": "stub_error"}})
+
+        recorded = config.recordings.get(key) if config.recordings is not None and config.mode == "replay" else None
+        if recorded:
+            config.count("replayed")
+            if streaming and recorded["status"] == 200:
+                return self._send_chat_stream(recorded["response"], latency)
+            return self._send_json(recorded["status"], recorded["response"])
+
+        config.count("synthesized")
+        rng = random.Random(f"{config.seed}:{key}") if config.seed is not None else random.Random()
+        if streaming:
+            return self._send_chat_stream(chat_completion(body, rng), latency)
+        if path == "/v1/chat/completions":
+            return self._send_json(200, chat_completion(body, rng))
+        if path == "/v1/embeddings":
+            return self._send_json(200, embeddings(body))
+        if path == "/api/embeddings":
+            return self._send_json(200, {"embedding": synthesize_embedding(str(body.get("prompt", "")))})
+        if path == "/api/generate":
+            text = synthesize_chat([{"role": "user", "content": str(body.get("prompt", ""))}], rng)
+            done = {"model": body.get("model", "stub"), "response": "", "done": True}
+            if body.get("stream", True):
+                return self._send_ndjson([{"model": body.get("model", "stub"), "response": text, "done": False}, done])
+            return self._send_json(200, {**done, "response": text})
+        self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def _record(self, path: str, key: str, body: dict):
+        config = self.config
+        # Recorded non-streamed, so one recording serves both kinds of replay
+        request = urllib.request.Request(
+            STUB_UPSTREAM.rstrip("/") + path,
+            data=json.dumps({**body, "stream": False}).encode("utf-8"),
+            headers={"Content-Type": "application/json",
+                     "Authorization": self.headers.get("Authorization") or f"Bearer {STUB_UPSTREAM_KEY}"},
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=120) as upstream:
+                status, response = upstream.status, json.loads(upstream.read())
+        except urllib.error.HTTPError as e:
+            # Upstream errors are passed through but not recorded
+            return self._send_json(e.code, json.loads(e.read() or b"{}"))
+        except (urllib.error.URLError, TimeoutError) as e:
+            return self._send_json(502, {"error": {"message": f"Upstream unreachable: {e}"}})
+        config.recordings.add(key, path, status, response)
+        config.count("recorded")
+        if body.get("stream") and path == "/v1/chat/completions":
+            return self._send_chat_stream(response, 0.0)
+        self._send_json(status, response)
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Load tests open hundreds of connections at once; the default listen backlog is 5
+    request_queue_size = 1024
+
+
+def make_server(host: str, port: int, config: StubConfig) -> StubServer:
+    handler = type("ConfiguredStubHandler", (StubHandler,), {"config": config})
+    return StubServer((host, port), handler)
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenAI/Ollama-compatible stand-in server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--mode", choices=STUB_MODES, default="synthesize")
+    parser.add_argument("--recordings", default="./cache/llm_recordings.jsonl", help="JSON lines file for record/replay")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Median latency of a call")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="Spread of the log-normal latency")
+    parser.add_argument("--tail-rate", type=float, default=0.0, help="Share of calls that get stuck")
+    parser.add_argument("--tail-ms", type=float, default=30000.0, help="How long a stuck call takes")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of calls answered with an error")
+    parser.add_argument("--error-statuses", default="429,500,503", help="Comma-separated statuses for injected errors")
+    parser.add_argument("--seed", type=int, help="Make synthesized answers deterministic per request")
+    args = parser.parse_args()
+
+    recordings = None
+    if args.mode != "synthesize":
+        os.makedirs(os.path.dirname(args.recordings) or ".", exist_ok=True)
+        recordings = Recordings(args.recordings)
+    config = StubConfig(args.mode, args.latency_ms, args.latency_sigma, args.tail_rate, args.tail_ms, args.error_rate,
+                        tuple(int(status) for status in args.error_statuses.split(",")), recordings, args.seed)
+    server = make_server(args.host, args.port, config)
+    print(f"LLM stub ({args.mode}) listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
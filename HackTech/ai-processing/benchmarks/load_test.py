@@ -0,0 +1,343 @@
+# load_test.py
+# Load and latency benchmark for /structure-cv, /structure-job and /match against the local LLM stand-in
+# (benchmarks/llm_stub.py), so it runs offline and costs nothing. Starts the stub and the service itself,
+# drives each endpoint at a fixed concurrency and writes the results as JSON for comparison across versions:
+#
+#   python -m benchmarks.load_test --server flask --concurrency 32 --duration 30 --output results.json
+#   python -m benchmarks.load_test --server asgi --workers 4 --llm-latency-ms 1500 --compare results.json
+#   python -m benchmarks.load_test --target http://localhost:5000     # an already running service (no CPU/memory)
+#   python -m benchmarks.load_test --endpoints structure-cv,structure-cv/stream   # time to first section vs full answer
+#
+# Per-stage times (parse, serialize, llm, decode) come from the Server-Timing header of every response.
+
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import tempfile
+import platform
+import argparse
+import threading
+import subprocess
+import http.client
+from urllib.parse import urlparse
+from benchmarks.llm_stub import StubConfig, make_server
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLES_DIR = os.path.join(os.path.dirname(__file__), "samples")
+ENDPOINTS = ("structure-cv", "structure-job", "match")
+
+########################## CORPUS ########################################
+
+def cv_text(structured_cv: dict, variant: int) -> str:
+    """Plain-text CV rendered from a structured sample; `variant` keeps every request distinct."""
+    lines = [f"id:bench-{variant}-{structured_cv.get('id')}",
+             f"{structured_cv.get('first_name', '')} {structured_cv.get('last_name', '')}", "", "EXPERIENCE"]
+    lines += [f"- {item['function']} ({item['duration']} years)" for item in structured_cv.get("work_experience", [])]
+    lines += ["", "SKILLS", ", ".join(skill["name"] for skill in structured_cv.get("technical_skills", []))]
+    lines += ["", "EDUCATION"] + [f"- {item['name']}" for item in structured_cv.get("education", [])]
+    lines += ["", "PROJECTS"] + [f"- {project}" for project in structured_cv.get("projects", [])]
+    lines += ["", "LANGUAGES", ", ".join(structured_cv.get("foreign_languages", []))]
+    return "\n".join(lines)
+
+def job_text(structured_job: dict, variant: int) -> str:
+    lines = [f"id:bench-{variant}-{structured_job.get('id')}", structured_job.get("job_title", ""), "",
+             structured_job.get("company_overview", ""), "", "Responsibilities:"]
+    lines += [f"- {item}" for item in structured_job.get("key_responsibilities", [])]
+    lines += ["", "Requirements:"] + [f"- {item}" for item in structured_job.get("required_qualifications", [])]
+    lines += ["", "Nice to have:"] + [f"- {item}" for item in structured_job.get("preferred_skills", [])]
+    return "\n".join(lines)
+
+def load_samples():
+    with open(os.path.join(SAMPLES_DIR, "structured_cvs.json")) as f:
+        structured_cvs = json.load(f)
+    with open(os.path.join(SAMPLES_DIR, "structured_job.json")) as f:
+        structured_job = json.load(f)
+    return structured_cvs, structured_job
+
+def request_body(endpoint: str, variant: int, structured_cvs: list, structured_job: dict) -> dict:
+    structured_cv = structured_cvs[variant % len(structured_cvs)]
+    endpoint = endpoint.split("/")[0]  # The /stream variants take the same body
+    if endpoint == "structure-cv":
+        return {"text_cv": cv_text(structured_cv, variant)}
+    if endpoint == "structure-job":
+        return {"text_job": job_text(structured_job, variant)}
+    return {"structured_cv": {**structured_cv, "id": f"bench-{variant}-{structured_cv.get('id')}"},
+            "structured_job": structured_job}
+
+########################## PROCESSES #####################################
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def wait_until_listening(port: int, timeout: float = 60.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Service did not start listening on port {port} within {timeout}s.")
+
+def start_service(server: str, port: int, workers: int, llm_url: str, shortcuts: bool, state_dir: str) -> subprocess.Popen:
+    # Every SQLite store lives in `state_dir`: the bench-* documents never reach the service's own ./cache
+    env = {**os.environ, "LLM_API_BASE": llm_url,
+           "LLM_CACHE_PATH": os.path.join(state_dir, "llm_cache.sqlite3"),
+           "DOCUMENT_STORE_PATH": os.path.join(state_dir, "documents.sqlite3"),
+           "SCORE_STORE_PATH": os.path.join(state_dir, "scores.sqlite3"),
+           "EMBEDDING_INDEX_PATH": os.path.join(state_dir, "embeddings.sqlite3"),
+           "JOB_STORE_PATH": os.path.join(state_dir, "jobs.sqlite3")}
+    if not shortcuts:
+        # Every request takes the full path to the LLM, without store writes on the measured path
+        env.update(LLM_CACHE_ENABLED="0", DOCUMENT_STORE_ENABLED="0", PREFILTER_ENABLED="0",
+                   SCORE_STORE_ENABLED="0", SEMANTIC_RANKING_ENABLED="0")
+    if server == "flask":
+        command = [sys.executable, "-c", f"from main import app; app.run(host='127.0.0.1', port={port}, threaded=True)"]
+    else:
+        command = [sys.executable, "-m", "uvicorn", "asgi:app", "--host", "127.0.0.1", "--port", str(port),
+                   "--workers", str(workers), "--log-level", "warning"]
+    return subprocess.Popen(command, cwd=SERVICE_DIR, env=env)
+
+########################## RESOURCES #####################################
+
+def _process_tree(root: int) -> list:
+    children = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+                children.setdefault(ppid, []).append(int(entry))
+            except (OSError, IndexError, ValueError):
+                continue
+    tree, stack = [], [root]
+    while stack:
+        pid = stack.pop()
+        tree.append(pid)
+        stack.extend(children.get(pid, []))
+    return tree
+
+def _cpu_seconds(pid: int) -> float:
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")  # utime + stime
+
+def _rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+class ResourceSampler(threading.Thread):
+    """CPU and peak memory of every process of the service (master and workers), read from /proc."""
+
+    def __init__(self, root_pid: int, interval: float = 0.5):
+        super().__init__(daemon=True)
+        self.root_pid = root_pid
+        self.interval = interval
+        self.samples = {}
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.is_set():
+            self.sample()
+            self._done.wait(self.interval)
+
+    def sample(self):
+        now = time.perf_counter()
+        for pid in _process_tree(self.root_pid):
+            try:
+                cpu, rss = _cpu_seconds(pid), _rss_mb(pid)
+            except OSError:
+                continue
+            entry = self.samples.setdefault(pid, {"first": (now, cpu), "last": (now, cpu), "rss_peak": 0.0})
+            entry["last"] = (now, cpu)
+            entry["rss_peak"] = max(entry["rss_peak"], rss)
+
+    def stop(self) -> list:
+        self._done.set()
+        self.join()
+        self.sample()
+        workers = []
+        for pid, entry in self.samples.items():
+            (start, cpu_start), (end, cpu_end) = entry["first"], entry["last"]
+            workers.append({"pid": pid,
+                            "cpu_percent": round(100 * (cpu_end - cpu_start) / (end - start), 1) if end > start else 0.0,
+                            "cpu_seconds": round(cpu_end - cpu_start, 3),
+                            "rss_peak_mb": round(entry["rss_peak"], 1)})
+        return workers
+
+########################## LOAD ##########################################
+
+def parse_server_timing(header: str) -> dict:
+    stages = {}
+    for part in filter(None, (part.strip() for part in (header or "").split(","))):
+        name, _, duration = part.partition(";dur=")
+        try:
+            stages[name] = float(duration)
+        except ValueError:
+            continue
+    return stages
+
+def percentile(values: list, p: float):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))], 2)
+
+def run_phase(target: str, endpoint: str, concurrency: int, duration: float, structured_cvs: list,
+              structured_job: dict) -> dict:
+    """Closed loop: `concurrency` clients each send their next request as soon as the previous one returns."""
+    url = urlparse(target)
+    results, lock = [], threading.Lock()
+    counter = iter(range(10 ** 9))
+    deadline = time.perf_counter() + duration
+
+    def client():
+        connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=300)
+        while time.perf_counter() < deadline:
+            body = json.dumps(request_body(endpoint, next(counter), structured_cvs, structured_job))
+            start = time.perf_counter()
+            try:
+                connection.request("POST", f"/{endpoint}", body=body, headers={"Content-Type": "application/json"})
+                response = connection.getresponse()
+                # First line of the body: the first section of a streamed answer
+                response.readline()
+                first_byte_ms = (time.perf_counter() - start) * 1000
+                response.read()
+                status, timing = response.status, response.getheader("Server-Timing")
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                status, timing, first_byte_ms = None, None, None
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            with lock:
+                results.append((status, elapsed_ms, parse_server_timing(timing), first_byte_ms))
+        connection.close()
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    latencies = [elapsed for status, elapsed, _, _ in results if status == 200]
+    first_bytes = [first_byte for status, _, _, first_byte in results if status == 200]
+    stage_names = sorted({name for _, _, stages, _ in results for name in stages})
+    return {
+        "requests": len(results),
+        "errors": sum(1 for status, _, _, _ in results if status != 200),
+        "rps": round(len(latencies) / wall, 2),
+        "latency_ms": {"p50": percentile(latencies, 50), "p95": percentile(latencies, 95),
+                       "p99": percentile(latencies, 99), "max": percentile(latencies, 100),
+                       "mean": round(sum(latencies) / len(latencies), 2) if latencies else None},
+        "first_byte_ms": {"p50": percentile(first_bytes, 50), "p95": percentile(first_bytes, 95)},
+        # Stage times of overlapping calls add up, e.g. the three concurrent scoring calls of one /match
+        "stages_ms": {name: {"mean": round(sum(values) / len(values), 3), "p95": percentile(values, 95)}
+                      for name in stage_names
+                      for values in [[stages[name] for status, _, stages, _ in results if status == 200 and name in stages]]
+                      if values},
+    }
+
+########################## REPORT ########################################
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=SERVICE_DIR, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def print_report(report: dict, baseline: dict = None):
+    for endpoint, phase in report["phases"].items():
+        latency = phase["latency_ms"]
+        print(f"/{endpoint}: {phase['requests']} requests, {phase['errors']} errors, {phase['rps']} req/s, "
+              f"p50 {latency['p50']} ms, p95 {latency['p95']} ms, p99 {latency['p99']} ms, "
+              f"first byte p50 {phase['first_byte_ms']['p50']} ms")
+        print("    stages: " + ", ".join(f"{name} {stats['mean']} ms" for name, stats in phase["stages_ms"].items()))
+        previous = (baseline or {}).get("phases", {}).get(endpoint)
+        if previous:
+            deltas = []
+            for key in ("p50", "p95", "p99"):
+                before, after = previous["latency_ms"].get(key), latency.get(key)
+                if before and after is not None:
+                    deltas.append(f"{key} {100 * (after - before) / before:+.1f}%")
+            if previous.get("rps"):
+                deltas.append(f"rps {100 * (phase['rps'] - previous['rps']) / previous['rps']:+.1f}%")
+            print(f"    vs {baseline['meta'].get('git_commit')}: " + ", ".join(deltas))
+    for worker in report.get("workers", []):
+        print(f"pid {worker['pid']}: {worker['cpu_percent']}% CPU, {worker['rss_peak_mb']} MB peak RSS")
+
+def main():
+    parser = argparse.ArgumentParser(description="Load and latency benchmark for the ai-processing endpoints.")
+    parser.add_argument("--server", choices=("flask", "asgi"), default="flask", help="Service to start")
+    parser.add_argument("--workers", type=int, default=1, help="ASGI worker processes")
+    parser.add_argument("--target", help="Benchmark an already running service at this URL instead")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS), help="Comma-separated endpoints to drive")
+    parser.add_argument("--concurrency", type=int, default=16, help="Simultaneous clients")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds per endpoint")
+    parser.add_argument("--llm-latency-ms", type=float, default=800.0, help="Median latency of the stub LLM")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="Share of stub LLM calls that fail")
+    parser.add_argument("--shortcuts", action="store_true",
+                        help="Keep the response cache, document dedup, pre-filter, score store and semantic ranking on")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--compare", help="Earlier --output file to compare against")
+    args = parser.parse_args()
+
+    structured_cvs, structured_job = load_samples()
+    service, sampler, stub, state_dir = None, None, None, None
+    target = args.target
+    if not target:
+        state_dir = tempfile.mkdtemp(prefix="load-test-")
+        stub = make_server("127.0.0.1", free_port(), StubConfig(latency_ms=args.llm_latency_ms,
+                                                               error_rate=args.llm_error_rate))
+        threading.Thread(target=stub.serve_forever, daemon=True).start()
+        port = free_port()
+        service = start_service(args.server, port, args.workers,
+                                f"http://127.0.0.1:{stub.server_address[1]}/v1", args.shortcuts, state_dir)
+        wait_until_listening(port)
+        target = f"http://127.0.0.1:{port}"
+        sampler = ResourceSampler(service.pid)
+        sampler.start()
+
+    report = {
+        "meta": {"git_commit": git_commit(), "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                 "python": platform.python_version(), "cpus": os.cpu_count(), "target": target,
+                 **{key: value for key, value in vars(args).items() if key not in ("output", "compare")}},
+        "phases": {},
+    }
+    try:
+        for endpoint in args.endpoints.split(","):
+            report["phases"][endpoint] = run_phase(target, endpoint, args.concurrency, args.duration,
+                                                   structured_cvs, structured_job)
+    finally:
+        if sampler:
+            report["workers"] = sampler.stop()
+        if service:
+            service.terminate()
+            service.wait(timeout=30)
+        if state_dir:
+            shutil.rmtree(state_dir, ignore_errors=True)
+        if stub:
+            report["llm_stub"] = dict(stub.RequestHandlerClass.config.stats)
+            stub.shutdown()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+
+if __name__ == "__main__":
+    main()
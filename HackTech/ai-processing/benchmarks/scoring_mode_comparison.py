@@ -0,0 +1,74 @@
+# scoring_mode_comparison.py
+# Scores the sample CVs against the sample job in both scoring modes and reports latency, token usage
+# and how far the combined scores drift from the three-call ones. Calls the OpenAI API (needs API_KEY,
+# or LLM_API_BASE pointing at benchmarks/llm_stub.py).
+#
+#   python -m benchmarks.scoring_mode_comparison --runs 3 --output comparison.json
+
+import os
+# Every run must reach the API, not the response cache
+os.environ.setdefault("LLM_CACHE_ENABLED", "0")
+
+import json
+import argparse
+import statistics
+from llm.matching import match_pair, SCORE_DIMENSIONS
+from llm.timing import begin_request, request_tokens
+
+SAMPLES_DIR = os.path.join(os.path.dirname(__file__), "samples")
+
+
+def scored_match(structured_cv, structured_job, mode):
+    # The usage blocks of the API responses, summed over every call of the match
+    begin_request()
+    result = match_pair(structured_cv, structured_job, use_prefilter=False, mode=mode)
+    return result, dict(request_tokens())
+
+def run_mode(structured_cv, structured_job, mode, runs):
+    matches = [scored_match(structured_cv, structured_job, mode) for _ in range(runs)]
+    results = [result for result, _ in matches]
+    ok = [result for result in results if result.get("score") is not None]
+    tokens = [used for result, used in matches if result.get("score") is not None]
+    return {
+        "latency_s": round(statistics.median(result["timings"]["total"] for result in results), 3),
+        "prompt_tokens": round(statistics.mean(used.get("prompt", 0) for used in tokens)) if tokens else None,
+        "completion_tokens": round(statistics.mean(used.get("completion", 0) for used in tokens)) if tokens else None,
+        "failures": len(results) - len(ok),
+        "scores": {key: statistics.mean(result[key] for result in ok) if ok else None
+                   for key in ["score"] + [f"{dimension}_score" for dimension in SCORE_DIMENSIONS]},
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the combined and the three-call scoring modes.")
+    parser.add_argument("--runs", type=int, default=1, help="Matches per CV and mode")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    with open(os.path.join(SAMPLES_DIR, "structured_cvs.json")) as f:
+        structured_cvs = json.load(f)
+    with open(os.path.join(SAMPLES_DIR, "structured_job.json")) as f:
+        structured_job = json.load(f)
+
+    rows = []
+    for structured_cv in structured_cvs:
+        separate = run_mode(structured_cv, structured_job, "separate", args.runs)
+        combined = run_mode(structured_cv, structured_job, "combined", args.runs)
+        drift = {key: (None if separate["scores"][key] is None or combined["scores"][key] is None
+                       else round(combined["scores"][key] - separate["scores"][key], 2))
+                 for key in separate["scores"]}
+        row = {"cv_id": structured_cv.get("id"), "separate": separate, "combined": combined, "drift": drift}
+        rows.append(row)
+        print(json.dumps(row))
+
+    drifts = [abs(row["drift"]["score"]) for row in rows if row["drift"]["score"] is not None]
+    if drifts:
+        print(f"Mean absolute drift of the final score: {statistics.mean(drifts):.2f} points")
+    print(f"Median latency: separate {statistics.median(row['separate']['latency_s'] for row in rows):.2f}s, "
+          f"combined {statistics.median(row['combined']['latency_s'] for row in rows):.2f}s")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(rows, f, indent=4)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# serialization_benchmark.py
+# Compares the verbatim json.dumps() payloads with the compact ones sent by llm/serialization.py.
+#
+#   python -m benchmarks.serialization_benchmark              # token counts and serialization time
+#   python -m benchmarks.serialization_benchmark --live 3     # plus end-to-end OpenAI latency (needs API_KEY or LLM_API_BASE)
+
+import os
+import json
+import time
+import argparse
+import statistics
+from llm.prompts import domain_1, tehnical_skills_2, general_match_prompt_3
+from llm.serialization import compact, count_tokens
+
+SAMPLES_DIR = os.path.join(os.path.dirname(__file__), "samples")
+PROMPTS = {"domain": domain_1, "tehnical": tehnical_skills_2, "general": general_match_prompt_3}
+
+
+def verbatim_payload(structured_cv, structured_job):
+    return f"The CV is: {json.dumps(structured_cv)}. The job is: {json.dumps(structured_job)}"
+
+def compact_payload(structured_cv, structured_job):
+    cv = json.dumps(compact(structured_cv), separators=(",", ":"), ensure_ascii=False)
+    job = json.dumps(compact(structured_job), separators=(",", ":"), ensure_ascii=False)
+    return f"The CV is: {cv}. The job is: {job}"
+
+def timed(fn, *args, repeat=200):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn(*args)
+    return result, (time.perf_counter() - start) / repeat * 1000
+
+def live_latency(payload, prompt, runs):
+    # Imported here: llm.gpt needs API_KEY or LLM_API_BASE at import time
+    from llm.gpt import fetch_openai_response
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fetch_openai_response([{"role": "system", "content": prompt}, {"role": "user", "content": payload}], use_cache=False)
+        latencies.append(time.perf_counter() - start)
+    return statistics.median(latencies)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare verbatim and compact LLM payloads.")
+    parser.add_argument("--live", type=int, default=0, help="OpenAI calls per variant and prompt (0 = skip)")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    with open(os.path.join(SAMPLES_DIR, "structured_cvs.json")) as f:
+        structured_cvs = json.load(f)
+    with open(os.path.join(SAMPLES_DIR, "structured_job.json")) as f:
+        structured_job = json.load(f)
+
+    results = []
+    for structured_cv in structured_cvs:
+        before, before_ms = timed(verbatim_payload, structured_cv, structured_job)
+        after, after_ms = timed(compact_payload, structured_cv, structured_job)
+        row = {
+            "cv_id": structured_cv.get("id"),
+            "tokens_before": count_tokens(before),
+            "tokens_after": count_tokens(after),
+            "serialize_ms_before": round(before_ms, 4),
+            "serialize_ms_after": round(after_ms, 4),
+        }
+        row["tokens_saved_per_match"] = (row["tokens_before"] - row["tokens_after"]) * len(PROMPTS)
+        if args.live:
+            row["latency_s_before"] = {name: round(live_latency(before, prompt, args.live), 3) for name, prompt in PROMPTS.items()}
+            row["latency_s_after"] = {name: round(live_latency(after, prompt, args.live), 3) for name, prompt in PROMPTS.items()}
+        results.append(row)
+        print(json.dumps(row))
+
+    total_before = sum(row["tokens_before"] for row in results)
+    total_after = sum(row["tokens_after"] for row in results)
+    print(f"User-message tokens: {total_before} -> {total_after} "
+          f"({100 * (total_before - total_after) / total_before:.1f}% fewer)")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+
+if __name__ == "__main__":
+    main()
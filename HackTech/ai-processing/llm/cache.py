@@ -0,0 +1,165 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+# Configure logging for this module
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "./cache/llm_cache.sqlite3")
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))              # Seconds an entry stays valid
+LLM_CACHE_MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "1024"))      # Size of the in-memory LRU tier
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(256 * 1024 * 1024))) # Size budget of the SQLite tier
+LLM_CACHE_SWEEP_INTERVAL = float(os.getenv("LLM_CACHE_SWEEP_INTERVAL", "300"))     # Seconds between deletions of expired entries
+
+# Disk hits only record their access time in memory; it is written out with the next store or this many hits
+_TOUCH_BATCH = 256
+
+
+class ResponseCache:
+    """Two-tier (in-memory LRU + SQLite) cache of parsed LLM responses, keyed by request hash."""
+
+    def __init__(self, path: str = LLM_CACHE_PATH, ttl: float = LLM_CACHE_TTL,
+                 memory_entries: int = LLM_CACHE_MEMORY_ENTRIES, max_bytes: int = LLM_CACHE_MAX_BYTES):
+        self.ttl = ttl
+        self.memory_entries = memory_entries
+        self.max_bytes = max_bytes
+        self._memory = OrderedDict()  # key -> (expires_at, serialized value)
+        self._lock = threading.Lock()
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        self._touched = {}  # key -> last access not yet written to disk
+        self._last_sweep = 0.0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_expires_at ON responses(expires_at)")
+        self._conn.commit()
+        # Running size of the SQLite tier, so a store does not have to add up the whole table
+        self._disk_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def make_key(model: str, temperature: float, max_tokens: int, messages: list) -> str:
+        payload = json.dumps([model, temperature, max_tokens, messages], sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and entry[0] > now:
+                self._memory.move_to_end(key)
+                self._counters["memory_hits"] += 1
+                return json.loads(entry[1])
+            if entry:
+                del self._memory[key]
+
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row and row[1] > now:
+                self._touched[key] = now
+                if len(self._touched) >= _TOUCH_BATCH:
+                    self._flush_touched()
+                    self._conn.commit()
+                self._remember(key, row[1], row[0])
+                self._counters["disk_hits"] += 1
+                return json.loads(row[0])
+
+            self._counters["misses"] += 1
+            return None
+
+    def set(self, key: str, value: Dict):
+        now = time.time()
+        serialized = json.dumps(value)
+        expires_at = now + self.ttl
+        with self._lock:
+            self._remember(key, expires_at, serialized)
+            self._touched.pop(key, None)
+            previous = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, expires_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, serialized, len(serialized), expires_at, now)
+            )
+            self._disk_bytes += len(serialized) - (previous[0] if previous else 0)
+            self._flush_touched()
+            if now - self._last_sweep >= LLM_CACHE_SWEEP_INTERVAL:
+                self._sweep_expired(now)
+            if self._disk_bytes > self.max_bytes:
+                self._evict_disk()
+            self._conn.commit()
+            self._counters["stores"] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            disk_entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            lookups = self._counters["memory_hits"] + self._counters["disk_hits"] + self._counters["misses"]
+            hits = lookups - self._counters["misses"]
+            return {
+                **self._counters,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "disk_entries": disk_entries,
+                "disk_bytes": self._disk_bytes,
+            }
+
+    def _remember(self, key: str, expires_at: float, serialized: str):
+        self._memory[key] = (expires_at, serialized)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _flush_touched(self):
+        if self._touched:
+            self._conn.executemany("UPDATE responses SET last_access = ? WHERE key = ?",
+                                   [(accessed, key) for key, accessed in self._touched.items()])
+            self._touched.clear()
+
+    def _sweep_expired(self, now: float):
+        self._last_sweep = now
+        freed, count = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0), COUNT(*) FROM responses WHERE expires_at <= ?", (now,)
+        ).fetchone()
+        if count:
+            self._conn.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+            self._disk_bytes -= freed
+            self._counters["evictions"] += count
+
+    def _evict_disk(self):
+        # Other processes may share the file: start from the actual size, this only runs once per 10% of the budget
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        self._disk_bytes = total
+        if total <= self.max_bytes:
+            return
+        # Drop least recently used entries in one batch, until the tier is back under 90% of its budget
+        target = total - int(self.max_bytes * 0.9)
+        freed = 0
+        victims = []
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_access"):
+            if freed >= target:
+                break
+            victims.append((key,))
+            freed += size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", victims)
+        self._disk_bytes -= freed
+        for (key,) in victims:
+            self._memory.pop(key, None)
+        self._counters["evictions"] += len(victims)
+        logger.info("Evicted %d cached responses (%d bytes).", len(victims), freed)
+
+
+response_cache = ResponseCache() if LLM_CACHE_ENABLED else None
@@ -0,0 +1,161 @@
+import os
+import re
+import json
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from typing import Awaitable, Callable, Dict, List
+
+# Configure logging for this module
+logger = logging.getLogger(__name__)
+
+CV_CHUNKING_ENABLED = os.getenv("CV_CHUNKING_ENABLED", "1") == "1"
+# Shorter CVs are structured in one call. ~10000 characters is ~2500 tokens, whose structured JSON reaches MAX_TOKENS (2000)
+CV_CHUNK_MIN_CHARS = int(os.getenv("CV_CHUNK_MIN_CHARS", "10000"))
+CV_CHUNK_CHARS = int(os.getenv("CV_CHUNK_CHARS", "3500"))           # Target size of one chunk; sections are never merged past it
+CV_CHUNK_WORKERS = int(os.getenv("CV_CHUNK_WORKERS", "12"))         # Threads shared by all chunked structurings
+
+# Headings that open a new CV section; matched against short lines only
+_HEADING = re.compile(
+    r'^\W*(work\s+experience|professional\s+experience|experience|employment(\s+history)?|work\s+history|career|'
+    r'education|studies|academic\s+background|projects?|personal\s+projects|skills|technical\s+skills|'
+    r'competences|competencies|certifications?|courses|trainings?|languages|foreign\s+languages|volunteering|'
+    r'volunteer\s+experience|contests|competitions|awards|achievements|summary|profile|about\s+me|interests)\W*$',
+    re.IGNORECASE)
+_MAX_HEADING_LENGTH = 60
+
+# Scalar fields come from the first chunk that has them: the one holding the top of the CV
+_SCALAR_FIELDS = ("id", "first_name", "last_name")
+
+_executor = ThreadPoolExecutor(max_workers=CV_CHUNK_WORKERS, thread_name_prefix="cv-chunk")
+
+########################## SPLITTING #####################################
+
+def split_sections(text: str) -> List[str]:
+    """Cut a raw CV at its section headings; the text before the first heading is its own section."""
+    sections, current = [], []
+    for line in text.splitlines(keepends=True):
+        stripped = line.strip()
+        if current and len(stripped) <= _MAX_HEADING_LENGTH and _HEADING.match(stripped):
+            sections.append("".join(current))
+            current = []
+        current.append(line)
+    if current:
+        sections.append("".join(current))
+    return [section for section in sections if section.strip()]
+
+def _split_long(section: str, size: int) -> List[str]:
+    # A section longer than a chunk is cut at paragraph, then line boundaries
+    pieces, current = [], ""
+    for block in re.split(r'(?<=\n)(?=\s*\n)', section):
+        for line in block.splitlines(keepends=True) if len(block) > size else [block]:
+            if current and len(current) + len(line) > size:
+                pieces.append(current)
+                current = ""
+            current += line
+    if current:
+        pieces.append(current)
+    return pieces
+
+def plan_chunks(text: str, size: int = CV_CHUNK_CHARS) -> List[str]:
+    """Consecutive sections packed into chunks of about `size` characters, in document order."""
+    chunks, current = [], ""
+    for section in split_sections(text):
+        for piece in _split_long(section, size) if len(section) > size else [section]:
+            if current and len(current) + len(piece) > size:
+                chunks.append(current)
+                current = ""
+            current += piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+def cv_chunks(text: str) -> List[str]:
+    """The chunks to structure a CV in, or [] when it is short enough (or has no headings) for a single call."""
+    if not CV_CHUNKING_ENABLED or len(text) < CV_CHUNK_MIN_CHARS:
+        return []
+    chunks = plan_chunks(text)
+    return chunks if len(chunks) > 1 else []
+
+def chunk_message(chunk: str, part: int, parts: int) -> str:
+    return (f"This is part {part + 1} of {parts} of one CV, split at its sections. Structure only what this part "
+            f"contains and leave the other fields empty.\n\n{chunk}")
+
+########################## MERGING #######################################
+
+def _key(value) -> str:
+    if isinstance(value, str):
+        return " ".join(value.casefold().split())
+    return json.dumps(value, sort_keys=True, ensure_ascii=False).casefold()
+
+def merge_structured_cvs(parts: List[Dict]) -> Dict:
+    """Merge the structures of a CV's chunks, in chunk order, into one structured CV.
+
+    Lists are concatenated and deduplicated; a technical skill found in several chunks keeps its
+    first position and its highest strength. The result only depends on the parts and their order.
+    """
+    merged = {}
+    for part in parts:
+        for field in _SCALAR_FIELDS:
+            if merged.get(field) in (None, "") and part.get(field) not in (None, ""):
+                merged[field] = part[field]
+
+    skills, skill_order = {}, []
+    merged["technical_skills"] = []
+    for part in parts:
+        for skill in part.get("technical_skills") or []:
+            name = skill.get("name") if isinstance(skill, dict) else skill
+            if not name:
+                continue
+            key = _key(name)
+            if key not in skills:
+                skills[key] = dict(skill) if isinstance(skill, dict) else {"name": skill}
+                skill_order.append(key)
+            elif isinstance(skill, dict) and _strength(skill) > _strength(skills[key]):
+                skills[key]["strength"] = skill["strength"]
+
+    for part in parts:
+        for field, value in part.items():
+            if field in _SCALAR_FIELDS or field == "technical_skills":
+                continue
+            if not isinstance(value, list):
+                merged.setdefault(field, value)
+                continue
+            items = merged.setdefault(field, [])
+            seen = {_key(item) for item in items}
+            for item in value:
+                if _key(item) not in seen:
+                    seen.add(_key(item))
+                    items.append(item)
+    merged["technical_skills"] = [skills[key] for key in skill_order]
+    return merged
+
+def _strength(skill: Dict) -> float:
+    try:
+        return float(skill.get("strength"))
+    except (TypeError, ValueError):
+        return 0.0
+
+########################## STRUCTURING ###################################
+
+def structure_chunks(chunks: List[str], structure_chunk: Callable[[str, int, int], Dict]) -> Dict:
+    """Structure every chunk in parallel with `structure_chunk(chunk, part, parts)` and merge them.
+
+    Returns {} if any chunk fails: a CV missing one of its sections is worse than an error.
+    """
+    futures = [_executor.submit(copy_context().run, structure_chunk, chunk, part, len(chunks))
+               for part, chunk in enumerate(chunks)]
+    return _merged([future.result() for future in futures])
+
+async def astructure_chunks(chunks: List[str], astructure_chunk: Callable[[str, int, int], Awaitable[Dict]]) -> Dict:
+    parts = await asyncio.gather(*(astructure_chunk(chunk, part, len(chunks)) for part, chunk in enumerate(chunks)))
+    return _merged(list(parts))
+
+def _merged(parts: List[Dict]) -> Dict:
+    failed = [part for part, structured in enumerate(parts) if not structured]
+    if failed:
+        logger.error("Structuring failed for CV chunks %s of %s.", failed, len(parts))
+        return {}
+    logger.info("Structured a CV in %s chunks.", len(parts))
+    return merge_structured_cvs(parts)
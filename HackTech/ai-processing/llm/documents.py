@@ -0,0 +1,250 @@
+import os
+import re
+import asyncio
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+import unicodedata
+from array import array
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+# Configure logging for this module
+logger = logging.getLogger(__name__)
+
+DOCUMENT_STORE_ENABLED = os.getenv("DOCUMENT_STORE_ENABLED", "1") == "1"
+DOCUMENT_STORE_PATH = os.getenv("DOCUMENT_STORE_PATH", "./cache/documents.sqlite3")
+NEAR_DUPLICATE_ENABLED = os.getenv("NEAR_DUPLICATE_ENABLED", "0") == "1"           # Off by default: a near hit reuses another upload's structure
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.95"))    # Minimum estimated Jaccard similarity
+
+SHINGLE_SIZE = 5      # Words per shingle
+NUM_PERMUTATIONS = 128
+LSH_BANDS = 16        # 16 bands of 8 rows: candidate pairs start to appear around 0.7 similarity
+LSH_ROWS = NUM_PERMUTATIONS // LSH_BANDS
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+# Fixed seeds so signatures stay comparable across restarts
+_PERMUTATIONS = [
+    (int.from_bytes(hashlib.sha256(f"a{i}".encode()).digest()[:8], "big") % (_MERSENNE_PRIME - 1) + 1,
+     int.from_bytes(hashlib.sha256(f"b{i}".encode()).digest()[:8], "big") % _MERSENNE_PRIME)
+    for i in range(NUM_PERMUTATIONS)
+]
+
+# The FileHandler prefixes every uploaded document with "id:<id> "
+_ID_PREFIX = re.compile(r'^\s*id:\s*(\S+)\s*', re.IGNORECASE)
+
+########################## FINGERPRINTS ##################################
+
+def split_document_id(text: str) -> Tuple[Optional[str], str]:
+    match = _ID_PREFIX.match(text)
+    if match:
+        return match.group(1), text[match.end():]
+    return None, text
+
+def normalize_text(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return " ".join(text.split())
+
+def fingerprint(normalized: str) -> str:
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+def content_hash(structured: Dict) -> str:
+    # The id only labels the document; everything else is what gets scored or embedded
+    content = {key: value for key, value in structured.items() if key != "id"}
+    return hashlib.sha256(json.dumps(content, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()[:32]
+
+def document_id(structured: Dict) -> Optional[str]:
+    doc_id = structured.get("id") if isinstance(structured, dict) else None
+    return str(doc_id) if doc_id not in (None, "") else None
+
+def minhash_signature(normalized: str) -> List[int]:
+    words = normalized.split()
+    shingles = {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(max(1, len(words) - SHINGLE_SIZE + 1))}
+    hashes = [int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=4).digest(), "big")
+              for shingle in shingles]
+    return [min((a * h + b) % _MERSENNE_PRIME for h in hashes) & _MAX_HASH for a, b in _PERMUTATIONS]
+
+def estimated_similarity(signature: List[int], other: List[int]) -> float:
+    return sum(1 for x, y in zip(signature, other) if x == y) / NUM_PERMUTATIONS
+
+def _band_buckets(signature: List[int]) -> List[str]:
+    return [hashlib.blake2b(array("I", signature[band * LSH_ROWS:(band + 1) * LSH_ROWS]).tobytes(),
+                            digest_size=8).hexdigest()
+            for band in range(LSH_BANDS)]
+
+########################## STORE #########################################
+
+class DocumentStore:
+    """SQLite store of structured documents keyed by the fingerprint of their normalized text."""
+
+    def __init__(self, path: str = DOCUMENT_STORE_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "kind TEXT NOT NULL, fingerprint TEXT NOT NULL, doc_id TEXT, signature BLOB NOT NULL, "
+            "structured TEXT NOT NULL, created_at REAL NOT NULL, PRIMARY KEY (kind, fingerprint))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS document_bands ("
+            "kind TEXT NOT NULL, band INTEGER NOT NULL, bucket TEXT NOT NULL, fingerprint TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_document_bands ON document_bands(kind, band, bucket)")
+        self._conn.commit()
+
+    def get_exact(self, kind: str, doc_fingerprint: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT structured FROM documents WHERE kind = ? AND fingerprint = ?", (kind, doc_fingerprint)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_near(self, kind: str, signature: List[int], threshold: float) -> Tuple[Optional[Dict], float]:
+        buckets = _band_buckets(signature)
+        with self._lock:
+            candidates = set()
+            for band, bucket in enumerate(buckets):
+                candidates.update(row[0] for row in self._conn.execute(
+                    "SELECT fingerprint FROM document_bands WHERE kind = ? AND band = ? AND bucket = ?",
+                    (kind, band, bucket)
+                ))
+            best, best_similarity = None, 0.0
+            for candidate in candidates:
+                stored_signature, structured = self._conn.execute(
+                    "SELECT signature, structured FROM documents WHERE kind = ? AND fingerprint = ?", (kind, candidate)
+                ).fetchone()
+                similarity = estimated_similarity(signature, array("I", stored_signature).tolist())
+                if similarity > best_similarity:
+                    best, best_similarity = structured, similarity
+        if best is not None and best_similarity >= threshold:
+            return json.loads(best), best_similarity
+        return None, best_similarity
+
+    def put(self, kind: str, doc_fingerprint: str, doc_id: Optional[str], signature: Optional[List[int]],
+            structured: Dict):
+        # Without a signature (near-duplicate detection off) the document is only found by its exact fingerprint
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents (kind, fingerprint, doc_id, signature, structured, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (kind, doc_fingerprint, doc_id, array("I", signature or []).tobytes(), json.dumps(structured), time.time())
+            )
+            self._conn.execute("DELETE FROM document_bands WHERE kind = ? AND fingerprint = ?", (kind, doc_fingerprint))
+            if signature:
+                self._conn.executemany(
+                    "INSERT INTO document_bands (kind, band, bucket, fingerprint) VALUES (?, ?, ?, ?)",
+                    [(kind, band, bucket, doc_fingerprint) for band, bucket in enumerate(_band_buckets(signature))]
+                )
+            self._conn.commit()
+
+
+document_store = DocumentStore() if DOCUMENT_STORE_ENABLED else None
+
+def _lookup(kind: str, text: str):
+    """Return (stored structure or None, lookup info, what to store on a miss)."""
+    doc_id, body = split_document_id(text)
+    normalized = normalize_text(body)
+    doc_fingerprint = fingerprint(normalized)
+
+    structured = document_store.get_exact(kind, doc_fingerprint)
+    if structured is not None:
+        logger.info("Reusing stored structured %s (exact fingerprint match).", kind)
+        return _with_id(structured, doc_id), {"hit": "exact", "similarity": 1.0, "fingerprint": doc_fingerprint}, None
+
+    # 128 hash permutations per shingle: only worth it when near duplicates are looked up
+    signature = minhash_signature(normalized) if NEAR_DUPLICATE_ENABLED else None
+    if signature is not None:
+        structured, similarity = document_store.get_near(kind, signature, NEAR_DUPLICATE_THRESHOLD)
+        if structured is not None:
+            logger.info("Reusing stored structured %s (near duplicate, similarity %.3f).", kind, similarity)
+            return _with_id(structured, doc_id), {"hit": "near", "similarity": similarity, "fingerprint": doc_fingerprint}, None
+
+    return None, {"hit": None, "fingerprint": doc_fingerprint}, (doc_fingerprint, doc_id, signature)
+
+def structure_with_dedup(kind: str, text: str, structure: Callable[[str], Dict]) -> Tuple[Dict, Dict]:
+    """Return the structured document for `text`, reusing a stored one when the text was seen before.
+
+    The second value describes the lookup: {"hit": "exact" | "near" | None, "similarity": float}.
+    """
+    if not document_store:
+        return structure(text), {"hit": None}
+
+    structured, info, pending = _lookup(kind, text)
+    if structured is not None:
+        return structured, info
+
+    structured = structure(text)
+    if structured:
+        document_store.put(kind, *pending, structured)
+    return structured, info
+
+async def astructure_with_dedup(kind: str, text: str, structure: Callable[[str], Awaitable[Dict]]) -> Tuple[Dict, Dict]:
+    """Async variant of structure_with_dedup; fingerprinting runs off the event loop."""
+    if not document_store:
+        return await structure(text), {"hit": None}
+
+    structured, info, pending = await asyncio.to_thread(_lookup, kind, text)
+    if structured is not None:
+        return structured, info
+
+    structured = await structure(text)
+    if structured:
+        await asyncio.to_thread(document_store.put, kind, *pending, structured)
+    return structured, info
+
+def stream_with_dedup(kind: str, text: str, stream: Callable[[str], Iterator[Tuple[str, Any]]]) -> Tuple[Dict, Iterator[Tuple[str, Any]]]:
+    """Streaming structure_with_dedup: return the lookup info and the (section, value) pairs.
+
+    A stored structure is replayed section by section; a new one is stored once its stream completes.
+    """
+    if not document_store:
+        return {"hit": None}, stream(text)
+
+    structured, info, pending = _lookup(kind, text)
+    if structured is not None:
+        return info, iter(structured.items())
+    return info, _store_when_complete(kind, pending, stream(text))
+
+def _store_when_complete(kind: str, pending: Tuple, sections: Iterator[Tuple[str, Any]]) -> Iterator[Tuple[str, Any]]:
+    structured = {}
+    for key, value in sections:
+        structured[key] = value
+        yield key, value
+    # Not reached when the stream raises, so a partial structure is never stored
+    if structured:
+        document_store.put(kind, *pending, structured)
+
+async def astream_with_dedup(kind: str, text: str, stream: Callable[[str], AsyncIterator[Tuple[str, Any]]]) -> Tuple[Dict, AsyncIterator[Tuple[str, Any]]]:
+    """Async stream_with_dedup."""
+    if not document_store:
+        return {"hit": None}, stream(text)
+
+    structured, info, pending = await asyncio.to_thread(_lookup, kind, text)
+    if structured is not None:
+        return info, _aiterate(structured.items())
+    return info, _astore_when_complete(kind, pending, stream(text))
+
+async def _aiterate(items) -> AsyncIterator[Tuple[str, Any]]:
+    for item in items:
+        yield item
+
+async def _astore_when_complete(kind: str, pending: Tuple, sections: AsyncIterator[Tuple[str, Any]]) -> AsyncIterator[Tuple[str, Any]]:
+    structured = {}
+    async for key, value in sections:
+        structured[key] = value
+        yield key, value
+    if structured:
+        await asyncio.to_thread(document_store.put, kind, *pending, structured)
+
+def _with_id(structured: Dict, doc_id: Optional[str]) -> Dict:
+    # A re-upload gets a new id from the FileHandler; the stored structure must carry it
+    if doc_id is not None and isinstance(structured, dict):
+        structured["id"] = doc_id
+    return structured
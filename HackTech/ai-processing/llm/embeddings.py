@@ -0,0 +1,307 @@
+import os
+import re
+import math
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import Counter as TermCounter
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from llm.documents import content_hash, document_id
+from llm.metrics import Gauge, Histogram
+
+# Configure logging for this module
+logger = logging.getLogger(__name__)
+
+SEMANTIC_RANKING_ENABLED = os.getenv("SEMANTIC_RANKING_ENABLED", "1") == "1"
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "hashing")             # "hashing" (no model needed) or "sentence-transformers"
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "1024"))    # Size of the hashing backend's vectors
+EMBEDDING_INDEX_PATH = os.getenv("EMBEDDING_INDEX_PATH", "./cache/embeddings.sqlite3")
+SEMANTIC_TOP_N = int(os.getenv("SEMANTIC_TOP_N", "0"))                   # CVs of a /match-batch sent to the LLM, 0 for all
+SEMANTIC_TOP_N_MAX = int(os.getenv("SEMANTIC_TOP_N_MAX", "100"))         # Largest shortlist a /rank request may ask for
+
+# Section -> weight in the similarity; a section empty on either side is left out and the rest reweighted
+SECTION_WEIGHTS = {"skills": 0.5, "experience": 0.35, "education": 0.15}
+SECTIONS = list(SECTION_WEIGHTS)
+
+_TOKEN = re.compile(r'[a-z0-9][a-z0-9+#.]*')
+_EDUCATION_LINE = re.compile(r'\b(degree|bachelor|master|msc|bsc|phd|doctorate|university|college|diploma|graduate|'
+                             r'studies|education|faculty)\b', re.IGNORECASE)
+
+########################## SECTIONS ######################################
+
+def _strings(value) -> List[str]:
+    if isinstance(value, str):
+        return [value]
+    if isinstance(value, dict):
+        return [text for item in value.values() for text in _strings(item)]
+    if isinstance(value, list):
+        return [text for item in value for text in _strings(item)]
+    return []
+
+def cv_sections(structured_cv: Dict) -> Dict[str, str]:
+    skills = [skill.get("name") if isinstance(skill, dict) else skill
+              for skill in structured_cv.get("technical_skills") or []]
+    return {
+        "skills": " ".join(_strings([skills, structured_cv.get("soft_skills"), structured_cv.get("certifications")])),
+        "experience": " ".join(_strings([structured_cv.get("work_experience"), structured_cv.get("projects")])),
+        "education": " ".join(_strings(structured_cv.get("education"))),
+    }
+
+def job_sections(structured_job: Dict) -> Dict[str, str]:
+    qualifications = _strings(structured_job.get("required_qualifications"))
+    hr_skills = [req.get("skill") for req in structured_job.get("hr_requirements") or [] if isinstance(req, dict)]
+    return {
+        "skills": " ".join(_strings([qualifications, structured_job.get("preferred_skills"), hr_skills])),
+        "experience": " ".join(_strings([structured_job.get("job_title"), structured_job.get("key_responsibilities")])),
+        "education": " ".join(line for line in qualifications if _EDUCATION_LINE.search(line)),
+    }
+
+SECTION_BUILDERS = {"cv": cv_sections, "job": job_sections}
+
+########################## BACKENDS ######################################
+
+class HashingEmbedder:
+    """Feature-hashed bag of words and word pairs: deterministic, no model to download, good enough to shortlist.
+
+    Tokens keep "+", "#" and "." so "C++", "C#" and ".NET" survive; term counts are damped with a log.
+    """
+
+    def __init__(self, dimensions: int = EMBEDDING_DIMENSIONS):
+        self.dimensions = dimensions
+        self.name = f"hashing-{dimensions}"
+
+    def _features(self, text: str) -> TermCounter:
+        tokens = [token.rstrip(".") for token in _TOKEN.findall(text.casefold())]
+        tokens = [token for token in tokens if token]
+        return TermCounter(tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])])
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, count in self._features(text).items():
+                digest = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+                # The sign bit keeps colliding features from only ever adding up
+                sign = 1.0 if digest >> 63 else -1.0
+                vectors[row, digest % self.dimensions] += sign * (1.0 + math.log(count))
+        return _normalized(vectors)
+
+
+class SentenceTransformerEmbedder:
+    """Local sentence-transformers model, loaded once per process."""
+
+    def __init__(self, model: str = EMBEDDING_MODEL):
+        from sentence_transformers import SentenceTransformer
+        self._model = SentenceTransformer(model)
+        self.dimensions = self._model.get_sentence_embedding_dimension()
+        self.name = f"st:{model}"
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = self._model.encode(texts, normalize_embeddings=True, convert_to_numpy=True)
+        # Empty sections must not look similar to anything
+        vectors[[not text.strip() for text in texts]] = 0.0
+        return vectors.astype(np.float32)
+
+def _normalized(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+def create_embedder(backend: str = EMBEDDING_BACKEND):
+    if backend == "sentence-transformers":
+        try:
+            return SentenceTransformerEmbedder()
+        except ImportError:
+            logger.warning("sentence-transformers is not installed, using the hashing embedding backend.")
+    return HashingEmbedder()
+
+########################## INDEX #########################################
+
+class EmbeddingIndex:
+    """In-process matrix of section vectors per document kind, persisted to SQLite and loaded at startup.
+
+    Rows are (document, section, dimension) float32 arrays of unit vectors, so a weighted similarity
+    against every stored CV is one matrix product. Vectors made by another backend are ignored.
+    Every worker process holds its own matrix; searches first pick up the rows other processes wrote.
+    """
+
+    def __init__(self, embedder, path: str = EMBEDDING_INDEX_PATH):
+        self.embedder = embedder
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "kind TEXT NOT NULL, doc_id TEXT NOT NULL, backend TEXT NOT NULL, content_hash TEXT NOT NULL, "
+            "vectors BLOB NOT NULL, structured TEXT NOT NULL, updated_at REAL NOT NULL, "
+            "PRIMARY KEY (kind, doc_id, backend))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_updated ON embeddings(backend, updated_at)")
+        self._conn.commit()
+        self._synced_at = 0.0  # updated_at of the newest row loaded
+        self._ids: Dict[str, List[str]] = {"cv": [], "job": []}
+        self._rows: Dict[str, Dict[str, int]] = {"cv": {}, "job": {}}
+        self._hashes: Dict[str, Dict[str, str]] = {"cv": {}, "job": {}}
+        self._matrix: Dict[str, np.ndarray] = {kind: self._empty(16) for kind in self._ids}
+        self._load()
+
+    def _empty(self, capacity: int) -> np.ndarray:
+        return np.zeros((capacity, len(SECTIONS), self.embedder.dimensions), dtype=np.float32)
+
+    def _load(self, since: float = 0.0) -> int:
+        # Called with the lock held (or before the index is shared)
+        rows = self._conn.execute(
+            "SELECT kind, doc_id, content_hash, vectors, updated_at FROM embeddings WHERE backend = ? AND updated_at > ?",
+            (self.embedder.name, since)
+        ).fetchall()
+        shape = (len(SECTIONS), self.embedder.dimensions)
+        loaded = 0
+        for kind, doc_id, doc_hash, blob, updated_at in rows:
+            if self._hashes[kind].get(doc_id) != doc_hash:
+                self._set_row(kind, doc_id, doc_hash, np.frombuffer(blob, dtype=np.float32).reshape(shape))
+                loaded += 1
+            self._synced_at = max(self._synced_at, updated_at)
+        if loaded:
+            logger.info("Loaded %s document embeddings (%s).", loaded, self.embedder.name)
+        return loaded
+
+    def _refresh(self):
+        # Rows written by other workers since the last load; the overlap covers writes committed out of order
+        self._load(self._synced_at - _REFRESH_OVERLAP)
+
+    def _set_row(self, kind: str, doc_id: str, doc_hash: str, vectors: np.ndarray):
+        # Called with the lock held (or before the index is shared)
+        row = self._rows[kind].get(doc_id)
+        if row is None:
+            row = len(self._ids[kind])
+            if row == len(self._matrix[kind]):
+                grown = self._empty(2 * row)
+                grown[:row] = self._matrix[kind]
+                self._matrix[kind] = grown
+            self._ids[kind].append(doc_id)
+            self._rows[kind][doc_id] = row
+        self._matrix[kind][row] = vectors
+        self._hashes[kind][doc_id] = doc_hash
+
+    def embed(self, kind: str, structured: Dict) -> np.ndarray:
+        """(section, dimension) vectors of a structured document; reuses the stored ones when it is unchanged."""
+        doc_id, doc_hash = document_id(structured), content_hash(structured)
+        with self._lock:
+            row = self._rows[kind].get(doc_id)
+            if row is not None and self._hashes[kind][doc_id] == doc_hash:
+                return self._matrix[kind][row].copy()
+        start = time.perf_counter()
+        sections = SECTION_BUILDERS[kind](structured)
+        vectors = self.embedder.embed([sections[section] for section in SECTIONS])
+        embed_latency.observe(time.perf_counter() - start, kind=kind)
+        return vectors
+
+    def add(self, kind: str, doc_id: str, structured: Dict) -> bool:
+        """Index the current structure of a document; returns False if it was already indexed unchanged."""
+        doc_hash = content_hash(structured)
+        with self._lock:
+            if self._hashes[kind].get(doc_id) == doc_hash:
+                return False
+        vectors = self.embed(kind, structured)
+        with self._lock:
+            self._set_row(kind, doc_id, doc_hash, vectors)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO embeddings (kind, doc_id, backend, content_hash, vectors, structured, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (kind, doc_id, self.embedder.name, doc_hash, vectors.tobytes(), json.dumps(structured), time.time())
+            )
+            self._conn.commit()
+        return True
+
+    def document(self, kind: str, doc_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT structured FROM embeddings WHERE kind = ? AND doc_id = ? AND backend = ?",
+                (kind, doc_id, self.embedder.name)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def search(self, query: np.ndarray, kind: str, top_n: int) -> List[Dict]:
+        """The `top_n` indexed documents of `kind` most similar to the (section, dimension) `query` vectors."""
+        start = time.perf_counter()
+        with self._lock:
+            self._refresh()
+            count = len(self._ids[kind])
+            if not count or top_n < 1:
+                return []
+            similarities, per_section = weighted_similarity(query, self._matrix[kind][:count])
+            ids = list(self._ids[kind])
+        results = [{f"{kind}_id": ids[i], **_similarity_report(similarities[i], per_section[i])}
+                   for i in _top(similarities, top_n)]
+        search_latency.observe(time.perf_counter() - start, kind=kind)
+        return results
+
+    def size(self, kind: str) -> int:
+        with self._lock:
+            return len(self._ids[kind])
+
+########################## RANKING #######################################
+
+_REFRESH_OVERLAP = 5.0  # Seconds
+_WEIGHTS = np.array([SECTION_WEIGHTS[section] for section in SECTIONS], dtype=np.float32)
+
+def weighted_similarity(query: np.ndarray, documents: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Weighted cosine similarity of (n, section, dimension) documents to (section, dimension) query vectors.
+
+    Returns the overall similarity per document and the per-section similarities (NaN where a side is empty).
+    """
+    per_section = np.einsum("nsd,sd->ns", documents, query)
+    present = (np.abs(documents).sum(axis=2) > 0) & (np.abs(query).sum(axis=1) > 0)
+    weights = present * _WEIGHTS
+    totals = weights.sum(axis=1)
+    similarities = np.divide((per_section * weights).sum(axis=1), totals, out=np.zeros(len(documents), dtype=np.float32),
+                             where=totals > 0)
+    return similarities, np.where(present, per_section, np.nan)
+
+def _top(similarities: np.ndarray, top_n: int) -> np.ndarray:
+    if top_n < len(similarities):
+        candidates = np.argpartition(-similarities, top_n - 1)[:top_n]
+    else:
+        candidates = np.arange(len(similarities))
+    # Stable on ties, so equal candidates keep their input order
+    return candidates[np.argsort(-similarities[candidates], kind="stable")]
+
+def _similarity_report(similarity: float, per_section: np.ndarray) -> Dict:
+    # Named after embeddings rather than semantics: the default hashing backend only measures shared terms
+    return {"embedding_similarity": round(float(similarity), 4),
+            "embedding_sections": {section: None if np.isnan(value) else round(float(value), 4)
+                                   for section, value in zip(SECTIONS, per_section)}}
+
+def rank_cvs(structured_cvs: List[Dict], structured_job: Dict, top_n: int) -> Tuple[List[int], Dict[int, Dict]]:
+    """Shortlist the `top_n` CVs of a batch most similar to the job.
+
+    Returns the indexes of the shortlisted CVs, best first, and the similarity report of every CV.
+    """
+    query = embedding_index.embed("job", structured_job)
+    documents = np.stack([embedding_index.embed("cv", cv) if isinstance(cv, dict) else np.zeros_like(query)
+                          for cv in structured_cvs])
+    similarities, per_section = weighted_similarity(query, documents)
+    reports = {index: _similarity_report(similarities[index], per_section[index]) for index in range(len(structured_cvs))}
+    return [int(index) for index in _top(similarities, top_n)], reports
+
+def shortlist_cvs(structured_job: Dict, top_n: int) -> List[Dict]:
+    """The indexed CVs most similar to a job, with their structures, best first."""
+    query = embedding_index.embed("job", structured_job)
+    shortlist = embedding_index.search(query, "cv", min(top_n, SEMANTIC_TOP_N_MAX))
+    for candidate in shortlist:
+        candidate["structured_cv"] = embedding_index.document("cv", candidate["cv_id"])
+    return [candidate for candidate in shortlist if candidate["structured_cv"] is not None]
+
+
+embedding_index = EmbeddingIndex(create_embedder()) if SEMANTIC_RANKING_ENABLED else None
+
+embed_latency = Histogram("embedding_seconds", "Time to embed the sections of one document.", ("kind",))
+search_latency = Histogram("semantic_search_seconds", "Time of one vector query over the embedding index.", ("kind",))
+indexed_documents = Gauge("embedding_index_documents", "Documents in the embedding index, per kind.", ("kind",),
+                          lambda: {(kind,): embedding_index.size(kind) for kind in ("cv", "job")} if embedding_index else {})
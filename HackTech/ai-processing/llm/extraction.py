@@ -0,0 +1,214 @@
+import re
+import json
+import logging
+import threading
+from typing import Dict, List, Optional
+
+# Configure logging for this module
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+    _loads = orjson.loads
+    _DecodeError = orjson.JSONDecodeError
+except ImportError:  # orjson is several times faster on large structured CVs, but optional
+    _loads = json.loads
+    _DecodeError = json.JSONDecodeError
+
+_FENCE = re.compile(r"```(?:json)?\s*(.*?)\s*```", re.DOTALL | re.IGNORECASE)
+_OPEN_QUOTES = "“„‟"  # “ „ ‟
+_CLOSE_QUOTES = "”"             # ”
+_CLOSERS = {"{": "}", "[": "]"}
+
+_stats_lock = threading.Lock()
+_stats = {"clean": 0, "repaired": 0, "failed": 0, "invalid": 0}
+
+def _count(name: str):
+    with _stats_lock:
+        _stats[name] += 1
+
+def extraction_stats() -> Dict:
+    with _stats_lock:
+        return dict(_stats)
+
+########################## EXTRACTION ####################################
+
+def _try_loads(text: str):
+    try:
+        return _loads(text)
+    except (_DecodeError, ValueError, TypeError):
+        return None
+
+def _repair(text: str) -> Optional[object]:
+    """Rewrite `text` from its first opening bracket, then close whatever MAX_TOKENS cut off.
+
+    Smart double quotes outside of strings become ASCII quotes, trailing commas are dropped and,
+    for a truncated answer, the unterminated string and brackets are closed; if the last member is
+    incomplete, the text is cut back to the last comma until something parses.
+    """
+    start = min((i for i in (text.find("{"), text.find("[")) if i >= 0), default=-1)
+    if start < 0:
+        return None
+
+    out, stack, cut_points = [], [], []
+    in_string = smart_string = escaped = False
+    for char in text[start:]:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif smart_string and char in _CLOSE_QUOTES + _OPEN_QUOTES:
+                char, in_string = '"', False
+            elif smart_string and char == '"':
+                char = '\\"'
+            elif not smart_string and char == '"':
+                in_string = False
+            out.append(char)
+            continue
+
+        if char == '"' or char in _OPEN_QUOTES + _CLOSE_QUOTES:
+            in_string, smart_string = True, char != '"'
+            out.append('"')
+        elif char in "{[":
+            stack.append(char)
+            out.append(char)
+        elif char in "}]":
+            # A trailing comma before the closing bracket
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ",":
+                out.pop()
+            out.append(char)
+            if stack:
+                stack.pop()
+            if not stack:
+                break
+        else:
+            if char == ",":
+                cut_points.append((len(out), list(stack)))
+            out.append(char)
+
+    repaired = "".join(out)
+    if not stack:
+        return _try_loads(repaired)
+
+    # Truncated: close the open string and brackets, dropping incomplete members one by one
+    candidates = [(repaired + ('"' if in_string else ""), stack)]
+    candidates += [("".join(out[:position]), open_brackets) for position, open_brackets in reversed(cut_points)]
+    for candidate, open_brackets in candidates:
+        candidate = candidate.rstrip().rstrip(",:").rstrip()
+        parsed = _try_loads(candidate + "".join(_CLOSERS[bracket] for bracket in reversed(open_brackets)))
+        if parsed is not None:
+            return parsed
+    return None
+
+def extract_json(content: str) -> Optional[object]:
+    """Find the JSON answer in `content` and parse it, repairing common defects; None if nothing is usable."""
+    if not content:
+        return None
+    content = content.strip()
+    parsed = _try_loads(content)
+    if parsed is not None:
+        _count("clean")
+        return parsed
+
+    fenced = _FENCE.search(content)
+    if fenced:
+        parsed = _try_loads(fenced.group(1))
+        if parsed is not None:
+            _count("clean")
+            return parsed
+
+    # No closing fence either when the answer was cut off
+    parsed = _repair(fenced.group(1) if fenced else content)
+    if parsed is None and fenced:
+        parsed = _repair(content)
+    if parsed is None:
+        _count("failed")
+        return None
+    _count("repaired")
+    logger.warning("Repaired malformed JSON in OpenAI API response.")
+    return parsed
+
+########################## SCHEMAS #######################################
+
+_SCORE = {"required": {"score": float}, "optional": {"reasoning": str, "cv_id": str, "job_id": str}}
+_SCORE_PART = {"required": {}, "optional": {"score": float, "reasoning": str}}
+
+# Expected answer of each prompt: required and optional top-level fields with their types. Only what
+# the callers cannot work without is required (matching checks each combined dimension on its own);
+# missing lists are filled with [] so a truncated structure keeps its earlier sections.
+SCHEMAS = {
+    "score": _SCORE,
+    "combined": {"required": {},
+                 "optional": {"cv_id": str, "job_id": str, "domain": _SCORE_PART, "tehnical": _SCORE_PART,
+                              "general": _SCORE_PART}},
+    "cv": {"required": {},
+           "optional": {"id": str, "first_name": str, "last_name": str, "technical_skills": list,
+                        "soft_skills": list, "education": list, "work_experience": list, "projects": list,
+                        "contests": list, "certifications": list, "foreign_languages": list,
+                        "volunteering": list}},
+    "job": {"required": {},
+            "optional": {"id": str, "job_title": str, "company_overview": str, "key_responsibilities": list,
+                         "required_qualifications": list, "preferred_skills": list, "benefits": list,
+                         "hr_requirements": list}},
+}
+
+def _coerce(value, expected, name: str, errors: List[str]):
+    if isinstance(expected, dict):
+        if not isinstance(value, dict):
+            errors.append(f"{name} is not an object")
+            return value
+        return _conform(value, expected, f"{name}.", errors)
+    if expected is float:
+        if isinstance(value, str):
+            try:
+                value = float(value.strip().rstrip("%"))
+            except ValueError:
+                pass
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            errors.append(f"{name} is not a number")
+        return value
+    if expected is str:
+        # Ids and names sometimes come back as numbers
+        return str(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else value
+    if not isinstance(value, expected):
+        errors.append(f"{name} is not a {expected.__name__}")
+    return value
+
+def _conform(data: Dict, schema: Dict, path: str, errors: List[str]) -> Dict:
+    for key, expected in schema["required"].items():
+        if data.get(key) is None:
+            errors.append(f"{path}{key} is missing")
+        else:
+            data[key] = _coerce(data[key], expected, f"{path}{key}", errors)
+    for key, expected in schema["optional"].items():
+        if data.get(key) is None:
+            if expected is list:
+                data[key] = []
+        else:
+            data[key] = _coerce(data[key], expected, f"{path}{key}", errors)
+    return data
+
+def conform_member(key: str, value, schema: str):
+    """One top-level member coerced as validate() does it, for members sent before the whole answer is in."""
+    fields = SCHEMAS[schema]
+    expected = fields["required"].get(key, fields["optional"].get(key))
+    if expected is None:
+        return value
+    if value is None:
+        return [] if expected is list else value
+    # Problems are reported by validate() on the full answer
+    return _coerce(value, expected, key, [])
+
+def validate(data, schema: str) -> List[str]:
+    """Check `data` against SCHEMAS[schema], coercing numeric strings in place; returns the problems found."""
+    if not isinstance(data, dict):
+        _count("invalid")
+        return ["answer is not a JSON object"]
+    errors = []
+    _conform(data, SCHEMAS[schema], "", errors)
+    if errors:
+        _count("invalid")
+    return errors
@@ -2,10 +2,18 @@ import os
 import json
 from dotenv import load_dotenv
 import openai
-from typing import Dict
-from llm.prompts import cv_structuring_context, tehnical_skills_2, job_structuring_context, general_match_prompt_3, domain_1
+from typing import Any, Dict, Iterator, Optional, Tuple, Union
+from llm.prompts import cv_structuring_context, tehnical_skills_2, job_structuring_context, general_match_prompt_3, domain_1, combined_match_prompt
+from llm.cache import ResponseCache, response_cache
+from llm.serialization import serialize_for_llm, count_tokens
+from llm.resilience import call_with_resilience, call_deadline, attempt_timeout, CircuitOpenError
+from llm.timing import stage, record_usage, StageClock
+from llm.streaming import SectionParser
+from llm.extraction import extract_json, validate, conform_member
+from llm.singleflight import single_flight
+from llm.scheduler import scheduler, scheduled, current_priority, DeadlineExceeded
+from llm.chunking import cv_chunks, chunk_message, structure_chunks
 import logging
-import re 
 
 # Configure logging for this module
 logging.basicConfig(level=logging.DEBUG)  # Set to DEBUG to capture all log levels
@@ -14,7 +22,12 @@ logging.disable(logging.CRITICAL)
 
 # Load environment variables once at startup
 load_dotenv()
+# Any OpenAI-compatible server, e.g. the local stand-in of benchmarks/llm_stub.py for offline load tests
+LLM_API_BASE = os.getenv("LLM_API_BASE")
 openai_api_key = os.getenv("API_KEY")
+if LLM_API_BASE:
+    openai.api_base = LLM_API_BASE
+    openai_api_key = openai_api_key or "local"  # Stand-in servers ignore the key
 if not openai_api_key:
     logger.error("API_KEY not found in environment variables.")
     raise EnvironmentError("API_KEY not found in environment variables.")
@@ -28,116 +41,279 @@ TIMEOUT = 60           # Timeout for API calls in seconds
 
 ########################## FETCH #########################################
 
-def fetch_openai_response(messages: list, model: str = MODEL_NAME) -> Dict:
-    try:
-        # logger.debug(f"Sending request to OpenAI API with model: {model}")
-        response = openai.ChatCompletion.create(
-            model=model,
-            messages=messages,
-            temperature=TEMPERATURE,
-            max_tokens=MAX_TOKENS,
-            timeout=TIMEOUT
-        )
+def cache_lookup(messages: list, model: str):
+    """Return (cache key, cached response); the key is None when caching is disabled."""
+    if not response_cache:
+        return None, None
+    cache_key = response_cache.make_key(model, TEMPERATURE, MAX_TOKENS, messages)
+    return cache_key, response_cache.get(cache_key)
 
-        # logger.debug(f"Full API Response: {response}")  # Log the entire response for debugging
+def estimate_usage(messages: list, completion: str) -> Dict:
+    return {"prompt_tokens": sum(count_tokens(message["content"]) for message in messages),
+            "completion_tokens": count_tokens(completion)}
 
-        # Validate response structure
-        if not response.choices:
-            # logger.error("No choices found in OpenAI API response.")
-            return {}
-        if 'message' not in response.choices[0]:
-            # logger.error("No message found in the first choice of OpenAI API response.")
-            return {}
-        
-        content = response.choices[0].message.get('content', '').strip()
+def prompt_token_estimate(messages: list) -> int:
+    # Only the tokens-per-minute budget needs it
+    return estimate_usage(messages, "")["prompt_tokens"] if scheduler.tpm else 0
+
+def schedule(messages: list, call, deadline: float):
+    """Make each attempt of `call` wait for the rate-limit scheduler, at the priority of the calling request.
+
+    An attempt still queued at `deadline` is dropped instead of being sent for a caller that gave up.
+    """
+    priority, prompt_tokens = current_priority(), prompt_token_estimate(messages)
+    return lambda: scheduled(call, prompt_tokens, MAX_TOKENS, priority, deadline)
+
+def parse_openai_response(response, schema: Optional[str] = None) -> Dict:
+    # Validate response structure
+    if not response.choices:
+        # logger.error("No choices found in OpenAI API response.")
+        return {}
+    if 'message' not in response.choices[0]:
+        # logger.error("No message found in the first choice of OpenAI API response.")
+        return {}
+
+    content = response.choices[0].message.get('content', '').strip()
+
+    if not content:
+        # logger.warning("Empty content received from OpenAI API.")
+        return {}
+
+    logger.debug("Raw GPT Response Content: %s", content)  # Log the raw GPT response
+    return parse_json_content(content, schema)
 
-        if not content:
-            # logger.warning("Empty content received from OpenAI API.")
+def parse_json_content(content: str, schema: Optional[str] = None) -> Dict:
+    # Fences, surrounding prose, trailing commas and answers cut off by MAX_TOKENS are repaired locally
+    json_content = extract_json(content)
+    if json_content is None:
+        logger.error("JSON decoding failed: no usable JSON in OpenAI API response.")
+        return {}
+    if schema:
+        errors = validate(json_content, schema)
+        if errors:
+            logger.error("OpenAI API response does not match the %s schema: %s", schema, errors)
             return {}
-        
-        logger.debug(f"Raw GPT Response Content: {content}")  # Log the raw GPT response
-
-        # Remove code fences if present
-        # Pattern to match ```json ... ```
-        json_pattern = re.compile(r'^```json\s*(.*?)\s*```$', re.DOTALL)
-        match = json_pattern.match(content)
-        if match:
-            content = match.group(1)
-            # logger.debug("Code fences detected and removed from GPT response.")
-
-        # Attempt to parse JSON
-        try:
-            json_content = json.loads(content)
-            # logger.debug(f"Parsed JSON Content: {json_content}")  # Log the parsed JSON
-            return json_content
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON decoding failed: {e}")
-            # logger.debug(f"Response content after stripping code fences: {content}")
-            # return {}
-        
+    return json_content
+
+def fetch_openai_response(messages: list, model: str = MODEL_NAME, use_cache: bool = True,
+                          schema: Optional[str] = None) -> Dict:
+    # Identical requests are answered from the response cache (TEMPERATURE is low enough to reuse results)
+    cache_key = None
+    if use_cache:
+        cache_key, cached = cache_lookup(messages, model)
+        if cached is not None:
+            logger.info("Serving OpenAI response from cache.")
+            return cached
+
+    # Identical calls already in flight (a client retry, two recruiters matching the same pair) share one request
+    return single_flight.do(flight_key(messages, model, schema, cache_key),
+                            lambda: request_openai_response(messages, model, schema, cache_key))
+
+def flight_key(messages: list, model: str, schema: Optional[str], cache_key: Optional[str]) -> str:
+    return f"{cache_key or ResponseCache.make_key(model, TEMPERATURE, MAX_TOKENS, messages)}:{schema}"
+
+def request_openai_response(messages: list, model: str, schema: Optional[str], cache_key: Optional[str]) -> Dict:
+    try:
+        # logger.debug("Sending request to OpenAI API with model: %s", model)
+        # Retried with backoff on transient errors, hedged when slow, rejected while the circuit is open
+        # Every attempt shares one deadline, so retries never outlast the caller
+        deadline = call_deadline()
+        with stage("llm"):
+            response = call_with_resilience(schedule(messages, lambda: openai.ChatCompletion.create(
+                model=model,
+                messages=messages,
+                temperature=TEMPERATURE,
+                max_tokens=MAX_TOKENS,
+                request_timeout=attempt_timeout(deadline, TIMEOUT)
+            ), deadline), deadline)
+
+        # logger.debug("Full API Response: %s", response)  # Log the entire response for debugging
+
+        record_usage(model, response.get("usage"))
+        with stage("decode"):
+            json_content = parse_openai_response(response, schema)
+        if cache_key and json_content:
+            response_cache.set(cache_key, json_content)
+        return json_content
+
     except openai.error.OpenAIError as e:
         # Handle specific OpenAI errors
-        logger.error(f"OpenAI API error: {e}")
+        logger.error("OpenAI API error: %s", e)
+        return {}
+    except (CircuitOpenError, DeadlineExceeded) as e:
+        logger.error("%s Failing fast.", e)
         return {}
     except Exception as e:
         # Handle other exceptions
-        logger.error(f"Unexpected error in fetch_openai_response: {e}")
+        logger.error("Unexpected error in fetch_openai_response: %s", e)
         return {}
 
+def stream_openai_sections(messages: list, model: str = MODEL_NAME, use_cache: bool = True,
+                           schema: Optional[str] = None) -> Iterator[Tuple[str, Any]]:
+    """Yield (key, value) for each top-level member of the JSON answer as soon as it has been generated.
+
+    Unlike fetch_openai_response this raises on failure: part of the answer may already be out.
+    """
+    cache_key = None
+    if use_cache:
+        cache_key, cached = cache_lookup(messages, model)
+        if cached is not None:
+            logger.info("Serving OpenAI response from cache.")
+            yield from cached.items()
+            return
+
+    parser, emitted = SectionParser(), {}
+    # Opening the stream and waiting for its chunks, but not the time the caller spends on each section
+    llm_clock = StageClock("llm")
+    try:
+        # Only opening the stream is retried; a stream that breaks halfway fails the request
+        # Every attempt shares one deadline, so retries never outlast the caller
+        deadline = call_deadline()
+        chunks = iter(call_with_resilience(schedule(messages, lambda: openai.ChatCompletion.create(
+            model=model,
+            messages=messages,
+            temperature=TEMPERATURE,
+            max_tokens=MAX_TOKENS,
+            request_timeout=attempt_timeout(deadline, TIMEOUT),
+            stream=True
+        ), deadline), deadline))
+        while True:
+            chunk = next(chunks, None)
+            llm_clock.pause()
+            if chunk is None:
+                break
+            delta = chunk.choices[0].delta.get("content") if chunk.choices else None
+            for key, value in parser.feed(delta or ""):
+                # Coerced as the full answer will be, so the streamed sections match /structure-cv
+                emitted[key] = value = conform_member(key, value, schema) if schema else value
+                yield key, value
+            llm_clock.resume()
+    except (openai.error.OpenAIError, CircuitOpenError, DeadlineExceeded) as e:
+        # Sections may already have been sent, so the caller has to see the failure
+        logger.error("OpenAI API error while streaming: %s", e)
+        raise
+    finally:
+        llm_clock.stop()
+
+    # Members the incremental parser could not split off, or that were cut off, come from the repaired full answer
+    # Streamed chunks carry no usage
+    record_usage(model, estimate_usage(messages, parser.text), streamed=True)
+    with stage("decode"):
+        json_content = parse_json_content(parser.text.strip(), schema)
+    if not json_content:
+        raise ValueError("No usable JSON in OpenAI API response.")
+    for key, value in json_content.items():
+        if key not in emitted:
+            emitted[key] = value
+            yield key, value
+    if cache_key:
+        response_cache.set(cache_key, json_content)
+
 ######################### SCORES #########################################
 
-def get_tehnical_score(structured_cv: Dict, structured_job: Dict) -> Dict:
-    messages = [
-        {"role": "system", "content": tehnical_skills_2},
-        {"role": "user", "content": f"The CV is: {json.dumps(structured_cv)}. The job is: {json.dumps(structured_job)}"}
+def build_score_messages(prompt: str, structured_cv: Union[Dict, str], structured_job: Union[Dict, str]) -> list:
+    # Documents may come pre-serialized so one match serializes each of them only once.
+    # The CV goes last: system prompt + job stay a byte-identical prefix across the CVs of one job,
+    # which is what provider-side prompt caching matches on.
+    return [
+        {"role": "system", "content": prompt},
+        {"role": "user", "content": f"The job is: {serialize_for_llm(structured_job)}"},
+        {"role": "user", "content": f"The CV is: {serialize_for_llm(structured_cv)}"}
     ]
+
+def get_tehnical_score(structured_cv: Union[Dict, str], structured_job: Union[Dict, str]) -> Dict:
+    messages = build_score_messages(tehnical_skills_2, structured_cv, structured_job)
     logger.info("Generating score for the job description.")
-    score = fetch_openai_response(messages)
+    score = fetch_openai_response(messages, schema="score")
     if not score:
         logger.error("Failed to generate score.")
     return score
 
-def get_general_score(structured_cv: Dict, structured_job: Dict) -> Dict:
-    messages = [
-        {"role": "system", "content": general_match_prompt_3},
-        {"role": "user", "content": f"The CV is: {json.dumps(structured_cv)}. The job is: {json.dumps(structured_job)}"}
-    ]
+def get_general_score(structured_cv: Union[Dict, str], structured_job: Union[Dict, str]) -> Dict:
+    messages = build_score_messages(general_match_prompt_3, structured_cv, structured_job)
     logger.info("Generating score for the job description.")
-    score = fetch_openai_response(messages)
+    score = fetch_openai_response(messages, schema="score")
     if not score:
         logger.error("Failed to generate score.")
     return score
 
-def get_domain_score(structured_cv: Dict, structured_job: Dict) -> Dict:
-    messages = [
-        {"role": "system", "content": domain_1},
-        {"role": "user", "content": f"The CV is: {json.dumps(structured_cv)}. The job is: {json.dumps(structured_job)}"}
-    ]
+def get_domain_score(structured_cv: Union[Dict, str], structured_job: Union[Dict, str]) -> Dict:
+    messages = build_score_messages(domain_1, structured_cv, structured_job)
     logger.info("Generating score for the job description.")
-    score = fetch_openai_response(messages)
+    score = fetch_openai_response(messages, schema="score")
 
     # if not score:
     #     logger.error("Failed to generate score.")
     return score
 
+def get_combined_score(structured_cv: Union[Dict, str], structured_job: Union[Dict, str]) -> Dict:
+    # Domain, technical and general scores with their reasonings from a single call
+    messages = build_score_messages(combined_match_prompt, structured_cv, structured_job)
+    logger.info("Generating combined score for the job description.")
+    score = fetch_openai_response(messages, schema="combined")
+    if not score:
+        logger.error("Failed to generate combined score.")
+    return score
+
 ########### STRUCTURE DATA #########################
 
 def get_structured_text_for_cv(text: str) -> Dict:
+    # Long CVs are structured section by section in parallel, so they are neither slow nor cut off by MAX_TOKENS
+    chunks = cv_chunks(text)
+    if chunks:
+        logger.info("Structuring CV text in %d chunks.", len(chunks))
+        return structure_chunks(chunks, get_structured_cv_chunk)
+
     messages = [
         {"role": "system", "content": cv_structuring_context},
         {"role": "user", "content": text}
     ]
     logger.info("Structuring CV text.")
-    structured_cv = fetch_openai_response(messages)
+    structured_cv = fetch_openai_response(messages, schema="cv")
     
     return structured_cv
 
+def get_structured_cv_chunk(chunk: str, part: int, parts: int) -> Dict:
+    messages = [
+        {"role": "system", "content": cv_structuring_context},
+        {"role": "user", "content": chunk_message(chunk, part, parts)}
+    ]
+    return fetch_openai_response(messages, schema="cv")
+
+def stream_structured_text_for_cv(text: str) -> Iterator[Tuple[str, Any]]:
+    chunks = cv_chunks(text)
+    if chunks:
+        # The merged structure only exists once every chunk is done
+        logger.info("Structuring CV text in %d chunks for a stream.", len(chunks))
+        return _stream_merged(chunks)
+
+    messages = [
+        {"role": "system", "content": cv_structuring_context},
+        {"role": "user", "content": text}
+    ]
+    logger.info("Streaming structured CV text.")
+    return stream_openai_sections(messages, schema="cv")
+
+def _stream_merged(chunks: list) -> Iterator[Tuple[str, Any]]:
+    structured_cv = structure_chunks(chunks, get_structured_cv_chunk)
+    if not structured_cv:
+        raise ValueError("Structuring failed for part of the CV.")
+    yield from structured_cv.items()
+
 def get_structured_text_for_job(text: str) -> Dict:
     messages = [
         {"role": "system", "content": job_structuring_context},
         {"role": "user", "content": text}
     ]
     logger.info("Structuring job description.")
-    structured_job = fetch_openai_response(messages)
+    structured_job = fetch_openai_response(messages, schema="job")
     
     return structured_job
+
+def stream_structured_text_for_job(text: str) -> Iterator[Tuple[str, Any]]:
+    messages = [
+        {"role": "system", "content": job_structuring_context},
+        {"role": "user", "content": text}
+    ]
+    logger.info("Streaming structured job description.")
+    return stream_openai_sections(messages, schema="job")
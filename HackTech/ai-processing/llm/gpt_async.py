@@ -0,0 +1,235 @@
+import os
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Dict, Optional, Tuple, Union
+import aiohttp
+import openai
+from llm.prompts import cv_structuring_context, tehnical_skills_2, job_structuring_context, general_match_prompt_3, domain_1, combined_match_prompt
+from llm.extraction import conform_member
+from llm.gpt import MODEL_NAME, TEMPERATURE, MAX_TOKENS, TIMEOUT, cache_lookup, parse_openai_response, parse_json_content, build_score_messages, estimate_usage, flight_key, prompt_token_estimate
+from llm.cache import response_cache
+from llm.resilience import acall_with_resilience, call_deadline, attempt_timeout, CircuitOpenError
+from llm.timing import stage, record_usage, StageClock
+from llm.streaming import SectionParser
+from llm.singleflight import single_flight
+from llm.scheduler import scheduler, ascheduled, current_priority, DeadlineExceeded
+from llm.chunking import cv_chunks, chunk_message, astructure_chunks
+
+# Configure logging for this module
+logger = logging.getLogger(__name__)
+
+OPENAI_POOL_SIZE = int(os.getenv("OPENAI_POOL_SIZE", "200"))              # Open connections to the API per worker
+OPENAI_KEEPALIVE_TIMEOUT = float(os.getenv("OPENAI_KEEPALIVE_TIMEOUT", "60")) # Seconds an idle connection is kept
+
+_session: Optional[aiohttp.ClientSession] = None
+
+########################## HTTP SESSION ##################################
+
+def get_http_session() -> aiohttp.ClientSession:
+    """One keep-alive connection pool per worker process, shared by every in-flight call."""
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(limit=OPENAI_POOL_SIZE, keepalive_timeout=OPENAI_KEEPALIVE_TIMEOUT)
+        _session = aiohttp.ClientSession(connector=connector)
+    return _session
+
+async def close_http_session():
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+########################## FETCH #########################################
+
+async def aschedule(messages: list, acall, deadline: float):
+    """Async schedule(); tiktoken runs in a thread."""
+    prompt_tokens = await asyncio.to_thread(prompt_token_estimate, messages) if scheduler.tpm else 0
+    priority = current_priority()
+    return lambda: ascheduled(acall, prompt_tokens, MAX_TOKENS, priority, deadline)
+
+async def afetch_openai_response(messages: list, model: str = MODEL_NAME, use_cache: bool = True,
+                                schema: Optional[str] = None) -> Dict:
+    cache_key = None
+    if use_cache:
+        # The cache reads SQLite under a lock: kept off the event loop
+        cache_key, cached = await asyncio.to_thread(cache_lookup, messages, model)
+        if cached is not None:
+            logger.info("Serving OpenAI response from cache.")
+            return cached
+
+    # Without a cache key the flight key hashes the whole prompt
+    key = flight_key(messages, model, schema, cache_key) if cache_key else \
+        await asyncio.to_thread(flight_key, messages, model, schema, cache_key)
+    return await single_flight.ado(key, lambda: arequest_openai_response(messages, model, schema, cache_key))
+
+async def arequest_openai_response(messages: list, model: str, schema: Optional[str], cache_key: Optional[str]) -> Dict:
+    try:
+        # Without a session in this context the openai library opens a new connection for every call
+        openai.aiosession.set(get_http_session())
+        # Every attempt shares one deadline, so retries never outlast the caller
+        deadline = call_deadline()
+        with stage("llm"):
+            response = await acall_with_resilience(await aschedule(messages, lambda: openai.ChatCompletion.acreate(
+                model=model,
+                messages=messages,
+                temperature=TEMPERATURE,
+                max_tokens=MAX_TOKENS,
+                request_timeout=attempt_timeout(deadline, TIMEOUT)
+            ), deadline), deadline)
+
+        record_usage(model, response.get("usage"))
+        # JSON repair is a character loop over the whole answer: kept off the event loop like the cache
+        with stage("decode"):
+            json_content = await asyncio.to_thread(parse_openai_response, response, schema)
+        if cache_key and json_content:
+            await asyncio.to_thread(response_cache.set, cache_key, json_content)
+        return json_content
+
+    except openai.error.OpenAIError as e:
+        logger.error("OpenAI API error: %s", e)
+        return {}
+    except (CircuitOpenError, DeadlineExceeded) as e:
+        logger.error("%s Failing fast.", e)
+        return {}
+    except Exception as e:
+        logger.error("Unexpected error in afetch_openai_response: %s", e)
+        return {}
+
+async def astream_openai_sections(messages: list, model: str = MODEL_NAME, use_cache: bool = True,
+                                 schema: Optional[str] = None) -> AsyncIterator[Tuple[str, Any]]:
+    """Async stream_openai_sections."""
+    cache_key = None
+    if use_cache:
+        cache_key, cached = await asyncio.to_thread(cache_lookup, messages, model)
+        if cached is not None:
+            logger.info("Serving OpenAI response from cache.")
+            for key, value in cached.items():
+                yield key, value
+            return
+
+    parser, emitted = SectionParser(), {}
+    llm_clock = StageClock("llm")
+    try:
+        openai.aiosession.set(get_http_session())
+        # Every attempt shares one deadline, so retries never outlast the caller
+        deadline = call_deadline()
+        chunks = await acall_with_resilience(await aschedule(messages, lambda: openai.ChatCompletion.acreate(
+            model=model,
+            messages=messages,
+            temperature=TEMPERATURE,
+            max_tokens=MAX_TOKENS,
+            request_timeout=attempt_timeout(deadline, TIMEOUT),
+            stream=True
+        ), deadline), deadline)
+        while True:
+            chunk = await anext(chunks, None)
+            llm_clock.pause()
+            if chunk is None:
+                break
+            delta = chunk.choices[0].delta.get("content") if chunk.choices else None
+            for key, value in parser.feed(delta or ""):
+                emitted[key] = value = conform_member(key, value, schema) if schema else value
+                yield key, value
+            llm_clock.resume()
+    except (openai.error.OpenAIError, CircuitOpenError, DeadlineExceeded) as e:
+        # Sections may already have been sent, so the caller has to see the failure
+        logger.error("OpenAI API error while streaming: %s", e)
+        raise
+    finally:
+        llm_clock.stop()
+
+    # Streamed chunks carry no usage
+    record_usage(model, await asyncio.to_thread(estimate_usage, messages, parser.text), streamed=True)
+    with stage("decode"):
+        json_content = await asyncio.to_thread(parse_json_content, parser.text.strip(), schema)
+    if not json_content:
+        raise ValueError("No usable JSON in OpenAI API response.")
+    for key, value in json_content.items():
+        if key not in emitted:
+            emitted[key] = value
+            yield key, value
+    if cache_key:
+        await asyncio.to_thread(response_cache.set, cache_key, json_content)
+
+######################### SCORES #########################################
+
+async def _ascore(prompt: str, structured_cv: Union[Dict, str], structured_job: Union[Dict, str], schema: str) -> Dict:
+    # Building the messages compacts and token-counts both documents: done in a thread
+    messages = await asyncio.to_thread(build_score_messages, prompt, structured_cv, structured_job)
+    return await afetch_openai_response(messages, schema=schema)
+
+async def aget_tehnical_score(structured_cv: Union[Dict, str], structured_job: Union[Dict, str]) -> Dict:
+    logger.info("Generating score for the job description.")
+    return await _ascore(tehnical_skills_2, structured_cv, structured_job, "score")
+
+async def aget_general_score(structured_cv: Union[Dict, str], structured_job: Union[Dict, str]) -> Dict:
+    logger.info("Generating score for the job description.")
+    return await _ascore(general_match_prompt_3, structured_cv, structured_job, "score")
+
+async def aget_domain_score(structured_cv: Union[Dict, str], structured_job: Union[Dict, str]) -> Dict:
+    logger.info("Generating score for the job description.")
+    return await _ascore(domain_1, structured_cv, structured_job, "score")
+
+async def aget_combined_score(structured_cv: Union[Dict, str], structured_job: Union[Dict, str]) -> Dict:
+    logger.info("Generating combined score for the job description.")
+    return await _ascore(combined_match_prompt, structured_cv, structured_job, "combined")
+
+########### STRUCTURE DATA #########################
+
+async def aget_structured_text_for_cv(text: str) -> Dict:
+    chunks = await asyncio.to_thread(cv_chunks, text)
+    if chunks:
+        logger.info("Structuring CV text in %d chunks.", len(chunks))
+        return await astructure_chunks(chunks, aget_structured_cv_chunk)
+
+    messages = [
+        {"role": "system", "content": cv_structuring_context},
+        {"role": "user", "content": text}
+    ]
+    logger.info("Structuring CV text.")
+    return await afetch_openai_response(messages, schema="cv")
+
+async def aget_structured_cv_chunk(chunk: str, part: int, parts: int) -> Dict:
+    messages = [
+        {"role": "system", "content": cv_structuring_context},
+        {"role": "user", "content": chunk_message(chunk, part, parts)}
+    ]
+    return await afetch_openai_response(messages, schema="cv")
+
+async def astream_structured_text_for_cv(text: str) -> AsyncIterator[Tuple[str, Any]]:
+    chunks = await asyncio.to_thread(cv_chunks, text)
+    if chunks:
+        logger.info("Structuring CV text in %d chunks for a stream.", len(chunks))
+        sections = _astream_merged(chunks)
+    else:
+        messages = [
+            {"role": "system", "content": cv_structuring_context},
+            {"role": "user", "content": text}
+        ]
+        logger.info("Streaming structured CV text.")
+        sections = astream_openai_sections(messages, schema="cv")
+    async for key, value in sections:
+        yield key, value
+
+async def _astream_merged(chunks: list) -> AsyncIterator[Tuple[str, Any]]:
+    structured_cv = await astructure_chunks(chunks, aget_structured_cv_chunk)
+    if not structured_cv:
+        raise ValueError("Structuring failed for part of the CV.")
+    for item in structured_cv.items():
+        yield item
+
+async def aget_structured_text_for_job(text: str) -> Dict:
+    messages = [
+        {"role": "system", "content": job_structuring_context},
+        {"role": "user", "content": text}
+    ]
+    logger.info("Structuring job description.")
+    return await afetch_openai_response(messages, schema="job")
+
+def astream_structured_text_for_job(text: str) -> AsyncIterator[Tuple[str, Any]]:
+    messages = [
+        {"role": "system", "content": job_structuring_context},
+        {"role": "user", "content": text}
+    ]
+    logger.info("Streaming structured job description.")
+    return astream_openai_sections(messages, schema="job")
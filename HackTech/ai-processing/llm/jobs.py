@@ -0,0 +1,299 @@
+import os
+import json
+import time
+import uuid
+import random
+import socket
+import sqlite3
+import ipaddress
+import logging
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from typing import Callable, Dict, Optional, Tuple
+from llm.metrics import Gauge, Histogram
+
+# Configure logging for this module
+logger = logging.getLogger(__name__)
+
+JOBS_ENABLED = os.getenv("JOBS_ENABLED", "1") == "1"
+JOB_STORE_PATH = os.getenv("JOB_STORE_PATH", "./cache/jobs.sqlite3")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))                         # Background structuring workers, 0 to only queue
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))               # Tries before a job is marked failed
+JOB_LEASE = float(os.getenv("JOB_LEASE", "600"))                         # Seconds before a running job of a dead worker is taken over
+JOB_RETRY_BACKOFF = float(os.getenv("JOB_RETRY_BACKOFF", "30"))          # Seconds before a failed job is retried, doubled per attempt
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))           # Idle workers check the queue this often, in seconds
+JOB_RETENTION = float(os.getenv("JOB_RETENTION", str(7 * 24 * 3600)))    # Seconds finished jobs are kept for the status endpoint
+JOB_WEBHOOK_TIMEOUT = float(os.getenv("JOB_WEBHOOK_TIMEOUT", "10"))      # Seconds per webhook delivery attempt
+JOB_WEBHOOK_ATTEMPTS = int(os.getenv("JOB_WEBHOOK_ATTEMPTS", "3"))
+# Comma-separated hosts webhooks may be sent to, private ones included; when empty any host with only public addresses
+JOB_WEBHOOK_ALLOWED_HOSTS = {host.strip().lower() for host in os.getenv("JOB_WEBHOOK_ALLOWED_HOSTS", "").split(",")
+                             if host.strip()}
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+class JobQueue:
+    """Durable SQLite queue of structuring jobs, shared by every worker and process using the same file."""
+
+    def __init__(self, path: str = JOB_STORE_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        # Autocommit; claims open their own write transaction so two processes never take the same job
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, kind TEXT NOT NULL, text TEXT NOT NULL, webhook_url TEXT, "
+            "status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, result TEXT, dedup TEXT, error TEXT, "
+            "webhook_status TEXT, created_at REAL NOT NULL, started_at REAL, finished_at REAL, lease_until REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at)")
+        self._wakeup = threading.Event()
+
+    def submit(self, kind: str, text: str, webhook_url: Optional[str] = None) -> str:
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, text, webhook_url, status, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, kind, text, webhook_url, QUEUED, time.time())
+            )
+        self.wake()
+        return job_id
+
+    def claim(self) -> Optional[Tuple[str, str, str, float]]:
+        """Take the oldest queued job that is due, or a running one whose lease expired.
+
+        Returns (id, kind, text, lease); the lease identifies this attempt to complete() and fail().
+        A queued job's lease_until is the time its retry is due.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT id, kind, text FROM jobs "
+                    "WHERE (status = ? AND (lease_until IS NULL OR lease_until <= ?)) OR (status = ? AND lease_until < ?) "
+                    "ORDER BY created_at LIMIT 1", (QUEUED, now, RUNNING, now)
+                ).fetchone()
+                if row:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = ?, attempts = attempts + 1, started_at = ?, lease_until = ? WHERE id = ?",
+                        (RUNNING, now, now + JOB_LEASE, row[0])
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return (*row, now) if row else None
+
+    def complete(self, job_id: str, lease: float, result: Dict, dedup: Dict) -> bool:
+        """Store the result; False if the lease expired and another worker took the job over."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, dedup = ?, error = NULL, finished_at = ?, lease_until = NULL "
+                "WHERE id = ? AND status = ? AND started_at = ?",
+                (DONE, json.dumps(result), json.dumps(dedup), time.time(), job_id, RUNNING, lease)
+            )
+        return cursor.rowcount == 1
+
+    def fail(self, job_id: str, lease: float, error: str) -> Optional[str]:
+        """Record a failed attempt; the job is queued again, with backoff, until JOB_MAX_ATTEMPTS.
+
+        Returns the new status, or None if the lease expired and another worker took the job over.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT attempts FROM jobs WHERE id = ? AND status = ? AND started_at = ?",
+                                     (job_id, RUNNING, lease)).fetchone()
+            if not row:
+                return None
+            final = row[0] >= JOB_MAX_ATTEMPTS
+            retry_at = None if final else now + JOB_RETRY_BACKOFF * 2 ** (row[0] - 1) * random.uniform(0.5, 1)
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ?, lease_until = ? "
+                "WHERE id = ? AND status = ? AND started_at = ?",
+                (FAILED if final else QUEUED, error, now if final else None, retry_at, job_id, RUNNING, lease)
+            )
+        if cursor.rowcount != 1:
+            return None
+        return FAILED if final else QUEUED
+
+    def set_webhook_status(self, job_id: str, webhook_status: str):
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET webhook_status = ? WHERE id = ?", (webhook_status, job_id))
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, kind, status, attempts, result, dedup, error, webhook_url, webhook_status, "
+                "created_at, started_at, finished_at FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if not row:
+            return None
+        (job_id, kind, status, attempts, result, dedup, error, webhook_url, webhook_status,
+         created_at, started_at, finished_at) = row
+        return {"job_id": job_id, "kind": kind, "status": status, "attempts": attempts,
+                "result": json.loads(result) if result else None, "dedup": json.loads(dedup) if dedup else None,
+                "error": error, "webhook_url": webhook_url, "webhook_status": webhook_status,
+                "created_at": created_at, "started_at": started_at, "finished_at": finished_at}
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0, **dict(rows)}
+
+    def prune(self, retention: float = JOB_RETENTION) -> int:
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?",
+                                        (DONE, FAILED, time.time() - retention))
+        return cursor.rowcount
+
+    def wait_for_work(self, timeout: float):
+        if self._wakeup.wait(timeout):
+            self._wakeup.clear()
+
+    def wake(self):
+        self._wakeup.set()
+
+########################## WEBHOOK #######################################
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    # A redirect could point the POST at an address the URL check refused
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+_webhook_opener = urllib.request.build_opener(_NoRedirect)
+
+def valid_webhook_url(url: str) -> bool:
+    """Only http(s) URLs of allowed hosts, or of hosts resolving to public addresses only.
+
+    Loopback, private, link-local (cloud metadata) and reserved addresses are refused, so a client
+    cannot make the service POST into its own network. Resolves the host: call it off the event loop.
+    """
+    parsed = urllib.parse.urlparse(url)
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        return False
+    host = parsed.hostname.lower()
+    if JOB_WEBHOOK_ALLOWED_HOSTS:
+        return host in JOB_WEBHOOK_ALLOWED_HOSTS
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, parsed.port or None, proto=socket.IPPROTO_TCP)}
+    except (socket.gaierror, UnicodeError, ValueError):
+        return False
+    # Scope ids ("fe80::1%eth0") are not part of the address
+    return bool(addresses) and all(ipaddress.ip_address(address.split("%")[0]).is_global for address in addresses)
+
+def deliver_webhook(url: str, payload: Dict) -> str:
+    """POST the job outcome to `url`, retrying with backoff; returns the delivery status recorded on the job."""
+    body = json.dumps(payload).encode("utf-8")
+    for attempt in range(JOB_WEBHOOK_ATTEMPTS):
+        # Checked again at delivery: the host may resolve elsewhere than when the job was submitted
+        if not valid_webhook_url(url):
+            logger.warning("Webhook URL %s is no longer allowed.", url)
+            return "refused"
+        request = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"}, method="POST")
+        try:
+            with _webhook_opener.open(request, timeout=JOB_WEBHOOK_TIMEOUT) as response:
+                return f"delivered ({response.status})"
+        except (urllib.error.URLError, OSError) as e:
+            logger.warning("Webhook delivery to %s failed (%s), attempt %s.", url, e, attempt + 1)
+            if attempt + 1 < JOB_WEBHOOK_ATTEMPTS:
+                time.sleep(random.uniform(0, 2 ** attempt))
+    return "failed"
+
+def job_response(job: Dict, result_key: str) -> Dict:
+    """Status/result body (and webhook payload): the structure under the key of the synchronous endpoint."""
+    return {"job_id": job["job_id"], "kind": job["kind"], "status": job["status"], "attempts": job["attempts"],
+            result_key: job["result"], "dedup": job["dedup"], "error": job["error"],
+            "webhook_status": job["webhook_status"], "created_at": job["created_at"],
+            "finished_at": job["finished_at"]}
+
+########################## WORKERS #######################################
+
+class JobWorkers:
+    """Background threads structuring queued jobs with `handlers[kind](text) -> (structured, dedup)`.
+
+    Sized by JOB_WORKERS independently of the web server's concurrency, so a burst of uploads waits
+    in the queue instead of holding connections open until they time out.
+    """
+
+    def __init__(self, queue: JobQueue, handlers: Dict[str, Callable[[str], Tuple[Dict, Dict]]],
+                 result_keys: Dict[str, str], workers: int = JOB_WORKERS):
+        self.queue, self.handlers, self.result_keys, self.workers = queue, handlers, result_keys, workers
+        self._threads = []
+        self._stopping = threading.Event()
+        self._last_prune = 0.0
+
+    def start(self):
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"structuring-job-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info("Started %s structuring job workers.", self.workers)
+
+    def stop(self, timeout: float = 5):
+        self._stopping.set()
+        self.queue.wake()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                job = self.queue.claim()
+            except sqlite3.Error as e:
+                logger.error("Could not claim a structuring job: %s", e)
+                job = None
+            if job is None:
+                self._maybe_prune()
+                self.queue.wait_for_work(JOB_POLL_INTERVAL)
+                continue
+            self._process(*job)
+
+    def _process(self, job_id: str, kind: str, text: str, lease: float):
+        start = time.perf_counter()
+        try:
+            structured, dedup = self.handlers[kind](text)
+            error = None if structured else f"Failed to structure {kind}."
+        except Exception as e:
+            structured, dedup, error = None, None, str(e)
+
+        if error is None:
+            status = DONE if self.queue.complete(job_id, lease, structured, dedup) else None
+        else:
+            logger.error("Structuring job %s failed: %s", job_id, error)
+            status = self.queue.fail(job_id, lease, error)
+        if status is None:
+            # Took longer than JOB_LEASE: the job belongs to the worker that took it over
+            logger.warning("Lost the lease of structuring job %s, dropping this attempt.", job_id)
+            return
+        job_duration.observe(time.perf_counter() - start, kind=kind, status=status)
+
+        if status != QUEUED:
+            job = self.queue.get(job_id)
+            if job["webhook_url"]:
+                payload = job_response(job, self.result_keys[kind])
+                self.queue.set_webhook_status(job_id, deliver_webhook(job["webhook_url"], payload))
+
+    def _maybe_prune(self):
+        if time.monotonic() - self._last_prune < 3600:
+            return
+        self._last_prune = time.monotonic()
+        removed = self.queue.prune()
+        if removed:
+            logger.info("Removed %s finished structuring jobs.", removed)
+
+
+job_queue = JobQueue() if JOBS_ENABLED else None
+
+job_duration = Histogram("structuring_job_duration_seconds", "Processing time of one structuring job attempt.",
+                         ("kind", "status"))
+job_count = Gauge("structuring_jobs", "Structuring jobs in the queue, per status.", ("status",),
+                  lambda: {(status,): count for status, count in job_queue.counts().items()} if job_queue else {})
@@ -0,0 +1,408 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, as_completed
+from contextvars import copy_context
+from typing import Dict, List, Iterator, Optional
+from llm.gpt import get_domain_score, get_tehnical_score, get_general_score, get_combined_score
+from llm.gpt_async import aget_domain_score, aget_tehnical_score, aget_general_score, aget_combined_score
+from llm.prefilter import prefilter, PREFILTER_ENABLED
+from llm.embeddings import embedding_index, rank_cvs, shortlist_cvs, SEMANTIC_TOP_N
+from llm.prompts import domain_1, tehnical_skills_2, general_match_prompt_3, combined_match_prompt
+from llm.serialization import serialize_for_llm, token_savings, count_tokens, COMPACT_PAYLOADS
+from llm.timing import stage
+from llm.resilience import llm_deadline
+
+# Configure logging for this module
+logger = logging.getLogger(__name__)
+
+MATCH_TIMEOUT = float(os.getenv("MATCH_TIMEOUT", "75"))      # Shared deadline for all scoring calls of one match, in seconds
+MATCH_WORKERS = int(os.getenv("MATCH_WORKERS", "24"))        # Threads shared by all concurrent /match requests
+MATCH_CONCURRENT = os.getenv("MATCH_CONCURRENT", "1") == "1" # Run the scoring calls at the same time by default
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "8"))         # CVs scored at the same time by one /match-batch request
+BATCH_MAX_WORKERS = int(os.getenv("BATCH_MAX_WORKERS", "32")) # Upper bound a /match-batch request may ask for
+
+# "separate": one LLM call per dimension; "combined": all dimensions from a single call
+SCORING_MODES = ("separate", "combined")
+SCORING_MODE = os.getenv("SCORING_MODE", "separate")
+
+# Scoring dimension -> (scoring function, weight in the final score)
+SCORE_DIMENSIONS = {
+    "domain": (get_domain_score, 10),
+    "tehnical": (get_tehnical_score, 30),
+    "general": (get_general_score, 60),
+}
+
+# Scoring dimension -> coroutine used by the ASGI service
+ASYNC_SCORERS = {
+    "domain": aget_domain_score,
+    "tehnical": aget_tehnical_score,
+    "general": aget_general_score,
+}
+
+SEPARATE_PROMPTS = {"domain": domain_1, "tehnical": tehnical_skills_2, "general": general_match_prompt_3}
+
+_executor = ThreadPoolExecutor(max_workers=MATCH_WORKERS, thread_name_prefix="match")
+
+########################## SCORING #######################################
+
+def _timed_score(scorer, structured_cv: Dict, structured_job: Dict, validate=None) -> Dict:
+    start = time.perf_counter()
+    try:
+        result = scorer(structured_cv, structured_job)
+        error = (validate or _validate_score)(result)
+    except Exception as e:
+        result, error = None, f"Unexpected error: {e}"
+    elapsed = round(time.perf_counter() - start, 3)
+    return {"result": result if not error else None, "elapsed": elapsed, "error": error}
+
+def _validate_score(result: Dict):
+    if not result:
+        return "Empty response from OpenAI API."
+    score = result.get("score")
+    if isinstance(score, bool) or not isinstance(score, (int, float)):
+        return "Missing or non-numeric score in OpenAI API response."
+    if not (0 <= score <= 100):
+        return "Score out of range in OpenAI API response."
+    return None
+
+def _validate_combined(result: Dict):
+    # Each dimension is validated once the combined response is split
+    return None if result else "Empty response from OpenAI API."
+
+def _split_combined(outcome: Dict) -> Dict[str, Dict]:
+    """Turn the outcome of one combined call into the per-dimension outcomes of the separate mode."""
+    combined = outcome["result"] or {}
+    outcomes = {}
+    for dimension in SCORE_DIMENSIONS:
+        result, error = None, outcome["error"]
+        if not error:
+            part = combined.get(dimension)
+            if isinstance(part, dict):
+                result = {"cv_id": combined.get("cv_id"), "job_id": combined.get("job_id"), **part}
+            error = _validate_score(result)
+        outcomes[dimension] = {"result": result if not error else None, "elapsed": outcome["elapsed"], "error": error}
+    return outcomes
+
+def score_combined(structured_cv: Dict, structured_job: Dict, timeout: float = MATCH_TIMEOUT) -> Dict[str, Dict]:
+    """Score every dimension with a single LLM call."""
+    with llm_deadline(timeout):
+        future = _executor.submit(copy_context().run, _timed_score, get_combined_score, structured_cv, structured_job,
+                                  _validate_combined)
+    wait([future], timeout=timeout)
+    if future.done():
+        return _split_combined(future.result())
+    future.cancel()
+    logger.error("Combined scoring timed out after %ss.", timeout)
+    return _split_combined({"result": None, "elapsed": timeout, "error": f"Timed out after {timeout}s."})
+
+def score_dimensions(structured_cv: Dict, structured_job: Dict, concurrent: bool = MATCH_CONCURRENT,
+                     timeout: float = MATCH_TIMEOUT) -> Dict[str, Dict]:
+    """Run every scoring dimension under one deadline and return an outcome per dimension."""
+    deadline = time.perf_counter() + timeout
+    outcomes = {}
+
+    if not concurrent:
+        with llm_deadline(timeout):
+            for dimension, (scorer, _) in SCORE_DIMENSIONS.items():
+                if time.perf_counter() >= deadline:
+                    outcomes[dimension] = {"result": None, "elapsed": 0.0, "error": "Skipped, match deadline exceeded."}
+                    continue
+                outcomes[dimension] = _timed_score(scorer, structured_cv, structured_job)
+        return outcomes
+
+    # The calls carry the match deadline: one still waiting for rate-limit budget when it passes is dropped
+    with llm_deadline(timeout):
+        futures = {
+            # Each call runs in a copy of this request's context so its stage timings are reported to it
+            dimension: _executor.submit(copy_context().run, _timed_score, scorer, structured_cv, structured_job)
+            for dimension, (scorer, _) in SCORE_DIMENSIONS.items()
+        }
+    wait(futures.values(), timeout=max(0.0, deadline - time.perf_counter()))
+
+    for dimension, future in futures.items():
+        if future.done():
+            outcomes[dimension] = future.result()
+        else:
+            # The call keeps running in the pool, but this match no longer waits for it
+            future.cancel()
+            logger.error("Scoring dimension '%s' timed out after %ss.", dimension, timeout)
+            outcomes[dimension] = {"result": None, "elapsed": timeout, "error": f"Timed out after {timeout}s."}
+    return outcomes
+
+def combine_scores(outcomes: Dict[str, Dict]) -> Dict:
+    """Build the /match response from per-dimension outcomes; 'score' is None if any dimension failed."""
+    succeeded = [outcome["result"] for outcome in outcomes.values() if outcome["result"]]
+    ids_source = (outcomes.get("domain") or {}).get("result") or (succeeded[0] if succeeded else {})
+
+    result = {
+        "cv_id": ids_source.get("cv_id"),
+        "job_id": ids_source.get("job_id"),
+    }
+    for dimension, outcome in outcomes.items():
+        dimension_result = outcome["result"] or {}
+        result[f"{dimension}_reasoning"] = dimension_result.get("reasoning")
+        result[f"{dimension}_score"] = dimension_result.get("score")
+
+    errors = {dimension: outcome["error"] for dimension, outcome in outcomes.items() if outcome["error"]}
+    if errors:
+        result["score"] = None
+        result["failed_dimensions"] = errors
+    else:
+        total_weight = sum(SCORE_DIMENSIONS[dimension][1] for dimension in outcomes)
+        result["score"] = sum(SCORE_DIMENSIONS[dimension][1] * outcome["result"]["score"]
+                              for dimension, outcome in outcomes.items()) / total_weight
+
+    result["timings"] = {dimension: outcome["elapsed"] for dimension, outcome in outcomes.items()}
+    return result
+
+def failure_message(result: Dict) -> str:
+    failed = ", ".join(f"{dimension} ({error})" for dimension, error in result["failed_dimensions"].items())
+    return f"Scoring failed for: {failed}"
+
+async def _atimed_score(scorer, structured_cv: Dict, structured_job: Dict, validate=None) -> Dict:
+    start = time.perf_counter()
+    try:
+        result = await scorer(structured_cv, structured_job)
+        error = (validate or _validate_score)(result)
+    except Exception as e:
+        result, error = None, f"Unexpected error: {e}"
+    elapsed = round(time.perf_counter() - start, 3)
+    return {"result": result if not error else None, "elapsed": elapsed, "error": error}
+
+async def ascore_dimensions(structured_cv: Dict, structured_job: Dict, timeout: float = MATCH_TIMEOUT) -> Dict[str, Dict]:
+    """Async score_dimensions: all dimensions in flight at once, late ones cancelled at the deadline."""
+    with llm_deadline(timeout):
+        tasks = {
+            dimension: asyncio.ensure_future(_atimed_score(scorer, structured_cv, structured_job))
+            for dimension, scorer in ASYNC_SCORERS.items()
+        }
+    await asyncio.wait(tasks.values(), timeout=timeout)
+
+    outcomes = {}
+    for dimension, task in tasks.items():
+        if task.done():
+            outcomes[dimension] = task.result()
+        else:
+            task.cancel()
+            logger.error("Scoring dimension '%s' timed out after %ss.", dimension, timeout)
+            outcomes[dimension] = {"result": None, "elapsed": timeout, "error": f"Timed out after {timeout}s."}
+    return outcomes
+
+async def ascore_combined(structured_cv: Dict, structured_job: Dict, timeout: float = MATCH_TIMEOUT) -> Dict[str, Dict]:
+    try:
+        with llm_deadline(timeout):
+            outcome = await asyncio.wait_for(
+                _atimed_score(aget_combined_score, structured_cv, structured_job, _validate_combined), timeout)
+    except asyncio.TimeoutError:
+        logger.error("Combined scoring timed out after %ss.", timeout)
+        outcome = {"result": None, "elapsed": timeout, "error": f"Timed out after {timeout}s."}
+    return _split_combined(outcome)
+
+def _serialization_report(structured_cv: Dict, cv_payload: str, job_tokens: Dict, mode: str) -> Dict:
+    if not COMPACT_PAYLOADS:
+        return {}
+    cv_tokens = token_savings(structured_cv, cv_payload)
+    # Every scoring prompt carries both documents
+    calls = len(SCORE_DIMENSIONS) if mode == "separate" else 1
+    return {"cv": cv_tokens, "job": job_tokens,
+            "tokens_saved": (cv_tokens["tokens_saved"] + job_tokens["tokens_saved"]) * calls}
+
+def short_circuit_result(structured_cv: Dict, structured_job: Dict, screening: Dict) -> Dict:
+    """/match response for a candidate the pre-filter ruled out, without any LLM call."""
+    reasoning = "Not scored by the LLM: " + " ".join(screening["reasons"])
+    result = {"cv_id": structured_cv.get("id"), "job_id": structured_job.get("id")}
+    for dimension in SCORE_DIMENSIONS:
+        result[f"{dimension}_reasoning"] = reasoning
+        result[f"{dimension}_score"] = 0
+    result["score"] = 0
+    result["short_circuited"] = True
+    return result
+
+########################## SESSIONS ######################################
+
+class ScoringSession:
+    """Scores CVs against one job.
+
+    The job is serialized and token-counted once when the session opens; every call then sends
+    the same system prompt + job prefix with only the CV message varying, so provider-side
+    prompt caching can reuse the prefix across the CVs of the session.
+    """
+
+    def __init__(self, structured_job: Dict, mode: str = SCORING_MODE):
+        self.structured_job = structured_job
+        self.mode = mode
+        with stage("serialize"):
+            self.job_payload = serialize_for_llm(structured_job)
+        self.job_tokens = token_savings(structured_job, self.job_payload) if COMPACT_PAYLOADS else {}
+        prompts = {"combined": combined_match_prompt} if mode == "combined" else SEPARATE_PROMPTS
+        job_message_tokens = count_tokens(f"The job is: {self.job_payload}")
+        # Tokens every call of this session shares before the CV starts
+        self.prefix_tokens = {name: count_tokens(prompt) + job_message_tokens for name, prompt in prompts.items()}
+
+    def _screen(self, structured_cv: Dict, use_prefilter: bool):
+        screening = prefilter(structured_cv, self.structured_job) if use_prefilter else None
+        if screening and not screening["worth_llm_call"]:
+            logger.info("Pre-filter skipped LLM scoring: %s", screening["reasons"])
+        return screening
+
+    def _finish(self, result: Dict, structured_cv: Dict, cv_payload: str, screening, start: float) -> Dict:
+        if cv_payload is not None:
+            result["serialization"] = _serialization_report(structured_cv, cv_payload, self.job_tokens, self.mode)
+            result["serialization"]["prefix_tokens"] = self.prefix_tokens
+        result["scoring_mode"] = self.mode
+        if screening:
+            result["prefilter"] = screening
+        result["timings"]["total"] = round(time.perf_counter() - start, 3)
+        return result
+
+    def match(self, structured_cv: Dict, concurrent: bool = MATCH_CONCURRENT, timeout: float = MATCH_TIMEOUT,
+              use_prefilter: bool = PREFILTER_ENABLED) -> Dict:
+        start = time.perf_counter()
+        screening = self._screen(structured_cv, use_prefilter)
+        if screening and not screening["worth_llm_call"]:
+            result, cv_payload = short_circuit_result(structured_cv, self.structured_job, screening), None
+            result["timings"] = {}
+        else:
+            with stage("serialize"):
+                cv_payload = serialize_for_llm(structured_cv)
+            if self.mode == "combined":
+                outcomes = score_combined(cv_payload, self.job_payload, timeout)
+            else:
+                outcomes = score_dimensions(cv_payload, self.job_payload, concurrent, timeout)
+            result = combine_scores(outcomes)
+        return self._finish(result, structured_cv, cv_payload, screening, start)
+
+    async def amatch(self, structured_cv: Dict, timeout: float = MATCH_TIMEOUT,
+                     use_prefilter: bool = PREFILTER_ENABLED) -> Dict:
+        # Pre-filter regexes, serialization and token counting are CPU work: done in threads, not on the event loop
+        start = time.perf_counter()
+        screening = await asyncio.to_thread(self._screen, structured_cv, use_prefilter)
+        if screening and not screening["worth_llm_call"]:
+            result, cv_payload = short_circuit_result(structured_cv, self.structured_job, screening), None
+            result["timings"] = {}
+        else:
+            with stage("serialize"):
+                cv_payload = await asyncio.to_thread(serialize_for_llm, structured_cv)
+            if self.mode == "combined":
+                outcomes = await ascore_combined(cv_payload, self.job_payload, timeout)
+            else:
+                outcomes = await ascore_dimensions(cv_payload, self.job_payload, timeout)
+            result = combine_scores(outcomes)
+        return await asyncio.to_thread(self._finish, result, structured_cv, cv_payload, screening, start)
+
+def match_pair(structured_cv: Dict, structured_job: Dict, concurrent: bool = MATCH_CONCURRENT,
+               timeout: float = MATCH_TIMEOUT, use_prefilter: bool = PREFILTER_ENABLED,
+               mode: str = SCORING_MODE) -> Dict:
+    return ScoringSession(structured_job, mode).match(structured_cv, concurrent, timeout, use_prefilter)
+
+async def amatch_pair(structured_cv: Dict, structured_job: Dict, timeout: float = MATCH_TIMEOUT,
+                      use_prefilter: bool = PREFILTER_ENABLED, mode: str = SCORING_MODE) -> Dict:
+    session = await asyncio.to_thread(ScoringSession, structured_job, mode)
+    return await session.amatch(structured_cv, timeout, use_prefilter)
+
+########################## BATCH #########################################
+
+def score_batch(structured_cvs: List[Dict], structured_job: Dict, max_concurrency: int = BATCH_WORKERS,
+                use_prefilter: bool = PREFILTER_ENABLED, mode: str = SCORING_MODE,
+                top_n: int = SEMANTIC_TOP_N, cancelled: Optional[threading.Event] = None) -> Iterator[Dict]:
+    """Score many CVs against one job, yielding each result as soon as its CV finishes.
+
+    Every worker scores its CV sequentially, so the number of upstream calls in flight
+    equals the number of workers. With `top_n`, only the CVs most similar to the job by
+    embeddings are sent to the LLM; the others come back first, unscored. Once `cancelled`
+    is set, no further CV is started and the batch ends after the ones in flight.
+    """
+    indexes, semantic = list(range(len(structured_cvs))), {}
+    if embedding_index and 0 < top_n < len(structured_cvs):
+        with stage("rank"):
+            indexes, semantic = rank_cvs(structured_cvs, structured_job, top_n)
+        shortlisted = set(indexes)
+        for index, structured_cv in enumerate(structured_cvs):
+            if index not in shortlisted:
+                cv_id = structured_cv.get("id") if isinstance(structured_cv, dict) else None
+                yield {"index": index, "cv_id": cv_id, "score": None, "skipped": f"Not in the embedding similarity top {top_n}.",
+                       **semantic[index]}
+
+    cancelled = cancelled or threading.Event()
+    workers = max(1, min(max_concurrency, BATCH_MAX_WORKERS, len(indexes)))
+    # The job is serialized once and every call shares its prompt prefix
+    session = ScoringSession(structured_job, mode)
+
+    def match(structured_cv: Dict) -> Optional[Dict]:
+        # A worker freed after the cancellation must not start the next CV
+        if cancelled.is_set():
+            return None
+        return session.match(structured_cv, False, MATCH_TIMEOUT, use_prefilter)
+
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="match-batch")
+    futures = {
+        # In a copy of this request's context, so its calls keep the "bulk" priority and report their stage timings
+        executor.submit(copy_context().run, match, structured_cvs[index]): index
+        for index in indexes
+    }
+    try:
+        for future in as_completed(futures):
+            if cancelled.is_set():
+                return
+            index = futures[future]
+            try:
+                result = future.result()
+                if result.get("failed_dimensions"):
+                    result["error"] = failure_message(result)
+            except Exception as e:
+                logger.error("Error scoring CV %s of batch: %s", index, e)
+                result = {"score": None, "error": str(e)}
+            yield {"index": index, **result, **semantic.get(index, {})}
+    finally:
+        # Drop the CVs that have not started yet if the batch is cancelled or abandoned
+        executor.shutdown(wait=False, cancel_futures=True)
+
+########################## RANKING #######################################
+
+def _ranked(structured_job: Dict, shortlist: List[Dict], results: List[Dict]) -> Dict:
+    ranked = []
+    for candidate, result in zip(shortlist, results):
+        if result.get("failed_dimensions"):
+            result["error"] = failure_message(result)
+        ranked.append({**result, "cv_id": result.get("cv_id") or candidate["cv_id"],
+                       "embedding_similarity": candidate["embedding_similarity"],
+                       "embedding_sections": candidate["embedding_sections"]})
+    # Best LLM score first; failed ones last, in embedding similarity order
+    ranked.sort(key=lambda result: (result["score"] is None, -(result["score"] or 0)))
+    return {"job_id": structured_job.get("id"), "indexed_cvs": embedding_index.size("cv"),
+            "embedding_backend": embedding_index.embedder.name, "results": ranked}
+
+def rank_and_score(structured_job: Dict, top_n: int, max_concurrency: int = BATCH_WORKERS,
+                   use_prefilter: bool = PREFILTER_ENABLED, mode: str = SCORING_MODE) -> Dict:
+    """Match a job against every indexed CV: one vector query, then LLM scoring of the `top_n` most similar."""
+    with stage("rank"):
+        shortlist = shortlist_cvs(structured_job, top_n)
+    if not shortlist:
+        return _ranked(structured_job, [], [])
+    session = ScoringSession(structured_job, mode)
+    workers = max(1, min(max_concurrency, BATCH_MAX_WORKERS, len(shortlist)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rank") as executor:
+        # Contexts copied here, in the request's thread: a copy made inside a worker would have neither
+        # the request's priority nor its stage timings
+        futures = [executor.submit(copy_context().run, session.match, candidate["structured_cv"], False,
+                                   MATCH_TIMEOUT, use_prefilter)
+                   for candidate in shortlist]
+        results = [future.result() for future in futures]
+    return _ranked(structured_job, shortlist, results)
+
+async def arank_and_score(structured_job: Dict, top_n: int, max_concurrency: int = BATCH_WORKERS,
+                          use_prefilter: bool = PREFILTER_ENABLED, mode: str = SCORING_MODE) -> Dict:
+    with stage("rank"):
+        shortlist = await asyncio.to_thread(shortlist_cvs, structured_job, top_n)
+    session = await asyncio.to_thread(ScoringSession, structured_job, mode)
+    semaphore = asyncio.Semaphore(max(1, min(max_concurrency, BATCH_MAX_WORKERS)))
+
+    async def score(candidate: Dict) -> Dict:
+        async with semaphore:
+            return await session.amatch(candidate["structured_cv"], MATCH_TIMEOUT, use_prefilter)
+
+    results = await asyncio.gather(*(score(candidate) for candidate in shortlist))
+    return _ranked(structured_job, shortlist, list(results))
@@ -0,0 +1,151 @@
+import os
+import re
+import logging
+from typing import Dict, List, Optional
+
+# Configure logging for this module
+logger = logging.getLogger(__name__)
+
+PREFILTER_ENABLED = os.getenv("PREFILTER_ENABLED", "0") == "1"                            # Opt-in: a gated candidate is scored 0 without an LLM call
+PREFILTER_MIN_SKILL_OVERLAP = float(os.getenv("PREFILTER_MIN_SKILL_OVERLAP", "0.15"))      # Weighted share of job skills found in the CV
+PREFILTER_MIN_EXPERIENCE_RATIO = float(os.getenv("PREFILTER_MIN_EXPERIENCE_RATIO", "0.5")) # Candidate years / required years
+PREFILTER_MAX_SENIORITY_GAP = int(os.getenv("PREFILTER_MAX_SENIORITY_GAP", "1"))           # Levels a candidate may be below the role: 0 = junior, 1 = mid, 2 = senior
+
+LEVELS = ["junior", "mid", "senior"]
+LANGUAGES = [
+    "english", "german", "french", "spanish", "italian", "portuguese", "dutch", "romanian", "hungarian", "polish",
+    "czech", "russian", "ukrainian", "swedish", "norwegian", "danish", "finnish", "greek", "turkish", "arabic",
+    "hebrew", "chinese", "mandarin", "japanese", "korean", "hindi",
+]
+
+# "Lead" and "staff" only count as titles ("tech lead", "staff engineer"): "lead the migration" says nothing
+# about seniority. "Graduate" is left out, it is as often a degree requirement as an entry-level role.
+_LEVEL_PATTERNS = [
+    (2, re.compile(r'\b(senior|sr\.|sr|principal|architect|(tech(nical)?|team|engineering) lead|'
+                   r'lead (software )?(engineer|developer|architect)|staff (software )?(engineer|developer))\b',
+                   re.IGNORECASE)),
+    (1, re.compile(r'\b(mid|middle|intermediate|regular)\b', re.IGNORECASE)),
+    (0, re.compile(r'\b(junior|jr\.|jr|entry[- ]level|intern(ship)?|trainee)\b', re.IGNORECASE)),
+]
+_YEARS_PATTERN = re.compile(r'(\d+(?:\.\d+)?)\s*\+?\s*(?:-\s*\d+\s*)?(?:years?|yrs?)\b', re.IGNORECASE)
+
+########################## HELPERS #######################################
+
+def _term_pattern(term: str):
+    # Word boundaries that keep "Java" from matching "JavaScript" and handle "C++", "C#", ".NET"
+    return re.compile(r'(?<![A-Za-z0-9+#])' + re.escape(term.strip()) + r'(?![A-Za-z0-9+#])', re.IGNORECASE)
+
+def _texts(value) -> List[str]:
+    if isinstance(value, str):
+        return [value]
+    if isinstance(value, dict):
+        return [text for item in value.values() for text in _texts(item)]
+    if isinstance(value, list):
+        return [text for item in value for text in _texts(item)]
+    return []
+
+def _number(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+def _level_from_years(years: float) -> int:
+    return 0 if years < 2 else 1 if years < 5 else 2
+
+def job_level(structured_job: Dict, required_years: Optional[float]) -> Optional[int]:
+    text = " ".join(_texts([structured_job.get("job_title"), structured_job.get("required_qualifications")]))
+    for level, pattern in _LEVEL_PATTERNS:
+        if pattern.search(text):
+            return level
+    return _level_from_years(required_years) if required_years is not None else None
+
+def required_years(structured_job: Dict) -> Optional[float]:
+    years = [float(match) for line in _texts(structured_job.get("required_qualifications"))
+             for match in _YEARS_PATTERN.findall(line)]
+    return max(years) if years else None
+
+def years_of_experience(structured_cv: Dict) -> float:
+    return sum(_number(item.get("duration")) for item in structured_cv.get("work_experience") or []
+               if isinstance(item, dict))
+
+def skill_overlap(structured_cv: Dict, structured_job: Dict) -> Dict:
+    """Weighted share of the job's skill requirements that the CV mentions."""
+    cv_skills = [skill.get("name") for skill in structured_cv.get("technical_skills") or []
+                 if isinstance(skill, dict) and skill.get("name")]
+    cv_text = " ".join(_texts(structured_cv))
+
+    # Prefer the explicit recruiter keywords when the FileHandler sends them
+    hr_requirements = [req for req in structured_job.get("hr_requirements") or []
+                       if isinstance(req, dict) and req.get("skill")]
+    if hr_requirements:
+        total = sum(_number(req.get("weight")) or 1.0 for req in hr_requirements)
+        matched = [req["skill"] for req in hr_requirements if _term_pattern(req["skill"]).search(cv_text)]
+        covered = sum(_number(req.get("weight")) or 1.0 for req in hr_requirements if req["skill"] in matched)
+        return {"overlap": covered / total if total else 0.0, "matched_skills": matched}
+
+    # Otherwise a requirement line counts as covered when it names one of the CV's skills
+    skill_patterns = [(skill, _term_pattern(skill)) for skill in cv_skills]
+    lines = [(line, 2.0) for line in _texts(structured_job.get("required_qualifications"))] + \
+            [(line, 1.0) for line in _texts(structured_job.get("preferred_skills"))]
+    if not lines:
+        return {"overlap": None, "matched_skills": []}
+    matched, covered = set(), 0.0
+    for line, weight in lines:
+        line_matches = {skill for skill, pattern in skill_patterns if pattern.search(line)}
+        if line_matches:
+            covered += weight
+            matched.update(line_matches)
+    return {"overlap": covered / sum(weight for _, weight in lines), "matched_skills": sorted(matched)}
+
+def missing_languages(structured_cv: Dict, structured_job: Dict) -> List[str]:
+    cv_languages = " ".join(_texts(structured_cv.get("foreign_languages"))).lower()
+    if not cv_languages:
+        # Nothing to compare against; let the LLM judge
+        return []
+    job_text = " ".join(_texts(structured_job.get("required_qualifications"))).lower()
+    return [language for language in LANGUAGES
+            if re.search(rf'\b{language}\b', job_text) and not re.search(rf'\b{language}\b', cv_languages)]
+
+########################## PRE-FILTER ####################################
+
+def prefilter(structured_cv: Dict, structured_job: Dict) -> Dict:
+    """Cheap, deterministic pre-score of a CV against a job, deciding whether LLM scoring is worth it."""
+    skills = skill_overlap(structured_cv, structured_job)
+    years = years_of_experience(structured_cv)
+    needed_years = required_years(structured_job)
+    level = job_level(structured_job, needed_years)
+    candidate_level = _level_from_years(years)
+    # Only a candidate below the role's level counts: being overqualified is for the LLM to weigh
+    seniority_gap = max(0, level - candidate_level) if level is not None else None
+    languages = missing_languages(structured_cv, structured_job)
+
+    reasons = []
+    if skills["overlap"] is not None and skills["overlap"] < PREFILTER_MIN_SKILL_OVERLAP:
+        reasons.append(f"Skill overlap {skills['overlap']:.2f} is below {PREFILTER_MIN_SKILL_OVERLAP}.")
+    if needed_years and years < needed_years * PREFILTER_MIN_EXPERIENCE_RATIO:
+        reasons.append(f"{years:.1f} years of experience for a role asking {needed_years:g}.")
+    if seniority_gap is not None and seniority_gap > PREFILTER_MAX_SENIORITY_GAP:
+        reasons.append(f"Candidate is {LEVELS[candidate_level]}, the role is {LEVELS[level]}.")
+    if languages:
+        reasons.append(f"Missing required languages: {', '.join(languages)}.")
+
+    # 0-100 heuristic, only meant for ordering candidates before LLM scoring
+    experience_fit = min(1.0, years / needed_years) if needed_years else 1.0
+    seniority_fit = 1.0 - seniority_gap / 2 if seniority_gap is not None else 1.0
+    overlap = skills["overlap"] if skills["overlap"] is not None else 1.0
+    score = round(100 * (0.6 * overlap + 0.25 * experience_fit + 0.15 * seniority_fit), 1)
+
+    return {
+        "score": score,
+        "skill_overlap": skills["overlap"],
+        "matched_skills": skills["matched_skills"],
+        "years_experience": round(years, 1),
+        "required_years": needed_years,
+        "job_level": LEVELS[level] if level is not None else None,
+        "candidate_level": LEVELS[candidate_level],
+        "seniority_gap": seniority_gap,
+        "missing_languages": languages,
+        "worth_llm_call": not reasons,
+        "reasons": reasons,
+    }
@@ -230,3 +230,29 @@ You are a meticulous, intuitive and highly experienced HR employee at an IT firm
 	'benefits': [text, text, /*...*/],
 }
 '''
+
+# Single-call variant of domain_1, tehnical_skills_2 and general_match_prompt_3: the three evaluations are
+# kept verbatim so both scoring modes follow the same instructions, only the output format is merged.
+combined_match_prompt = '''
+You will evaluate one CV against one job position on three independent dimensions: "domain", "tehnical" and "general".
+Evaluate each dimension on its own, exactly as its instructions below describe, without letting one evaluation influence another.
+
+## Dimension "domain"
+''' + domain_1 + '''
+## Dimension "tehnical"
+''' + tehnical_skills_2 + '''
+## Dimension "general"
+''' + general_match_prompt_3 + '''
+## Combined Output Format
+
+Ignore the output formats of the individual dimensions above and return a single JSON object:
+``` json
+{
+	"job_id": text,
+	"cv_id": text,
+	"domain": {"score": number, "reasoning": text},    // integer between 0 and 100
+	"tehnical": {"score": number, "reasoning": text},  // integer between 0 and 100
+	"general": {"score": number, "reasoning": text}    // integer between 0 and 100
+}
+```
+'''
@@ -0,0 +1,352 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Optional
+import openai
+
+# Configure logging for this module
+logger = logging.getLogger(__name__)
+
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))                 # Extra attempts after a retryable error
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))           # First backoff ceiling, doubled per attempt, in seconds
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))               # Largest backoff ceiling, in seconds
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "0") == "1"           # Fire a duplicate request when the first one is slow
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))    # Hedge once a call is slower than this latency percentile
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "1"))       # Never hedge earlier than this, in seconds
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))    # Latencies needed before hedging starts
+LLM_HEDGE_MAX_RATIO = float(os.getenv("LLM_HEDGE_MAX_RATIO", "0.1"))     # Share of calls that may be hedged
+LLM_HEDGE_WORKERS = int(os.getenv("LLM_HEDGE_WORKERS", "32"))            # Threads running hedged sync calls
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))       # Consecutive failures that open the circuit
+LLM_BREAKER_RESET = float(os.getenv("LLM_BREAKER_RESET", "30"))          # Seconds the circuit stays open before a probe call
+LLM_CALL_DEADLINE = float(os.getenv("LLM_CALL_DEADLINE", "75"))          # Seconds for one call with all its retries, keep <= MATCH_TIMEOUT
+LLM_MIN_ATTEMPT_TIME = float(os.getenv("LLM_MIN_ATTEMPT_TIME", "5"))     # No retry is started with less time than this left
+
+# Transient upstream failures; anything else (bad request, auth, ...) fails the same way on every attempt
+RETRYABLE_ERRORS = (
+    openai.error.Timeout,
+    openai.error.APIError,
+    openai.error.APIConnectionError,
+    openai.error.RateLimitError,
+    openai.error.ServiceUnavailableError,
+    openai.error.TryAgain,
+)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling upstream while the circuit breaker is open."""
+
+########################## STATE #########################################
+
+class LatencyTracker:
+    """Latencies of the most recent successful calls, for the hedging threshold."""
+
+    def __init__(self, size: int = 500):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        with self._lock:
+            if len(self._samples) < LLM_HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+class CircuitBreaker:
+    """Closed -> open after LLM_BREAKER_FAILURES consecutive failures -> half-open after LLM_BREAKER_RESET s."""
+
+    def __init__(self, failures: int = LLM_BREAKER_FAILURES, reset: float = LLM_BREAKER_RESET):
+        self.failures = failures
+        self.reset = reset
+        self._consecutive = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half-open" if time.monotonic() - self._opened_at >= self.reset else "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset or self._probing:
+                return False
+            # Half-open: let a single probe through
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._consecutive = 0
+            self._opened_at = None
+            self._probing = False
+
+    def release_probe(self):
+        # The probe ended without telling whether upstream recovered: let the next call probe instead
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive += 1
+            if self._probing or self._consecutive >= self.failures:
+                if self._opened_at is None or self._probing:
+                    logger.error("Circuit breaker opened after %s consecutive failures.", self._consecutive)
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+
+_latencies = LatencyTracker()
+breaker = CircuitBreaker()
+_hedge_executor = ThreadPoolExecutor(max_workers=LLM_HEDGE_WORKERS, thread_name_prefix="llm-hedge")
+_stats_lock = threading.Lock()
+_stats = {"calls": 0, "attempts": 0, "retries": 0, "hedges": 0, "hedge_wins": 0,
+          "failures": 0, "breaker_rejections": 0}
+
+def _count(name: str, amount: int = 1):
+    with _stats_lock:
+        _stats[name] += amount
+
+def resilience_stats() -> Dict:
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["breaker_state"] = breaker.state
+    stats["hedge_delay"] = hedge_delay()
+    return stats
+
+########################## POLICY ########################################
+
+def is_retryable(error: Exception) -> bool:
+    return isinstance(error, RETRYABLE_ERRORS)
+
+def backoff_delay(attempt: int, error: Exception = None) -> float:
+    """Full-jitter exponential backoff; a Retry-After header from a rate limit wins if it is longer."""
+    delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+    headers = getattr(error, "headers", None) or {}
+    try:
+        delay = max(delay, min(LLM_BACKOFF_MAX, float(headers.get("retry-after", 0))))
+    except (TypeError, ValueError):
+        pass
+    return delay
+
+# Deadline (time.monotonic()) of the work the current calls belong to, e.g. one /match; None for no such bound
+_deadline: ContextVar[Optional[float]] = ContextVar("llm_deadline", default=None)
+
+@contextmanager
+def llm_deadline(seconds: float):
+    """Bound the OpenAI calls made in the block (and in executors started with its context) to `seconds` from now."""
+    token = _deadline.set(time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+def call_deadline() -> float:
+    """LLM_CALL_DEADLINE from now, or the deadline of the enclosing llm_deadline() block if that is sooner."""
+    deadline, outer = time.monotonic() + LLM_CALL_DEADLINE, _deadline.get()
+    return deadline if outer is None else min(deadline, outer)
+
+def attempt_timeout(deadline: float, timeout: float) -> float:
+    """Request timeout of one attempt: `timeout`, shortened to what is left before the deadline."""
+    return max(LLM_MIN_ATTEMPT_TIME, min(timeout, deadline - time.monotonic()))
+
+def _after_error(error: Exception, attempt: int, deadline: float) -> Optional[float]:
+    """Record a failed attempt; returns the backoff before the next one, or None to give up."""
+    if not is_retryable(error):
+        # A bad request, or a local error before anything was sent: says nothing about upstream health
+        breaker.release_probe()
+        _count("failures")
+        return None
+    breaker.record_failure()
+    delay = backoff_delay(attempt, error)
+    if attempt == LLM_MAX_RETRIES or time.monotonic() + delay + LLM_MIN_ATTEMPT_TIME > deadline:
+        _count("failures")
+        return None
+    logger.warning("Retryable OpenAI error (%s), retry %s in %.2fs.", error, attempt + 1, delay)
+    _count("retries")
+    return delay
+
+def hedge_delay() -> Optional[float]:
+    """Seconds to wait before hedging, or None while hedging is off or lacks latency data."""
+    if not LLM_HEDGE_ENABLED:
+        return None
+    threshold = _latencies.percentile(LLM_HEDGE_PERCENTILE)
+    return None if threshold is None else max(LLM_HEDGE_MIN_DELAY, threshold)
+
+class _Attempt:
+    """One upstream attempt; `started` is when its request went out, after any local queueing."""
+    __slots__ = ("started", "sent")
+
+    def __init__(self, sent):
+        self.started, self.sent = None, sent  # `sent`: a threading or asyncio Event
+
+_attempt: ContextVar[Optional[_Attempt]] = ContextVar("llm_attempt", default=None)
+
+def upstream_started():
+    """Called by a `call` right before its request goes upstream, once it is done waiting for rate-limit budget.
+
+    Latencies and the hedge delay count from here; an attempt that never reports is timed from its start and
+    never hedged.
+    """
+    attempt = _attempt.get()
+    if attempt is not None and attempt.started is None:
+        attempt.started = time.perf_counter()
+        attempt.sent.set()
+
+def _hedge_allowed() -> bool:
+    with _stats_lock:
+        return _stats["hedges"] < LLM_HEDGE_MAX_RATIO * max(1, _stats["calls"])
+
+########################## SYNC ##########################################
+
+def _timed(call, attempt: _Attempt):
+    token = _attempt.set(attempt)
+    start = time.perf_counter()
+    try:
+        result = call()
+    finally:
+        _attempt.reset(token)
+    # From the moment the request went upstream: waiting for rate-limit budget is not upstream latency
+    _latencies.add(time.perf_counter() - (attempt.started or start))
+    return result
+
+def _hedged(call):
+    delay = hedge_delay()
+    if delay is None:
+        return _timed(call, _Attempt(threading.Event()))
+
+    # Each copy runs in a copy of the caller's context, so its stage timings and tokens go to the request
+    attempt = _Attempt(threading.Event())
+    primary = _hedge_executor.submit(copy_context().run, _timed, call, attempt)
+    primary.add_done_callback(lambda _: attempt.sent.set())
+    # A call still queued for rate-limit budget is not slow upstream: the hedge delay starts once it is sent
+    attempt.sent.wait()
+    if attempt.started is None:
+        return primary.result()
+    done, _ = wait([primary], timeout=max(0.0, attempt.started + delay - time.perf_counter()))
+    if done or not _hedge_allowed():
+        return primary.result()
+
+    _count("hedges")
+    hedge = _hedge_executor.submit(copy_context().run, _timed, call, _Attempt(threading.Event()))
+    pending = {primary, hedge}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                # The slower copy cannot be interrupted, its result is dropped
+                if future is hedge:
+                    _count("hedge_wins")
+                return future.result()
+            error = future.exception()
+    raise error
+
+def call_with_resilience(call, deadline: Optional[float] = None):
+    """Run `call` (one upstream request) with the circuit breaker, retries with backoff and hedging.
+
+    Retries stop at `deadline` (time.monotonic(), default LLM_CALL_DEADLINE from now); `call` should
+    size its request timeout with attempt_timeout(deadline, ...).
+    """
+    deadline = call_deadline() if deadline is None else deadline
+    _count("calls")
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        if not breaker.allow():
+            _count("breaker_rejections")
+            raise CircuitOpenError("OpenAI API circuit breaker is open.")
+        _count("attempts")
+        try:
+            result = _hedged(call)
+        except Exception as e:
+            delay = _after_error(e, attempt, deadline)
+            if delay is None:
+                raise
+            time.sleep(delay)
+        else:
+            breaker.record_success()
+            return result
+
+########################## ASYNC #########################################
+
+async def _atimed(acall, attempt: _Attempt):
+    token = _attempt.set(attempt)
+    start = time.perf_counter()
+    try:
+        result = await acall()
+    finally:
+        _attempt.reset(token)
+    _latencies.add(time.perf_counter() - (attempt.started or start))
+    return result
+
+async def _ahedged(acall):
+    delay = hedge_delay()
+    if delay is None:
+        return await _atimed(acall, _Attempt(asyncio.Event()))
+
+    attempt = _Attempt(asyncio.Event())
+    primary = asyncio.ensure_future(_atimed(acall, attempt))
+    primary.add_done_callback(lambda _: attempt.sent.set())
+    try:
+        await attempt.sent.wait()
+        if attempt.started is None:
+            return await primary
+        done, _ = await asyncio.wait([primary], timeout=max(0.0, attempt.started + delay - time.perf_counter()))
+    except asyncio.CancelledError:
+        primary.cancel()
+        raise
+    if done or not _hedge_allowed():
+        return await primary
+
+    _count("hedges")
+    hedge = asyncio.ensure_future(_atimed(acall, _Attempt(asyncio.Event())))
+    pending = {primary, hedge}
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is hedge:
+                        _count("hedge_wins")
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+async def acall_with_resilience(acall, deadline: Optional[float] = None):
+    """Async call_with_resilience; `acall` returns a new awaitable for every attempt."""
+    deadline = call_deadline() if deadline is None else deadline
+    _count("calls")
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        if not breaker.allow():
+            _count("breaker_rejections")
+            raise CircuitOpenError("OpenAI API circuit breaker is open.")
+        _count("attempts")
+        try:
+            result = await _ahedged(acall)
+        except Exception as e:
+            delay = _after_error(e, attempt, deadline)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+        else:
+            breaker.record_success()
+            return result
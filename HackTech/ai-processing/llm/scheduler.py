@@ -0,0 +1,324 @@
+import os
+import time
+import heapq
+import asyncio
+import itertools
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+import openai
+from llm.metrics import Counter, Gauge, Histogram
+from llm.timing import stage
+from llm.resilience import upstream_started
+
+# Configure logging for this module
+logger = logging.getLogger(__name__)
+
+LLM_RPM_LIMIT = int(os.getenv("LLM_RPM_LIMIT", "0"))              # Requests per minute allowed upstream, 0 for no limit
+LLM_TPM_LIMIT = int(os.getenv("LLM_TPM_LIMIT", "0"))              # Tokens per minute allowed upstream, 0 for no limit
+LLM_RATE_LIMIT_PAUSE = float(os.getenv("LLM_RATE_LIMIT_PAUSE", "1"))  # Pause after a 429 without Retry-After, in seconds
+
+# Lower runs first: a recruiter waiting on /match goes before structuring, which goes before batch work
+PRIORITIES = {"interactive": 0, "normal": 1, "bulk": 2}
+
+# Priority of the calls made while serving each endpoint; anything else runs at "normal"
+ROUTE_PRIORITIES = {"/match": "interactive", "/match-batch": "bulk"}
+
+_priority: ContextVar[str] = ContextVar("llm_priority", default="normal")
+
+def set_priority(name: str):
+    _priority.set(name)
+
+@contextmanager
+def llm_priority(name: str):
+    """Run the OpenAI calls made in the block (and in executors started with its context) at priority `name`."""
+    token = _priority.set(name)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+def current_priority() -> str:
+    return _priority.get()
+
+
+class DeadlineExceeded(Exception):
+    """Raised instead of calling upstream once the caller's deadline has passed."""
+
+
+class _Waiter:
+    __slots__ = ("rank", "seq", "priority", "tokens", "grant")
+
+    def __init__(self, priority: str, seq: int, tokens: int, grant):
+        self.rank, self.seq, self.priority, self.tokens, self.grant = PRIORITIES[priority], seq, priority, tokens, grant
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.rank, self.seq) < (other.rank, other.seq)
+
+
+class Ticket:
+    """Budget reserved for one upstream request."""
+    __slots__ = ("priority", "prompt_tokens", "tokens", "waited")
+
+    def __init__(self, priority: str, prompt_tokens: int, tokens: int, waited: float):
+        self.priority, self.prompt_tokens, self.tokens, self.waited = priority, prompt_tokens, tokens, waited
+
+
+class Scheduler:
+    """Admits upstream requests within requests-per-minute and tokens-per-minute budgets, by priority.
+
+    Both budgets are token buckets refilled continuously, so a full minute's worth can go out at once
+    after an idle period. A request reserves its prompt tokens plus the completion budget (max_tokens),
+    and the unused part is given back once the response reports its usage. Requests that do not fit
+    wait in a priority queue (FIFO within a priority) and are admitted by whoever frees budget, or by
+    a timer when only the refill can.
+    """
+
+    def __init__(self, rpm: int = LLM_RPM_LIMIT, tpm: int = LLM_TPM_LIMIT):
+        self.rpm, self.tpm = rpm, tpm
+        self._requests, self._tokens = float(rpm), float(tpm)  # Budget available now
+        self._refilled = time.monotonic()
+        self._paused_until = 0.0
+        self._queue = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._timer = None
+        self._counters = {"admitted": 0, "queued": 0, "rate_limited": 0, "withdrawn": 0}
+
+    ###################### BUDGET ######################
+
+    def _refill(self, now: float):
+        elapsed, self._refilled = now - self._refilled, now
+        if self.rpm:
+            self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        if self.tpm:
+            self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+
+    def _wait_for(self, tokens: int, now: float) -> float:
+        """Seconds until a request of `tokens` fits the budgets; 0 if it fits now."""
+        wait = self._paused_until - now
+        if self.rpm and self._requests < 1:
+            wait = max(wait, (1 - self._requests) * 60 / self.rpm)
+        if self.tpm:
+            # A request larger than the whole budget goes out on a full bucket
+            needed = min(tokens, self.tpm)
+            if self._tokens < needed:
+                wait = max(wait, (needed - self._tokens) * 60 / self.tpm)
+        return max(wait, 0.0)
+
+    def _dispatch(self):
+        # Called with the lock held: admit waiters from the head of the queue while the budgets allow
+        now = time.monotonic()
+        self._refill(now)
+        while self._queue:
+            head = self._queue[0]
+            wait = self._wait_for(head.tokens, now)
+            if wait > 0:
+                self._arm(wait)
+                return
+            heapq.heappop(self._queue)
+            self._take(head.tokens)
+            head.grant()
+
+    def _take(self, tokens: int):
+        if self.rpm:
+            self._requests -= 1
+        if self.tpm:
+            self._tokens -= tokens
+        self._counters["admitted"] += 1
+
+    def _arm(self, wait: float):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(wait, self._on_timer)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _on_timer(self):
+        with self._lock:
+            self._timer = None
+            self._dispatch()
+
+    ###################### ADMISSION ######################
+
+    def _admit_now(self, tokens: int) -> bool:
+        # With the lock held: nobody queued ahead and the budgets allow it
+        if not self._queue:
+            self._refill(time.monotonic())
+            if self._wait_for(tokens, time.monotonic()) == 0:
+                self._take(tokens)
+                return True
+        return False
+
+    def acquire(self, prompt_tokens: int, max_tokens: int, priority: str, deadline: Optional[float] = None) -> Ticket:
+        """Wait until the request fits the budgets; DeadlineExceeded once `deadline` (time.monotonic()) passes."""
+        tokens = prompt_tokens + max_tokens
+        start = time.perf_counter()
+        admitted = threading.Event()
+        waiter = None
+        with self._lock:
+            if self._admit_now(tokens):
+                admitted.set()
+            else:
+                self._counters["queued"] += 1
+                waiter = _Waiter(priority, next(self._seq), tokens, admitted.set)
+                heapq.heappush(self._queue, waiter)
+                self._dispatch()
+        # A caller that gave up (a /match past its timeout) must not keep its place and spend budget later
+        if not admitted.wait(_remaining(deadline)) or _expired(deadline):
+            self._withdraw(waiter, tokens)
+            raise DeadlineExceeded("Deadline passed while waiting for rate-limit budget.")
+        return self._ticket(priority, prompt_tokens, tokens, start)
+
+    async def aacquire(self, prompt_tokens: int, max_tokens: int, priority: str,
+                       deadline: Optional[float] = None) -> Ticket:
+        tokens = prompt_tokens + max_tokens
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        admitted = loop.create_future()
+        waiter = None
+        with self._lock:
+            if self._admit_now(tokens):
+                admitted.set_result(None)
+            else:
+                self._counters["queued"] += 1
+                # Admission may come from the timer thread
+                waiter = _Waiter(priority, next(self._seq), tokens,
+                                 lambda: loop.call_soon_threadsafe(_resolve, admitted))
+                heapq.heappush(self._queue, waiter)
+                self._dispatch()
+        try:
+            await asyncio.wait_for(admitted, _remaining(deadline))
+        except asyncio.TimeoutError:
+            self._withdraw(waiter, tokens)
+            raise DeadlineExceeded("Deadline passed while waiting for rate-limit budget.") from None
+        except asyncio.CancelledError:
+            self._withdraw(waiter, tokens)
+            raise
+        if _expired(deadline):
+            self._withdraw(waiter, tokens)
+            raise DeadlineExceeded("Deadline passed while waiting for rate-limit budget.")
+        return self._ticket(priority, prompt_tokens, tokens, start)
+
+    def _withdraw(self, waiter: Optional[_Waiter], tokens: int):
+        # The caller gave up: drop its waiter, or give the budget back if it was admitted meanwhile
+        with self._lock:
+            if waiter is not None and waiter in self._queue:
+                self._queue.remove(waiter)
+                heapq.heapify(self._queue)
+            else:
+                self._requests += 1 if self.rpm else 0
+                self._tokens += tokens if self.tpm else 0
+            self._counters["withdrawn"] += 1
+            self._dispatch()
+
+    def _ticket(self, priority: str, prompt_tokens: int, tokens: int, start: float) -> Ticket:
+        waited = time.perf_counter() - start
+        queue_wait.observe(waited, priority=priority)
+        return Ticket(priority, prompt_tokens, tokens, waited)
+
+    def settle(self, ticket: Ticket, used_tokens: Optional[int]):
+        """Give back the part of the reservation the request did not use; None keeps it all."""
+        if not self.tpm or used_tokens is None:
+            return
+        with self._lock:
+            self._tokens = min(self.tpm, self._tokens + ticket.tokens - used_tokens)
+            self._dispatch()
+
+    def pause(self, seconds: float):
+        """Hold every queued request after a 429, instead of sending more into the same limit."""
+        rate_limited.inc()
+        logger.warning("OpenAI rate limit hit, holding queued calls for %.2fs.", seconds)
+        with self._lock:
+            self._counters["rate_limited"] += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._dispatch()
+
+    ###################### STATS ######################
+
+    def queue_depths(self) -> Dict[str, int]:
+        with self._lock:
+            depths = {name: 0 for name in PRIORITIES}
+            for waiter in self._queue:
+                depths[waiter.priority] += 1
+        return depths
+
+    def stats(self) -> Dict:
+        with self._lock:
+            self._refill(time.monotonic())
+            stats = {"rpm_limit": self.rpm, "tpm_limit": self.tpm, **self._counters,
+                     "requests_available": round(self._requests, 2) if self.rpm else None,
+                     "tokens_available": int(self._tokens) if self.tpm else None,
+                     "paused_for": round(max(0.0, self._paused_until - time.monotonic()), 2)}
+        stats["queue_depth"] = self.queue_depths()
+        return stats
+
+def _remaining(deadline: Optional[float]) -> Optional[float]:
+    return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+def _expired(deadline: Optional[float]) -> bool:
+    return deadline is not None and time.monotonic() >= deadline
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+def _retry_after(error: Exception) -> float:
+    headers = getattr(error, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after", LLM_RATE_LIMIT_PAUSE))
+    except (TypeError, ValueError):
+        return LLM_RATE_LIMIT_PAUSE
+
+def _used_tokens(ticket: Ticket, response) -> Optional[int]:
+    usage = response.get("usage") if isinstance(response, dict) else None
+    if usage:
+        return (usage.get("prompt_tokens") or 0) + (usage.get("completion_tokens") or 0)
+    return None
+
+########################## SCHEDULING ####################################
+
+def scheduled(call, prompt_tokens: int, max_tokens: int, priority: str, deadline: Optional[float] = None):
+    """Run `call` (one upstream attempt) once the scheduler admits it; never after `deadline`."""
+    with stage("queue"):
+        ticket = scheduler.acquire(prompt_tokens, max_tokens, priority, deadline)
+    upstream_started()
+    try:
+        response = call()
+    except openai.error.RateLimitError as e:
+        scheduler.pause(_retry_after(e))
+        raise
+    except Exception:
+        # Nothing was generated
+        scheduler.settle(ticket, ticket.prompt_tokens)
+        raise
+    # Streams report no usage and keep their full reservation
+    scheduler.settle(ticket, _used_tokens(ticket, response))
+    return response
+
+async def ascheduled(acall, prompt_tokens: int, max_tokens: int, priority: str, deadline: Optional[float] = None):
+    """Async scheduled(); `acall` returns the awaitable of one upstream attempt."""
+    with stage("queue"):
+        ticket = await scheduler.aacquire(prompt_tokens, max_tokens, priority, deadline)
+    upstream_started()
+    try:
+        response = await acall()
+    except openai.error.RateLimitError as e:
+        scheduler.pause(_retry_after(e))
+        raise
+    except Exception:
+        scheduler.settle(ticket, ticket.prompt_tokens)
+        raise
+    scheduler.settle(ticket, _used_tokens(ticket, response))
+    return response
+
+
+scheduler = Scheduler()
+
+queue_wait = Histogram("llm_scheduler_wait_seconds", "Time OpenAI calls waited for rate-limit budget, per priority.",
+                       ("priority",))
+queue_depth = Gauge("llm_scheduler_queue_depth", "OpenAI calls waiting for rate-limit budget, per priority.",
+                    ("priority",), lambda: {(name,): depth for name, depth in scheduler.queue_depths().items()})
+rate_limited = Counter("llm_rate_limited_total", "429 responses that paused the scheduler.")
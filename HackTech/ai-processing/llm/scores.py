@@ -0,0 +1,399 @@
+import os
+import json
+import time
+import queue
+import socket
+import asyncio
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from llm import prompts
+from llm.gpt import MODEL_NAME
+from llm.documents import content_hash, document_id
+from llm.embeddings import embedding_index
+from llm.matching import ScoringSession, SCORING_MODE, SCORING_MODES
+from llm.prefilter import PREFILTER_ENABLED, PREFILTER_MIN_SKILL_OVERLAP, PREFILTER_MIN_EXPERIENCE_RATIO, PREFILTER_MAX_SENIORITY_GAP
+from llm.serialization import COMPACT_PAYLOADS, FIELD_TOKEN_BUDGET
+from llm.scheduler import llm_priority
+from llm.metrics import Counter, Gauge
+
+# Configure logging for this module
+logger = logging.getLogger(__name__)
+
+SCORE_STORE_ENABLED = os.getenv("SCORE_STORE_ENABLED", "1") == "1"
+SCORE_STORE_PATH = os.getenv("SCORE_STORE_PATH", "./cache/scores.sqlite3")
+SCORE_BACKFILL_WORKERS = int(os.getenv("SCORE_BACKFILL_WORKERS", "0"))   # Threads scoring missing CV×job pairs, 0 (default) for none
+SCORE_BACKFILL_MAX_PAIRS = int(os.getenv("SCORE_BACKFILL_MAX_PAIRS", "100"))  # Pairs all processes together may backfill per hour, 0 for no cap
+SCORE_BACKFILL_LEASE = float(os.getenv("SCORE_BACKFILL_LEASE", "600"))    # Seconds a claimed pair stays reserved for its process
+SCORE_TOP_K_MAX = int(os.getenv("SCORE_TOP_K_MAX", "100"))               # Largest k a top-k query may ask for
+
+# Prompts each scoring mode depends on: editing one of them invalidates the scores of that mode
+MODE_PROMPTS = {
+    "separate": ("domain_1", "tehnical_skills_2", "general_match_prompt_3"),
+    "combined": ("combined_match_prompt",),
+}
+
+store_lookups = Counter("score_store_lookups_total", "Pair lookups in the score store, by outcome.", ("outcome",))
+backfill_scored = Counter("score_backfill_pairs_total", "CV×job pairs scored in the background, by outcome.", ("outcome",))
+
+########################## KEYS ##########################################
+
+def prompt_version(mode: str) -> str:
+    # Everything that changes what the LLM is sent, or which pairs the pre-filter scores 0 without it
+    settings = (MODEL_NAME, mode, COMPACT_PAYLOADS, FIELD_TOKEN_BUDGET, PREFILTER_MIN_SKILL_OVERLAP,
+                PREFILTER_MIN_EXPERIENCE_RATIO, PREFILTER_MAX_SENIORITY_GAP)
+    digest = hashlib.sha256("\0".join(map(str, settings)).encode("utf-8"))
+    for name in MODE_PROMPTS[mode]:
+        digest.update(getattr(prompts, name).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+PROMPT_VERSIONS = {mode: prompt_version(mode) for mode in SCORING_MODES}
+
+########################## STORE #########################################
+
+class ScoreStore:
+    """SQLite CV×job score matrix keyed by (cv_id, job_id, prompt version), valid for given content hashes.
+
+    The latest structure of every CV and job seen is kept as well: it tells which stored scores are
+    stale (a document changed) and which pairs are still missing.
+    """
+
+    def __init__(self, path: str = SCORE_STORE_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        # Several processes share the file: backfill claims wait for each other's write transactions
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS score_documents ("
+            "kind TEXT NOT NULL, doc_id TEXT NOT NULL, content_hash TEXT NOT NULL, structured TEXT NOT NULL, "
+            "updated_at REAL NOT NULL, PRIMARY KEY (kind, doc_id))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS scores ("
+            "cv_id TEXT NOT NULL, job_id TEXT NOT NULL, prompt_version TEXT NOT NULL, cv_hash TEXT NOT NULL, "
+            "job_hash TEXT NOT NULL, score REAL NOT NULL, result TEXT NOT NULL, created_at REAL NOT NULL, "
+            "PRIMARY KEY (cv_id, job_id, prompt_version))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_scores_job ON scores(job_id, prompt_version, score DESC)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_scores_cv ON scores(cv_id, prompt_version, score DESC)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_scores_content ON scores(cv_hash, job_hash, prompt_version)")
+        # Pairs taken by a backfill worker of some process; also what the hourly backfill budget counts
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS score_claims ("
+            "cv_id TEXT NOT NULL, job_id TEXT NOT NULL, prompt_version TEXT NOT NULL, owner TEXT NOT NULL, "
+            "claimed_at REAL NOT NULL, lease_until REAL NOT NULL, PRIMARY KEY (cv_id, job_id, prompt_version))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_score_claims_time ON score_claims(claimed_at)")
+        self._conn.commit()
+
+    def register(self, kind: str, doc_id: str, structured: Dict) -> bool:
+        """Record the current structure of a document; returns True if it is new or changed."""
+        new_hash = content_hash(structured)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content_hash FROM score_documents WHERE kind = ? AND doc_id = ?", (kind, doc_id)
+            ).fetchone()
+            if row and row[0] == new_hash:
+                return False
+            self._conn.execute(
+                "INSERT OR REPLACE INTO score_documents (kind, doc_id, content_hash, structured, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)", (kind, doc_id, new_hash, json.dumps(structured), time.time())
+            )
+            if row:
+                # The document changed: its scores no longer hold
+                column = "cv" if kind == "cv" else "job"
+                removed = self._conn.execute(
+                    f"DELETE FROM scores WHERE {column}_id = ? AND {column}_hash != ?", (doc_id, new_hash)
+                ).rowcount
+                logger.info("%s %s changed, invalidated %s stored scores.", kind, doc_id, removed)
+            self._conn.commit()
+        return True
+
+    def document(self, kind: str, doc_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT structured FROM score_documents WHERE kind = ? AND doc_id = ?", (kind, doc_id)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get(self, cv_id: str, job_id: str, cv_hash: str, job_hash: str, version: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT result FROM scores WHERE cv_id = ? AND job_id = ? AND prompt_version = ? "
+                "AND cv_hash = ? AND job_hash = ?", (cv_id, job_id, version, cv_hash, job_hash)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def find(self, cv_hash: str, job_hash: str, version: str) -> Optional[Dict]:
+        """Latest result for these document contents, whatever ids it was stored under."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT result FROM scores WHERE cv_hash = ? AND job_hash = ? AND prompt_version = ? "
+                "ORDER BY created_at DESC LIMIT 1", (cv_hash, job_hash, version)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, cv_id: str, job_id: str, cv_hash: str, job_hash: str, version: str, result: Dict):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO scores (cv_id, job_id, prompt_version, cv_hash, job_hash, score, result, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (cv_id, job_id, version, cv_hash, job_hash, result["score"], json.dumps(result), time.time())
+            )
+            self._conn.commit()
+
+    def top(self, kind: str, doc_id: str, version: str, k: int) -> List[Dict]:
+        """Best stored scores of the CVs for job `doc_id` (kind "job"), or of the jobs for CV `doc_id` (kind "cv")."""
+        anchor, other = ("job", "cv") if kind == "job" else ("cv", "job")
+        # Joined with the current documents, so a score of an older version of either one never shows up
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT s.{other}_id, s.score, s.result, s.created_at FROM scores s "
+                "JOIN score_documents c ON c.kind = 'cv' AND c.doc_id = s.cv_id AND c.content_hash = s.cv_hash "
+                "JOIN score_documents j ON j.kind = 'job' AND j.doc_id = s.job_id AND j.content_hash = s.job_hash "
+                f"WHERE s.{anchor}_id = ? AND s.prompt_version = ? ORDER BY s.score DESC LIMIT ?",
+                (doc_id, version, k)
+            ).fetchall()
+        return [{f"{other}_id": other_id, "score": score, "scored_at": created_at, "result": json.loads(result)}
+                for other_id, score, result, created_at in rows]
+
+    def missing_pairs(self, version: str, cv_id: Optional[str] = None, job_id: Optional[str] = None) -> List[Tuple[str, str]]:
+        """(cv_id, job_id) of the known documents without a valid score, optionally for one CV or job."""
+        query = ("SELECT c.doc_id, j.doc_id FROM score_documents c JOIN score_documents j ON j.kind = 'job' "
+                 "LEFT JOIN scores s ON s.cv_id = c.doc_id AND s.job_id = j.doc_id AND s.prompt_version = ? "
+                 "AND s.cv_hash = c.content_hash AND s.job_hash = j.content_hash "
+                 "WHERE c.kind = 'cv' AND s.cv_id IS NULL")
+        params = [version]
+        if cv_id is not None:
+            query += " AND c.doc_id = ?"
+            params.append(cv_id)
+        if job_id is not None:
+            query += " AND j.doc_id = ?"
+            params.append(job_id)
+        with self._lock:
+            return self._conn.execute(query, params).fetchall()
+
+    def claim(self, cv_id: str, job_id: str, version: str, owner: str, lease: float = SCORE_BACKFILL_LEASE,
+              max_per_hour: int = SCORE_BACKFILL_MAX_PAIRS) -> str:
+        """Reserve a pair for background scoring across processes: "claimed", "taken" or "budget" (cap reached)."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM score_claims WHERE claimed_at < ? AND lease_until < ?", (now - 3600, now))
+                held = self._conn.execute(
+                    "SELECT lease_until FROM score_claims WHERE cv_id = ? AND job_id = ? AND prompt_version = ?",
+                    (cv_id, job_id, version)
+                ).fetchone()
+                if held and held[0] >= now:
+                    status = "taken"
+                elif max_per_hour and self._conn.execute(
+                        "SELECT COUNT(*) FROM score_claims WHERE claimed_at >= ?", (now - 3600,)).fetchone()[0] >= max_per_hour:
+                    status = "budget"
+                else:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO score_claims (cv_id, job_id, prompt_version, owner, claimed_at, lease_until) "
+                        "VALUES (?, ?, ?, ?, ?, ?)", (cv_id, job_id, version, owner, now, now + lease)
+                    )
+                    status = "claimed"
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+        return status
+
+    def drop_other_versions(self, versions: List[str]) -> int:
+        """Delete the scores computed with prompts that have since changed."""
+        with self._lock:
+            removed = self._conn.execute(
+                f"DELETE FROM scores WHERE prompt_version NOT IN ({', '.join('?' for _ in versions)})", versions
+            ).rowcount
+            self._conn.commit()
+        if removed:
+            logger.info("Scoring prompts changed, invalidated %s stored scores.", removed)
+        return removed
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            documents = dict(self._conn.execute("SELECT kind, COUNT(*) FROM score_documents GROUP BY kind").fetchall())
+            scores = self._conn.execute("SELECT COUNT(*) FROM scores").fetchone()[0]
+        return {"cvs": documents.get("cv", 0), "jobs": documents.get("job", 0), "scores": scores}
+
+########################## BACKFILL ######################################
+
+class ScoreBackfill:
+    """Background threads scoring the missing pairs of newly seen documents at "bulk" scheduler priority.
+
+    Off unless SCORE_BACKFILL_WORKERS is set. Every pair is claimed in the store first, so the workers of
+    all processes sharing it score each pair once, within SCORE_BACKFILL_MAX_PAIRS per hour between them.
+    The threads start with the first document tracked, never at import.
+    """
+
+    def __init__(self, store: ScoreStore, workers: int = SCORE_BACKFILL_WORKERS, mode: str = SCORING_MODE):
+        self.store, self.workers, self.mode = store, workers, mode
+        self.version = PROMPT_VERSIONS[mode]
+        self._queue = queue.Queue()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._threads = []
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+
+    def start(self) -> bool:
+        """Start the workers; returns False if they were already running (or are disabled)."""
+        with self._lock:
+            if self._threads or self.workers <= 0:
+                return False
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"score-backfill-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        # Pairs left over from before a restart, or invalidated by a prompt change
+        self._enqueue()
+        return True
+
+    def enqueue_missing(self, cv_id: Optional[str] = None, job_id: Optional[str] = None) -> int:
+        if self.workers <= 0 or self.start():
+            # Starting queued every missing pair already
+            return 0
+        return self._enqueue(cv_id, job_id)
+
+    def _enqueue(self, cv_id: Optional[str] = None, job_id: Optional[str] = None) -> int:
+        added = 0
+        for pair in self.store.missing_pairs(self.version, cv_id, job_id):
+            with self._lock:
+                if pair in self._pending:
+                    continue
+                self._pending.add(pair)
+            self._queue.put(pair)
+            added += 1
+        if added:
+            logger.info("Queued %s CV×job pairs for background scoring.", added)
+        return added
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def _run(self):
+        while True:
+            cv_id, job_id = self._queue.get()
+            try:
+                self._score(cv_id, job_id)
+            except Exception as e:
+                backfill_scored.inc(outcome="error")
+                logger.error("Background scoring of CV %s for job %s failed: %s", cv_id, job_id, e)
+            finally:
+                with self._lock:
+                    self._pending.discard((cv_id, job_id))
+
+    def _score(self, cv_id: str, job_id: str):
+        structured_cv, structured_job = self.store.document("cv", cv_id), self.store.document("job", job_id)
+        if structured_cv is None or structured_job is None:
+            return
+        cv_hash, job_hash = content_hash(structured_cv), content_hash(structured_job)
+        if self.store.get(cv_id, job_id, cv_hash, job_hash, self.version) is not None:
+            return
+        claim = self.store.claim(cv_id, job_id, self.version, self.owner)
+        if claim != "claimed":
+            # Another process is on it, or the hourly budget is spent: the pair is queued again on a later change
+            backfill_scored.inc(outcome=claim)
+            return
+        with llm_priority("bulk"):
+            result = ScoringSession(structured_job, self.mode).match(structured_cv, concurrent=False,
+                                                                     use_prefilter=PREFILTER_ENABLED)
+        if result.get("score") is None:
+            backfill_scored.inc(outcome="failed")
+            return
+        self.store.put(cv_id, job_id, cv_hash, job_hash, self.version, result)
+        backfill_scored.inc(outcome="scored")
+
+
+score_store = ScoreStore() if SCORE_STORE_ENABLED else None
+if score_store:
+    score_store.drop_other_versions(list(PROMPT_VERSIONS.values()))
+score_backfill = ScoreBackfill(score_store) if score_store else None
+
+backfill_pending = Gauge("score_backfill_pending", "CV×job pairs waiting for background scoring.", (),
+                         lambda: {(): score_backfill.pending()} if score_backfill else {})
+
+########################## SERVICE #######################################
+
+def track_document(kind: str, structured: Dict):
+    """Remember a structured CV/job for semantic ranking and, if it is new or changed, queue its missing pairs."""
+    doc_id = document_id(structured)
+    if doc_id is None:
+        return
+    if embedding_index:
+        embedding_index.add(kind, doc_id, structured)
+    if score_store and score_store.register(kind, doc_id, structured):
+        score_backfill.enqueue_missing(**{f"{kind}_id": doc_id})
+
+def _lookup(structured_cv: Dict, structured_job: Dict, mode: str, use_prefilter: bool) -> Tuple[Optional[Dict], Tuple]:
+    """Return (stored result or None, what to store a new result under)."""
+    cv_id, job_id = document_id(structured_cv), document_id(structured_job)
+    key = (cv_id, job_id, content_hash(structured_cv), content_hash(structured_job), PROMPT_VERSIONS[mode])
+    if cv_id and job_id:
+        track_document("cv", structured_cv)
+        track_document("job", structured_job)
+        stored = score_store.get(*key)
+    else:
+        # Documents without an id are stored under the ids the domain score extracted (see _save): found by content
+        stored = score_store.find(*key[2:])
+    # A pre-filter verdict does not answer a request that turned the pre-filter off
+    if stored is not None and (use_prefilter or not stored.get("short_circuited")):
+        store_lookups.inc(outcome="hit")
+        return {**stored, "stored": True}, key
+    store_lookups.inc(outcome="miss")
+    return None, key
+
+def _save(key: Tuple, result: Dict, structured_cv: Dict, structured_job: Dict):
+    cv_id, job_id, cv_hash, job_hash, version = key
+    if result.get("score") is None or result.get("failed_dimensions"):
+        return
+    if not (cv_id and job_id):
+        # Without ids in the documents, fall back to the ones the domain score extracted
+        cv_id, job_id = cv_id or document_id({"id": result.get("cv_id")}), job_id or document_id({"id": result.get("job_id")})
+        if not (cv_id and job_id):
+            return
+        score_store.put(cv_id, job_id, cv_hash, job_hash, version, result)
+        track_document("cv", {**structured_cv, "id": cv_id})
+        track_document("job", {**structured_job, "id": job_id})
+        return
+    score_store.put(cv_id, job_id, cv_hash, job_hash, version, result)
+
+def stored_match(structured_cv: Dict, structured_job: Dict, mode: str, use_prefilter: bool,
+                 score: Callable[[], Dict]) -> Dict:
+    """Answer /match from the score store when the pair was already scored with the same documents and prompts."""
+    if not score_store:
+        return score()
+    stored, key = _lookup(structured_cv, structured_job, mode, use_prefilter)
+    if stored is not None:
+        return stored
+    result = score()
+    _save(key, result, structured_cv, structured_job)
+    return result
+
+async def astored_match(structured_cv: Dict, structured_job: Dict, mode: str, use_prefilter: bool,
+                        ascore: Callable[[], Awaitable[Dict]]) -> Dict:
+    """Async stored_match; the store is used off the event loop."""
+    if not score_store:
+        return await ascore()
+    stored, key = await asyncio.to_thread(_lookup, structured_cv, structured_job, mode, use_prefilter)
+    if stored is not None:
+        return stored
+    result = await ascore()
+    await asyncio.to_thread(_save, key, result, structured_cv, structured_job)
+    return result
+
+def top_matches(kind: str, doc_id: str, k: int, mode: str = SCORING_MODE) -> Dict:
+    """Top-k response: the best CVs for a job (kind "job") or the best jobs for a CV (kind "cv")."""
+    version = PROMPT_VERSIONS[mode]
+    results = score_store.top(kind, doc_id, version, min(k, SCORE_TOP_K_MAX))
+    missing = score_store.missing_pairs(version, **{f"{kind}_id": doc_id})
+    return {f"{kind}_id": doc_id, "scoring_mode": mode, "prompt_version": version, "results": results,
+            "missing_pairs": len(missing), "known": score_store.document(kind, doc_id) is not None}
@@ -0,0 +1,65 @@
+import os
+import json
+import logging
+from typing import Dict, Union
+
+# Configure logging for this module
+logger = logging.getLogger(__name__)
+
+COMPACT_PAYLOADS = os.getenv("COMPACT_PAYLOADS", "1") == "1"           # Set to 0 to send json.dumps() verbatim
+FIELD_TOKEN_BUDGET = int(os.getenv("FIELD_TOKEN_BUDGET", "256"))       # Longest free-text field sent to the LLM, in tokens
+TOKENIZER_MODEL = os.getenv("TOKENIZER_MODEL", "gpt-4o")
+TRUNCATION_MARKER = "..."
+
+try:
+    import tiktoken
+    _encoding = tiktoken.encoding_for_model(TOKENIZER_MODEL)
+except Exception as e:  # tiktoken missing, or its BPE files cannot be downloaded
+    logger.warning("tiktoken unavailable (%s), falling back to approximate token counts.", e)
+    _encoding = None
+
+########################## TOKENS ########################################
+
+def count_tokens(text: str) -> int:
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return (len(text) + 3) // 4
+
+def truncate_to_tokens(text: str, budget: int) -> str:
+    if _encoding is not None:
+        tokens = _encoding.encode(text)
+        if len(tokens) <= budget:
+            return text
+        return _encoding.decode(tokens[:budget]).rstrip() + TRUNCATION_MARKER
+    if len(text) <= budget * 4:
+        return text
+    return text[:budget * 4].rstrip() + TRUNCATION_MARKER
+
+########################## SERIALIZATION #################################
+
+def compact(value, budget: int = FIELD_TOKEN_BUDGET):
+    """Drop null/empty fields recursively and cut over-long strings to `budget` tokens."""
+    if isinstance(value, dict):
+        compacted = {key: compact(item, budget) for key, item in value.items()}
+        return {key: item for key, item in compacted.items() if item not in (None, "", [], {})}
+    if isinstance(value, list):
+        compacted = [compact(item, budget) for item in value]
+        return [item for item in compacted if item not in (None, "", [], {})]
+    if isinstance(value, str):
+        value = value.strip()
+        # Cheap length check first: a string never has more tokens than UTF-8 bytes
+        return truncate_to_tokens(value, budget) if len(value.encode("utf-8")) > budget else value
+    return value
+
+def serialize_for_llm(document: Union[Dict, str]) -> str:
+    """Serialize a structured CV/job for a prompt; strings are taken as already serialized."""
+    if isinstance(document, str):
+        return document
+    if not COMPACT_PAYLOADS:
+        return json.dumps(document)
+    return json.dumps(compact(document), separators=(",", ":"), ensure_ascii=False)
+
+def token_savings(document: Dict, serialized: str) -> Dict:
+    tokens_before = count_tokens(json.dumps(document))
+    tokens_after = count_tokens(serialized)
+    return {"tokens_before": tokens_before, "tokens_after": tokens_after, "tokens_saved": tokens_before - tokens_after}
@@ -0,0 +1,119 @@
+import os
+import copy
+import asyncio
+import logging
+import threading
+from typing import Any, Awaitable, Callable, Dict
+from llm.metrics import Counter
+from llm.timing import stage
+
+# Configure logging for this module
+logger = logging.getLogger(__name__)
+
+LLM_SINGLE_FLIGHT = os.getenv("LLM_SINGLE_FLIGHT", "1") == "1"  # Set to 0 to send every call upstream
+
+single_flight_calls = Counter("llm_single_flight_calls_total",
+                              "OpenAI calls by single-flight role: leader (sent upstream) or follower (collapsed).",
+                              ("role",))
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Collapses concurrent identical calls: the first caller of a key runs it, the others wait for its result.
+
+    Nothing is kept once the call returns (that is the response cache's job). Followers get a deep copy,
+    so a caller mutating its result cannot affect the others.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self._futures: Dict[str, asyncio.Future] = {}  # Keys in flight in this process' event loop
+        self._lock = threading.Lock()
+        self._counters = {"leaders": 0, "followers": 0}
+
+    def _count(self, role: str):
+        single_flight_calls.inc(role=role[:-1])
+        with self._lock:
+            self._counters[role] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"enabled": LLM_SINGLE_FLIGHT, **self._counters}
+
+    def do(self, key: str, call: Callable[[], Any]) -> Any:
+        if not LLM_SINGLE_FLIGHT:
+            return call()
+        with self._lock:
+            in_flight = self._calls.get(key)
+            if in_flight is None:
+                in_flight = self._calls[key] = _Call()
+                leader = True
+            else:
+                leader = False
+
+        if not leader:
+            self._count("followers")
+            logger.info("Joining an identical OpenAI call in flight.")
+            with stage("coalesced"):
+                in_flight.done.wait()
+            if in_flight.error is not None:
+                raise in_flight.error
+            return copy.deepcopy(in_flight.result)
+
+        self._count("leaders")
+        try:
+            in_flight.result = call()
+            return in_flight.result
+        except BaseException as e:
+            in_flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            in_flight.done.set()
+
+    async def ado(self, key: str, acall: Callable[[], Awaitable[Any]]) -> Any:
+        if not LLM_SINGLE_FLIGHT:
+            return await acall()
+        future = self._futures.get(key)
+        while future is not None:
+            logger.info("Joining an identical OpenAI call in flight.")
+            try:
+                with stage("coalesced"):
+                    # Shielded: a follower going away must not cancel the leader's call
+                    result = await asyncio.shield(future)
+                self._count("followers")
+                return copy.deepcopy(result)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # The leader's request was cancelled: the first follower to get here takes over
+                future = self._futures.get(key)
+                if future is not None and future.cancelled():
+                    future = None
+
+        self._count("leaders")
+        future = self._futures[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await acall()
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # Retrieved here; followers still get it raised
+            raise
+        finally:
+            if self._futures.get(key) is future:
+                del self._futures[key]
+
+
+single_flight = SingleFlight()
@@ -0,0 +1,68 @@
+import json
+import logging
+from typing import Any, List, Tuple
+
+# Configure logging for this module
+logger = logging.getLogger(__name__)
+
+
+class SectionParser:
+    """Incremental parser for the top-level members of a streamed JSON object.
+
+    feed() takes the completion as it arrives and returns the (key, value) pairs of the members
+    that were completed by that chunk, so each section of a structured CV/job can be passed on
+    before the rest is generated. Text before the opening brace (e.g. a ```json fence) and after
+    the closing one is ignored.
+    """
+
+    def __init__(self):
+        self.text = ""          # Everything received so far
+        self.done = False       # The closing brace of the object was seen
+        self._position = 0      # Next character of `text` to scan
+        self._start = None      # Index of the opening brace
+        self._member = None     # Index where the current top-level member starts
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        self.text += chunk
+        completed = []
+        while self._position < len(self.text) and not self.done:
+            char = self.text[self._position]
+            if self._start is None:
+                if char == "{":
+                    self._start = self._member = self._position + 1
+                    self._depth = 1
+            elif self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    completed += self._close_member(self._position)
+                    self.done = True
+            elif char == "," and self._depth == 1:
+                completed += self._close_member(self._position)
+                self._member = self._position + 1
+            self._position += 1
+        return completed
+
+    def _close_member(self, end: int) -> List[Tuple[str, Any]]:
+        member = self.text[self._member:end].strip()
+        if not member:
+            return []
+        try:
+            return list(json.loads("{" + member + "}").items())
+        except json.JSONDecodeError as e:
+            # Left to the parse of the full completion
+            logger.warning("Could not parse streamed member (%s): %s", e, member[:80])
+            return []
@@ -0,0 +1,85 @@
+import time
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+from llm.metrics import stage_latency, llm_tokens, llm_calls
+
+# Seconds spent per stage by the current request; None outside a request
+_stages: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_stages", default=None)
+# Tokens used by the OpenAI calls of the current request
+_tokens: ContextVar[Optional[Dict[str, int]]] = ContextVar("request_tokens", default=None)
+_lock = threading.Lock()
+
+def begin_request() -> Dict[str, float]:
+    stages = {}
+    _stages.set(stages)
+    _tokens.set({})
+    return stages
+
+def request_stages() -> Optional[Dict[str, float]]:
+    return _stages.get()
+
+def request_tokens() -> Optional[Dict[str, int]]:
+    return _tokens.get()
+
+def _record(name: str, elapsed: float):
+    stage_latency.observe(elapsed, stage=name)
+    stages = _stages.get()
+    if stages is not None:
+        with _lock:
+            stages[name] = stages.get(name, 0.0) + elapsed
+
+@contextmanager
+def stage(name: str):
+    """Add the time spent in the block to stage `name` of the current request."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record(name, time.perf_counter() - start)
+
+
+class StageClock:
+    """Stage `name` made of several separate stretches, e.g. the waits for the chunks of a stream.
+
+    Runs from creation; pause() and resume() around the time that does not belong to the stage,
+    and stop() reports the total as one observation.
+    """
+
+    def __init__(self, name: str):
+        self.name, self.elapsed, self._since = name, 0.0, time.perf_counter()
+
+    def pause(self):
+        if self._since is not None:
+            self.elapsed += time.perf_counter() - self._since
+            self._since = None
+
+    def resume(self):
+        if self._since is None:
+            self._since = time.perf_counter()
+
+    def stop(self):
+        self.pause()
+        _record(self.name, self.elapsed)
+
+def record_usage(model: str, usage, streamed: bool = False):
+    """Count the prompt/completion tokens of one OpenAI call, globally and for the current request."""
+    llm_calls.inc(model=model, streamed=str(streamed).lower())
+    if not usage:
+        return
+    tokens = _tokens.get()
+    for kind in ("prompt", "completion"):
+        count = usage.get(f"{kind}_tokens") or 0
+        llm_tokens.inc(count, model=model, kind=kind)
+        if tokens is not None:
+            with _lock:
+                tokens[kind] = tokens.get(kind, 0) + count
+
+def server_timing(stages: Dict[str, float]) -> str:
+    # Server-Timing header: durations in milliseconds
+    return ", ".join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in stages.items())
+
+def token_header(tokens: Dict[str, int]) -> str:
+    # X-LLM-Tokens header, e.g. "prompt=1830, completion=212"
+    return ", ".join(f"{kind}={count}" for kind, count in tokens.items())
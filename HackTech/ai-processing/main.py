@@ -1,8 +1,23 @@
 # main.py
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
-from llm.gpt import get_structured_text_for_cv, get_structured_text_for_job, get_general_score, get_tehnical_score, get_domain_score
+from llm.gpt import get_structured_text_for_cv, get_structured_text_for_job, stream_structured_text_for_cv, stream_structured_text_for_job
+from llm.cache import response_cache
+from llm.documents import structure_with_dedup, stream_with_dedup
+from llm.matching import match_pair, score_batch, rank_and_score, failure_message, MATCH_CONCURRENT, BATCH_WORKERS, SCORING_MODE, SCORING_MODES
+from llm.embeddings import embedding_index, SEMANTIC_TOP_N, SEMANTIC_TOP_N_MAX
+from llm.prefilter import PREFILTER_ENABLED
+from llm.resilience import resilience_stats
+from llm.extraction import extraction_stats
+from llm.singleflight import single_flight
+from llm.scheduler import scheduler, set_priority, ROUTE_PRIORITIES
+from llm.jobs import job_queue, job_response, valid_webhook_url, JobWorkers
+from llm.scores import score_store, stored_match, top_matches, track_document
+from llm.timing import begin_request, request_stages, request_tokens, server_timing, token_header, stage
+from llm.metrics import request_latency, render_metrics, METRICS_CONTENT_TYPE
+import json
+import time
 import logging
 
 # Configure logging
@@ -13,11 +28,52 @@ logging.disable(logging.CRITICAL)
 app = Flask(__name__)
 CORS(app)
 
+# Async job mode: structuring jobs queued by /structure-cv/jobs and /structure-job/jobs
+def structure_and_track(kind: str, text: str, structure):
+    structured, dedup = structure_with_dedup(kind, text, structure)
+    if structured:
+        track_document(kind, structured)
+    return structured, dedup
+
+JOB_HANDLERS = {
+    "cv": lambda text: structure_and_track("cv", text, get_structured_text_for_cv),
+    "job": lambda text: structure_and_track("job", text, get_structured_text_for_job),
+}
+JOB_RESULT_KEYS = {"cv": "structured_cv", "job": "structured_job"}
+job_workers = JobWorkers(job_queue, JOB_HANDLERS, JOB_RESULT_KEYS) if job_queue else None
+if job_workers:
+    job_workers.start()
+
+@app.before_request
+def start_stage_timings():
+    g.request_start = time.perf_counter()
+    begin_request()
+    set_priority(ROUTE_PRIORITIES.get(request.path, "normal"))
+    # Flask keeps the parsed body, so the handlers' get_json() calls below are free
+    with stage("parse"):
+        request.get_json(silent=True)
+
+@app.after_request
+def add_server_timing(response):
+    # Per-stage durations (parse, serialize, llm, decode) for benchmarks/load_test.py
+    stages, tokens = request_stages(), request_tokens()
+    if stages:
+        response.headers["Server-Timing"] = server_timing(stages)
+    if tokens:
+        response.headers["X-LLM-Tokens"] = token_header(tokens)
+    # Streamed responses are timed to their headers
+    elapsed = time.perf_counter() - g.get("request_start", time.perf_counter())
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    request_latency.observe(elapsed, endpoint=endpoint, status=response.status_code)
+    logger.info("%s %s %s in %.1f ms, stages %s, tokens %s", request.method, endpoint, response.status_code,
+                elapsed * 1000, stages, tokens)
+    return response
+
 @app.route("/structure-cv", methods=["POST"])
 def structure_cv():
     # Log the incoming JSON payload
     incoming_json = request.get_json()
-    logger.debug(f"Incoming JSON Payload: {incoming_json}")
+    logger.debug("Incoming JSON Payload: %s", incoming_json)
     
     if not incoming_json:
         logger.error("No JSON payload received.")
@@ -30,29 +86,29 @@ def structure_cv():
         return jsonify({"structured_cv": None, "error": "Missing 'text_cv' in request data."}), 400
 
     logger.info("Received /structure-cv request.")
-    logger.debug(f"text_cv: {text_cv}")
+    logger.debug("text_cv: %s", text_cv)
 
     try:
         # Get structured CV
         logger.info("Calling get_structured_text_for_cv.")
-        structured_text = get_structured_text_for_cv(text_cv)
+        structured_text, dedup = structure_and_track("cv", text_cv, get_structured_text_for_cv)
         if not structured_text:
             logger.error("Failed to structure CV text.")
             return jsonify({"structured_cv": None, "error": "Failed to process CV text."}), 500
         logger.info("Structured CV obtained.")
-        logger.debug(f"Structured CV: {structured_text}")
+        logger.debug("Structured CV: %s", structured_text)
 
-        return jsonify({"structured_cv": structured_text}), 200
+        return jsonify({"structured_cv": structured_text, "dedup": dedup}), 200
 
     except Exception as e:
-        logger.error(f"Error in /structure-cv: {e}")
+        logger.error("Error in /structure-cv: %s", e)
         return jsonify({"structured_cv": None, "error": str(e)}), 500
 
 @app.route("/structure-job", methods=["POST"])
 def structure_job():
     # Log the incoming JSON payload
     incoming_json = request.get_json()
-    logger.debug(f"Incoming JSON Payload: {incoming_json}")
+    logger.debug("Incoming JSON Payload: %s", incoming_json)
     
     if not incoming_json:
         logger.error("No JSON payload received.")
@@ -65,31 +121,137 @@ def structure_job():
         return jsonify({"structured_job": None, "error": "Missing 'text_job' in request data."}), 400
 
     logger.info("Received /structure-job request.")
-    logger.debug(f"text_job: {text_job}")
+    logger.debug("text_job: %s", text_job)
 
     try:
         # Get structured Job Description
         logger.info("Calling get_structured_text_for_job.")
-        structured_job = get_structured_text_for_job(text_job)
+        structured_job, dedup = structure_and_track("job", text_job, get_structured_text_for_job)
         if not structured_job:
             logger.error("Failed to structure job description.")
             return jsonify({"structured_job": None, "error": "Failed to process job description."}), 500
         logger.info("Structured job description obtained.")
-        logger.debug(f"Structured Job: {structured_job}")
+        logger.debug("Structured Job: %s", structured_job)
+
+        return jsonify({"structured_job": structured_job, "dedup": dedup}), 200
+
+    except Exception as e:
+        logger.error("Error in /structure-job: %s", e)
+        return jsonify({"structured_job": None, "error": str(e)}), 500
+
+def stream_structure(kind: str, text: str, stream, result_key: str, failure: str):
+    """NDJSON response: one line per top-level section as soon as it is complete, then the whole document."""
+    dedup, sections = stream_with_dedup(kind, text, stream)
+
+    def generate():
+        start = time.perf_counter()
+        structured = {}
+        try:
+            for key, value in sections:
+                structured[key] = value
+                yield json.dumps({"section": key, "value": value, "elapsed": round(time.perf_counter() - start, 3)}) + "\n"
+        except Exception as e:
+            logger.error("Streaming %s failed after %d sections: %s", kind, len(structured), e)
+            yield json.dumps({"done": True, result_key: None, "error": str(e)}) + "\n"
+            return
+        if not structured:
+            yield json.dumps({"done": True, result_key: None, "error": failure}) + "\n"
+            return
+        track_document(kind, structured)
+        yield json.dumps({"done": True, result_key: structured, "dedup": dedup,
+                          "elapsed": round(time.perf_counter() - start, 3)}) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+@app.route("/structure-cv/stream", methods=["POST"])
+def structure_cv_stream():
+    incoming_json = request.get_json()
+
+    if not incoming_json:
+        logger.error("No JSON payload received.")
+        return jsonify({"structured_cv": None, "error": "No data provided."}), 400
 
-        return jsonify({"structured_job": structured_job}), 200
+    text_cv = incoming_json.get("text_cv")
 
+    if not text_cv:
+        logger.error("Missing 'text_cv' in request data.")
+        return jsonify({"structured_cv": None, "error": "Missing 'text_cv' in request data."}), 400
+
+    logger.info("Received /structure-cv/stream request.")
+
+    try:
+        return stream_structure("cv", text_cv, stream_structured_text_for_cv, "structured_cv", "Failed to process CV text.")
+    except Exception as e:
+        logger.error("Error in /structure-cv/stream: %s", e)
+        return jsonify({"structured_cv": None, "error": str(e)}), 500
+
+@app.route("/structure-job/stream", methods=["POST"])
+def structure_job_stream():
+    incoming_json = request.get_json()
+
+    if not incoming_json:
+        logger.error("No JSON payload received.")
+        return jsonify({"structured_job": None, "error": "No data provided."}), 400
+
+    text_job = incoming_json.get("text_job")
+
+    if not text_job:
+        logger.error("Missing 'text_job' in request data.")
+        return jsonify({"structured_job": None, "error": "Missing 'text_job' in request data."}), 400
+
+    logger.info("Received /structure-job/stream request.")
+
+    try:
+        return stream_structure("job", text_job, stream_structured_text_for_job, "structured_job",
+                                "Failed to process job description.")
     except Exception as e:
-        logger.error(f"Error in /structure-job: {e}")
+        logger.error("Error in /structure-job/stream: %s", e)
         return jsonify({"structured_job": None, "error": str(e)}), 500
 
+def submit_job(kind: str, text_key: str):
+    """Queue a structuring job and answer right away with its id; the result comes from /jobs/<job_id>."""
+    result_key = JOB_RESULT_KEYS[kind]
+    if not job_queue:
+        return jsonify({result_key: None, "error": "Structuring jobs are disabled."}), 503
+
+    incoming_json = request.get_json()
+    if not incoming_json:
+        logger.error("No JSON payload received.")
+        return jsonify({result_key: None, "error": "No data provided."}), 400
+    text = incoming_json.get(text_key)
+    if not text:
+        logger.error("Missing '%s' in request data.", text_key)
+        return jsonify({result_key: None, "error": f"Missing '{text_key}' in request data."}), 400
+    webhook_url = incoming_json.get("webhook_url")
+    if webhook_url and not valid_webhook_url(webhook_url):
+        return jsonify({result_key: None, "error": "Invalid 'webhook_url'."}), 400
+
+    job_id = job_queue.submit(kind, text, webhook_url)
+    logger.info("Queued structuring job %s (%s).", job_id, kind)
+    return jsonify({"job_id": job_id, "status": "queued", "status_url": f"/jobs/{job_id}"}), 202
+
+@app.route("/structure-cv/jobs", methods=["POST"])
+def queue_cv_structuring():
+    return submit_job("cv", "text_cv")
+
+@app.route("/structure-job/jobs", methods=["POST"])
+def queue_job_structuring():
+    return submit_job("job", "text_job")
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    job = job_queue.get(job_id) if job_queue else None
+    if not job:
+        return jsonify({"job_id": job_id, "error": "Unknown job."}), 404
+    return jsonify(job_response(job, JOB_RESULT_KEYS[job["kind"]])), 200
+
 @app.route("/match", methods=["POST"])
 def match():
 
     # Log the incoming JSON payload
     incoming_json = request.get_json()
 
-    logger.debug(f"Incoming JSON Payload: {incoming_json}")
+    logger.debug("Incoming JSON Payload: %s", incoming_json)
     
     if not incoming_json:
         logger.error("No JSON payload received.")
@@ -102,60 +264,175 @@ def match():
         logger.error("Missing 'structured_job' or 'structured_cv' in request data.")
         return jsonify({"score": None, "error": "Missing 'structured_job' or 'structured_cv' in request data."}), 400
 
+    scoring_mode = incoming_json.get("scoring_mode", SCORING_MODE)
+    if scoring_mode not in SCORING_MODES:
+        logger.error("Invalid 'scoring_mode' in request data.")
+        return jsonify({"score": None, "error": f"'scoring_mode' must be one of {', '.join(SCORING_MODES)}."}), 400
+
     logger.info("Received /match-cv request.")
-    logger.debug(f"structured_job: {structured_job}")
-    logger.debug(f"structured_cv: {structured_cv}")
+    logger.debug("structured_job: %s", structured_job)
+    logger.debug("structured_cv: %s", structured_cv)
 
     try:
-        # Generate score
-        logger.info("Calling get_general_score.")
+        # Generate score, running the scoring dimensions concurrently unless the request opts out
+        concurrent = incoming_json.get("concurrent", MATCH_CONCURRENT)
+        use_prefilter = incoming_json.get("prefilter", PREFILTER_ENABLED)
+        logger.info("Calling match_pair (mode=%s, concurrent=%s, prefilter=%s).", scoring_mode, concurrent, use_prefilter)
+
+        score = lambda: match_pair(structured_cv, structured_job, concurrent=bool(concurrent),
+                                   use_prefilter=bool(use_prefilter), mode=scoring_mode)
+        # Pairs already scored with the same documents and prompts come from the score store
+        if incoming_json.get("use_store", True):
+            result = stored_match(structured_cv, structured_job, scoring_mode, bool(use_prefilter), score)
+        else:
+            result = score()
+
+        if result.get("failed_dimensions"):
+            logger.error("Scoring failed for dimensions: %s", result["failed_dimensions"])
+            return jsonify({**result, "error": failure_message(result)}), 500
 
-        domain_score_result = get_domain_score(structured_cv, structured_job)    
-        tehnical_score_result = get_tehnical_score(structured_cv, structured_job)
-        general_score_result = get_general_score(structured_cv, structured_job)
+        # Validate score
+        if not (0 <= result["score"] <= 100):
+            logger.error("Invalid score format received from OpenAI API.")
+            return jsonify({"score": None, "error": "Invalid score format received from OpenAI API."}), 500
 
-        # print(domain_score_result, "Domain")
-        # print(tehnical_score_result, "tehnical_score_result")
-        # print(general_score_result, "general_score_result")
+        logger.info("Score obtained successfully.")
 
-        cv_id = domain_score_result.get("cv_id")
-        job_id = domain_score_result.get("job_id")
+        return jsonify(result), 200
 
-        domain_reasoning = domain_score_result.get("reasoning")
-        tehnical_reasoning = tehnical_score_result.get("reasoning")
-        general_reasoning = general_score_result.get("reasoning")
+    except Exception as e:
+        logger.error("Error in /match: %s", e)
+        return jsonify({"score": None, "error": str(e)}), 500 
 
-        domain_score = domain_score_result.get("score")
-        tehnical_score = tehnical_score_result.get("score")
-        general_score = general_score_result.get("score")
+@app.route("/match-batch", methods=["POST"])
+def match_batch():
 
-        score = (10*domain_score + 30*tehnical_score + 60*general_score)/100
+    incoming_json = request.get_json()
 
-        # Validate score
-        if not (0 <= score <= 100):
-            logger.error("Invalid score format received from OpenAI API.")
-            return jsonify({"score": None, "error": "Invalid score format received from OpenAI API."}), 500
+    if not incoming_json:
+        logger.error("No JSON payload received.")
+        return jsonify({"results": None, "error": "No data provided."}), 400
 
-        logger.info("Score obtained successfully.")
+    structured_job = incoming_json.get("structured_job")
+    structured_cvs = incoming_json.get("structured_cvs")
+
+    if not structured_job or not structured_cvs or not isinstance(structured_cvs, list):
+        logger.error("Missing 'structured_job' or 'structured_cvs' in request data.")
+        return jsonify({"results": None, "error": "Missing 'structured_job' or 'structured_cvs' list in request data."}), 400
+
+    max_concurrency = incoming_json.get("max_concurrency", BATCH_WORKERS)
+    if not isinstance(max_concurrency, int) or max_concurrency < 1:
+        logger.error("Invalid 'max_concurrency' in request data.")
+        return jsonify({"results": None, "error": "'max_concurrency' must be a positive integer."}), 400
+
+    scoring_mode = incoming_json.get("scoring_mode", SCORING_MODE)
+    if scoring_mode not in SCORING_MODES:
+        logger.error("Invalid 'scoring_mode' in request data.")
+        return jsonify({"results": None, "error": f"'scoring_mode' must be one of {', '.join(SCORING_MODES)}."}), 400
+
+    use_prefilter = bool(incoming_json.get("prefilter", PREFILTER_ENABLED))
+
+    # Only the CVs most similar to the job by embeddings reach the LLM; 0 scores them all
+    semantic_top_n = incoming_json.get("semantic_top_n", SEMANTIC_TOP_N)
+    if not isinstance(semantic_top_n, int) or semantic_top_n < 0:
+        logger.error("Invalid 'semantic_top_n' in request data.")
+        return jsonify({"results": None, "error": "'semantic_top_n' must be a non-negative integer."}), 400
+
+    logger.info("Received /match-batch request for %d CVs.", len(structured_cvs))
+
+    def generate():
+        # One JSON object per line as each CV finishes, then a summary line
+        start = time.perf_counter()
+        failed = short_circuited = skipped = 0
+        for result in score_batch(structured_cvs, structured_job, max_concurrency, use_prefilter, scoring_mode,
+                                  semantic_top_n):
+            skipped += bool(result.get("skipped"))
+            failed += result.get("score") is None and not result.get("skipped")
+            short_circuited += bool(result.get("short_circuited"))
+            yield json.dumps(result) + "\n"
+        yield json.dumps({"summary": {"count": len(structured_cvs), "failed": failed, "short_circuited": short_circuited,
+                                      "skipped": skipped, "elapsed": round(time.perf_counter() - start, 3)}}) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+@app.route("/rank", methods=["POST"])
+def rank():
+    # Best CVs for a job among every structured CV seen: one vector query, then LLM scoring of the top N only
+    incoming_json = request.get_json()
 
-        # Construct the response JSON
-        result = {
-            "cv_id": cv_id,
-            "job_id": job_id,
-            "domain_reasoning": domain_reasoning,
-            "tehnical_reasoning": tehnical_reasoning,
-            "general_reasoning": general_reasoning,
-            "score": score,
-            "domain_score": domain_score,
-            "tehnical_score": tehnical_score,
-            "general_score": general_score,
-        }
+    if not incoming_json:
+        logger.error("No JSON payload received.")
+        return jsonify({"results": None, "error": "No data provided."}), 400
 
-        return jsonify(result), 200
+    if not embedding_index:
+        return jsonify({"results": None, "error": "Semantic ranking is disabled."}), 503
+
+    structured_job = incoming_json.get("structured_job")
+    if not structured_job or not isinstance(structured_job, dict):
+        logger.error("Missing 'structured_job' in request data.")
+        return jsonify({"results": None, "error": "Missing 'structured_job' in request data."}), 400
 
+    top_n = incoming_json.get("top_n", 10)
+    if not isinstance(top_n, int) or not 1 <= top_n <= SEMANTIC_TOP_N_MAX:
+        logger.error("Invalid 'top_n' in request data.")
+        return jsonify({"results": None, "error": f"'top_n' must be an integer between 1 and {SEMANTIC_TOP_N_MAX}."}), 400
+
+    scoring_mode = incoming_json.get("scoring_mode", SCORING_MODE)
+    if scoring_mode not in SCORING_MODES:
+        logger.error("Invalid 'scoring_mode' in request data.")
+        return jsonify({"results": None, "error": f"'scoring_mode' must be one of {', '.join(SCORING_MODES)}."}), 400
+
+    max_concurrency = incoming_json.get("max_concurrency", BATCH_WORKERS)
+    if not isinstance(max_concurrency, int) or max_concurrency < 1:
+        logger.error("Invalid 'max_concurrency' in request data.")
+        return jsonify({"results": None, "error": "'max_concurrency' must be a positive integer."}), 400
+
+    use_prefilter = bool(incoming_json.get("prefilter", PREFILTER_ENABLED))
+    logger.info("Received /rank request for the top %d CVs.", top_n)
+
+    try:
+        return jsonify(rank_and_score(structured_job, top_n, max_concurrency, use_prefilter, scoring_mode)), 200
     except Exception as e:
-        logger.error(f"Error in /match: {e}")
-        return jsonify({"score": None, "error": str(e)}), 500 
-    
+        logger.error("Error in /rank: %s", e)
+        return jsonify({"results": None, "error": str(e)}), 500
+
+def top_k(kind: str, doc_id: str):
+    if not score_store:
+        return jsonify({"results": None, "error": "The score store is disabled."}), 503
+    k = request.args.get("k", 10, type=int)
+    if k < 1:
+        return jsonify({"results": None, "error": "'k' must be a positive integer."}), 400
+    scoring_mode = request.args.get("scoring_mode", SCORING_MODE)
+    if scoring_mode not in SCORING_MODES:
+        return jsonify({"results": None, "error": f"'scoring_mode' must be one of {', '.join(SCORING_MODES)}."}), 400
+    return jsonify(top_matches(kind, doc_id, k, scoring_mode)), 200
+
+@app.route("/scores/job/<job_id>/top", methods=["GET"])
+def top_cvs_for_job(job_id):
+    # Best stored CVs for a job, without any LLM call
+    return top_k("job", job_id)
+
+@app.route("/scores/cv/<cv_id>/top", methods=["GET"])
+def top_jobs_for_cv(cv_id):
+    # Best stored jobs for a CV, without any LLM call
+    return top_k("cv", cv_id)
+
+@app.route("/cache-stats", methods=["GET"])
+def cache_stats():
+    if not response_cache:
+        return jsonify({"enabled": False}), 200
+    return jsonify({"enabled": True, **response_cache.stats()}), 200
+
+@app.route("/llm-stats", methods=["GET"])
+def llm_stats():
+    # Retry, hedge and circuit breaker counters of the OpenAI client, collapsed calls, rate-limit queue, and how answers were parsed
+    return jsonify({**resilience_stats(), "single_flight": single_flight.stats(), "scheduler": scheduler.stats(),
+                    "extraction": extraction_stats()}), 200
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    # Request/stage latency histograms and token counters, for Prometheus to scrape
+    return Response(render_metrics(), mimetype=METRICS_CONTENT_TYPE)
+
 if __name__ == "__main__":
     app.run(debug=True, host="0.0.0.0", port=5000)
@@ -0,0 +1,7 @@
+import os
+
+# The llm package reads its settings at import: no real API key, and nothing written under ./cache by the tests
+os.environ.setdefault("API_KEY", "test")
+for flag in ("LLM_CACHE_ENABLED", "DOCUMENT_STORE_ENABLED", "SCORE_STORE_ENABLED", "SEMANTIC_RANKING_ENABLED",
+             "JOBS_ENABLED"):
+    os.environ.setdefault(flag, "0")
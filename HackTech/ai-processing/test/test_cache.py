@@ -0,0 +1,79 @@
+import os
+import sqlite3
+import tempfile
+import time
+from llm.cache import ResponseCache
+
+
+def test_memory_and_disk_hits():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "cache.sqlite3")
+        cache = ResponseCache(path, memory_entries=1)
+        cache.set("a", {"score": 1})
+        cache.set("b", {"score": 2})
+
+        assert cache.get("b") == {"score": 2}
+        # Pushed out of the memory tier, still on disk
+        assert cache.get("a") == {"score": 1}
+        assert cache.get("c") is None
+        stats = cache.stats()
+        assert (stats["memory_hits"], stats["disk_hits"], stats["misses"]) == (1, 1, 1)
+        # A new process sees the entries and their size
+        assert ResponseCache(path).stats()["disk_bytes"] == stats["disk_bytes"]
+
+
+def test_disk_hits_do_not_write():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "cache.sqlite3")
+        cache = ResponseCache(path, memory_entries=0)
+        cache.set("a", {"score": 1})
+        stored_at = sqlite3.connect(path).execute("SELECT last_access FROM responses").fetchone()[0]
+
+        time.sleep(0.01)
+        assert cache.get("a") == {"score": 1}
+        assert sqlite3.connect(path).execute("SELECT last_access FROM responses").fetchone()[0] == stored_at
+        # The access time goes out with the next store
+        cache.set("b", {"score": 2})
+        accessed_at = sqlite3.connect(path).execute("SELECT last_access FROM responses WHERE key = 'a'").fetchone()[0]
+        assert accessed_at > stored_at
+
+
+def test_eviction_keeps_recently_used():
+    with tempfile.TemporaryDirectory() as directory:
+        value = {"text": "x" * 100}
+        cache = ResponseCache(os.path.join(directory, "cache.sqlite3"), memory_entries=0, max_bytes=1000)
+        for index in range(8):
+            cache.set(f"key-{index}", value)
+        cache.get("key-0")
+        cache.set("key-8", value)
+        cache.set("key-9", value)
+
+        stats = cache.stats()
+        assert stats["evictions"] > 0
+        assert stats["disk_bytes"] <= 1000
+        assert cache.get("key-0") == value
+        assert cache.get("key-1") is None
+        # Replacing an entry does not count its size twice
+        before = cache.stats()["disk_bytes"]
+        cache.set("key-9", value)
+        assert cache.stats()["disk_bytes"] == before
+
+
+def test_expired_entries():
+    with tempfile.TemporaryDirectory() as directory:
+        cache = ResponseCache(os.path.join(directory, "cache.sqlite3"), ttl=-1)
+        cache.set("a", {"score": 1})
+        assert cache.get("a") is None
+        stats = cache.stats()
+        assert (stats["disk_entries"], stats["disk_bytes"]) == (0, 0)
+
+
+def main():
+    test_memory_and_disk_hits()
+    test_disk_hits_do_not_write()
+    test_eviction_keeps_recently_used()
+    test_expired_entries()
+
+
+if __name__ == "__main__":
+    main()
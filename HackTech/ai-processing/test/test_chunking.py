@@ -0,0 +1,74 @@
+from llm import chunking
+from llm.chunking import split_sections, plan_chunks, cv_chunks, merge_structured_cvs, structure_chunks
+
+CV = """Ann Smith
+ann@example.com
+
+Work Experience
+Backend developer at Acme, 2019-2024. Built payment services in Python.
+
+Education
+BSc Computer Science, 2019.
+
+Skills
+Python, PostgreSQL, Docker
+"""
+
+
+def test_split_sections():
+    sections = split_sections(CV)
+    assert len(sections) == 4
+    assert sections[0].startswith("Ann Smith") and sections[1].startswith("Work Experience")
+    # A long line mentioning a heading word is not a heading
+    assert len(split_sections("Intro\nMy experience in the field of payments is broad and spans many years of work\n")) == 1
+
+
+def test_plan_chunks():
+    text = "\n".join(f"Projects\n{'Project line. ' * 20}\n" for _ in range(10))
+    chunks = plan_chunks(text, size=800)
+    assert len(chunks) > 1
+    assert "".join(chunks) == "".join(split_sections(text))
+    assert all(len(chunk) <= 800 for chunk in chunks)
+    # A section longer than a chunk is cut at line boundaries
+    long_section = "Experience\n" + "".join(f"Line {i} of a long section.\n" for i in range(100))
+    assert all(len(chunk) <= 300 for chunk in plan_chunks(long_section, size=300))
+
+
+def test_cv_chunks_threshold():
+    assert cv_chunks(CV) == []
+    # An ordinary two-page CV is still structured in one call
+    two_pages = CV * 40
+    assert 6000 < len(two_pages) < chunking.CV_CHUNK_MIN_CHARS and cv_chunks(two_pages) == []
+    assert len(cv_chunks(CV * 100)) > 1
+
+
+def test_merge_structured_cvs():
+    merged = merge_structured_cvs([
+        {"id": "7", "first_name": "Ann", "technical_skills": [{"name": "Python", "strength": 3}],
+         "work_experience": [{"company": "Acme"}]},
+        {"first_name": "", "last_name": "Smith", "technical_skills": [{"name": " python", "strength": 5},
+                                                                      {"name": "Docker", "strength": 2}],
+         "work_experience": [{"company": "Acme"}, {"company": "Beta"}]},
+    ])
+    assert (merged["id"], merged["first_name"], merged["last_name"]) == ("7", "Ann", "Smith")
+    assert merged["technical_skills"] == [{"name": "Python", "strength": 5}, {"name": "Docker", "strength": 2}]
+    assert merged["work_experience"] == [{"company": "Acme"}, {"company": "Beta"}]
+
+
+def test_structure_chunks():
+    structure = lambda chunk, part, parts: {"projects": [f"{part + 1}/{parts}"]}
+    assert structure_chunks(["a", "b", "c"], structure)["projects"] == ["1/3", "2/3", "3/3"]
+    # One failed chunk fails the CV
+    assert structure_chunks(["a", "b"], lambda chunk, part, parts: {} if part else {"projects": ["x"]}) == {}
+
+
+def main():
+    test_split_sections()
+    test_plan_chunks()
+    test_cv_chunks_threshold()
+    test_merge_structured_cvs()
+    test_structure_chunks()
+
+
+if __name__ == "__main__":
+    main()
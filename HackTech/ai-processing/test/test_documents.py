@@ -0,0 +1,85 @@
+import os
+import tempfile
+from llm import documents
+from llm.documents import (DocumentStore, split_document_id, normalize_text, fingerprint, minhash_signature,
+                           estimated_similarity)
+
+CV = ("Senior Python developer with eight years of experience building Django and FastAPI services, "
+      "PostgreSQL schemas, Celery pipelines and Kubernetes deployments for fintech and logistics companies.")
+
+
+def _with_store(test):
+    original_store, original_near = documents.document_store, documents.NEAR_DUPLICATE_ENABLED
+    with tempfile.TemporaryDirectory() as directory:
+        documents.document_store = DocumentStore(os.path.join(directory, "documents.sqlite3"))
+        try:
+            test()
+        finally:
+            documents.document_store, documents.NEAR_DUPLICATE_ENABLED = original_store, original_near
+
+
+def test_fingerprint():
+    assert split_document_id("id:42 Some CV") == ("42", "Some CV")
+    assert split_document_id("Some CV") == (None, "Some CV")
+    # Case, width and whitespace do not change the fingerprint
+    assert fingerprint(normalize_text("Python  Developer\n")) == fingerprint(normalize_text("ＰＹＴＨＯＮ developer"))
+    assert fingerprint(normalize_text("Python developer")) != fingerprint(normalize_text("Java developer"))
+
+
+def test_minhash_similarity():
+    signature = minhash_signature(normalize_text(CV))
+    assert len(signature) == documents.NUM_PERMUTATIONS
+    assert minhash_signature(normalize_text(CV)) == signature
+    edited = minhash_signature(normalize_text(CV.replace("logistics", "retail")))
+    unrelated = minhash_signature(normalize_text("Registered nurse with ten years in intensive care units."))
+    assert estimated_similarity(signature, edited) > 0.6
+    assert estimated_similarity(signature, unrelated) < 0.1
+
+
+def test_exact_hit_keeps_new_id():
+    def test():
+        calls = []
+        structure = lambda text: calls.append(text) or {"id": "1", "name": "Ann"}
+        documents.structure_with_dedup("cv", "id:1 " + CV, structure)
+        structured, info = documents.structure_with_dedup("cv", "id:2   " + CV.upper(), structure)
+        assert len(calls) == 1 and info["hit"] == "exact" and structured == {"id": "2", "name": "Ann"}
+    _with_store(test)
+
+
+def test_signature_only_when_near_duplicates_enabled():
+    def test():
+        original = documents.minhash_signature
+
+        def no_minhash(normalized):
+            raise AssertionError("MinHash computed with near-duplicate detection off")
+
+        documents.NEAR_DUPLICATE_ENABLED = False
+        documents.minhash_signature = no_minhash
+        try:
+            _, info = documents.structure_with_dedup("cv", CV, lambda text: {"name": "Ann"})
+        finally:
+            documents.minhash_signature = original
+        assert info["hit"] is None
+
+        # A one-word edit of a short text; real CVs are long enough for the default threshold
+        threshold = documents.NEAR_DUPLICATE_THRESHOLD
+        documents.NEAR_DUPLICATE_ENABLED, documents.NEAR_DUPLICATE_THRESHOLD = True, 0.5
+        try:
+            documents.structure_with_dedup("cv", CV + " Fluent English.", lambda text: {"name": "Bob"})
+            structured, info = documents.structure_with_dedup("cv", CV + " Fluent German.",
+                                                              lambda text: {"name": "Other"})
+        finally:
+            documents.NEAR_DUPLICATE_THRESHOLD = threshold
+        assert info["hit"] == "near" and structured == {"name": "Bob"}
+    _with_store(test)
+
+
+def main():
+    test_fingerprint()
+    test_minhash_similarity()
+    test_exact_hit_keeps_new_id()
+    test_signature_only_when_near_duplicates_enabled()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+import os
+import tempfile
+from llm.embeddings import EmbeddingIndex, HashingEmbedder
+
+CV = {"id": "cv-1", "technical_skills": [{"name": "Python"}, {"name": "Django"}],
+      "work_experience": [{"position": "Backend developer", "description": "Built Django services"}]}
+JOB = {"id": "job-1", "job_title": "Python developer", "required_qualifications": ["Python", "Django"]}
+
+
+def test_index_shared_between_workers():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "embeddings.sqlite3")
+        # Two worker processes on the same file
+        first, second = EmbeddingIndex(HashingEmbedder(64), path), EmbeddingIndex(HashingEmbedder(64), path)
+        assert first.add("cv", "cv-1", CV)
+        assert not first.add("cv", "cv-1", CV)
+
+        results = second.search(second.embed("job", JOB), "cv", 5)
+        assert [result["cv_id"] for result in results] == ["cv-1"]
+        assert results[0]["embedding_similarity"] > 0
+        assert set(results[0]["embedding_sections"]) == {"skills", "experience", "education"}
+        # Empty on the job side: left out, not zero
+        assert results[0]["embedding_sections"]["education"] is None
+
+        # A changed CV replaces its row
+        first.add("cv", "cv-1", {**CV, "technical_skills": [{"name": "Cobol"}]})
+        assert second.size("cv") == 1
+        assert second.search(second.embed("job", JOB), "cv", 5)[0]["embedding_similarity"] < results[0]["embedding_similarity"]
+
+
+def main():
+    test_index_shared_between_workers()
+
+
+if __name__ == "__main__":
+    main()
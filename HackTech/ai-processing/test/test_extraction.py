@@ -0,0 +1,45 @@
+from llm.extraction import extract_json, validate
+
+
+def test_extract_clean_and_fenced():
+    assert extract_json('{"score": 80}') == {"score": 80}
+    assert extract_json('Here you go:\n```json\n{"score": 80}\n```\nHope it helps.') == {"score": 80}
+    assert extract_json("") is None
+    assert extract_json("No JSON here.") is None
+
+
+def test_extract_repairs():
+    # Prose around the object, trailing commas and smart quotes
+    assert extract_json('Sure! {"score": 80, "reasoning": "Good fit",} Thanks') == {"score": 80, "reasoning": "Good fit"}
+    assert extract_json('{“score”: 80, "skills": ["Python", "SQL",]}') == {"score": 80, "skills": ["Python", "SQL"]}
+    # Cut off by MAX_TOKENS: the open string and brackets are closed, an incomplete member is dropped
+    truncated = '```json\n{"first_name": "Ann", "technical_skills": [{"name": "Python"}, {"name": "Dja'
+    assert extract_json(truncated) == {"first_name": "Ann", "technical_skills": [{"name": "Python"}, {"name": "Dja"}]}
+    assert extract_json('{"first_name": "Ann", "last_na') == {"first_name": "Ann"}
+
+
+def test_validate():
+    score = {"score": "85%", "reasoning": "Fits."}
+    assert validate(score, "score") == [] and score["score"] == 85.0
+    assert validate({"reasoning": "No score."}, "score") == ["score is missing"]
+    assert validate({"score": "high"}, "score") == ["score is not a number"]
+    assert validate([1, 2], "score") == ["answer is not a JSON object"]
+
+    cv = {"id": 12, "first_name": "Ann", "technical_skills": "Python"}
+    assert validate(cv, "cv") == ["technical_skills is not a list"]
+    # Numeric ids become strings and missing lists are filled in
+    assert cv["id"] == "12" and cv["education"] == []
+
+    combined = {"domain": {"score": "70", "reasoning": "Ok"}, "tehnical": "80"}
+    assert validate(combined, "combined") == ["tehnical is not an object"]
+    assert combined["domain"]["score"] == 70.0
+
+
+def main():
+    test_extract_clean_and_fenced()
+    test_extract_repairs()
+    test_validate()
+
+
+if __name__ == "__main__":
+    main()
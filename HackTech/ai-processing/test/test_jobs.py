@@ -0,0 +1,69 @@
+import os
+import tempfile
+from llm import jobs
+from llm.jobs import JobQueue, valid_webhook_url, QUEUED, FAILED
+
+
+def test_webhook_urls():
+    assert not valid_webhook_url("ftp://93.184.216.34/hook")
+    assert not valid_webhook_url("http://127.0.0.1:8000/hook")
+    assert not valid_webhook_url("http://10.1.2.3/hook")
+    assert not valid_webhook_url("http://169.254.169.254/latest/meta-data")
+    assert not valid_webhook_url("http://[::1]/hook")
+    assert valid_webhook_url("https://93.184.216.34/hook")
+
+    original = jobs.JOB_WEBHOOK_ALLOWED_HOSTS
+    jobs.JOB_WEBHOOK_ALLOWED_HOSTS = {"10.1.2.3"}
+    try:
+        assert valid_webhook_url("http://10.1.2.3/hook")
+        assert not valid_webhook_url("https://93.184.216.34/hook")
+    finally:
+        jobs.JOB_WEBHOOK_ALLOWED_HOSTS = original
+
+
+def test_failed_job_backs_off():
+    with tempfile.TemporaryDirectory() as directory:
+        queue = JobQueue(os.path.join(directory, "jobs.sqlite3"))
+        job_id = queue.submit("cv", "text")
+        claimed_id, kind, text, lease = queue.claim()
+        assert claimed_id == job_id
+        assert queue.fail(job_id, lease, "boom") == QUEUED
+        # Not taken again before its retry is due
+        assert queue.claim() is None
+
+        original = jobs.JOB_RETRY_BACKOFF
+        jobs.JOB_RETRY_BACKOFF = 0
+        try:
+            queue._conn.execute("UPDATE jobs SET lease_until = 0")
+            for attempt in range(jobs.JOB_MAX_ATTEMPTS - 1):
+                lease = queue.claim()[3]
+                status = queue.fail(job_id, lease, "boom")
+        finally:
+            jobs.JOB_RETRY_BACKOFF = original
+        assert status == FAILED and queue.get(job_id)["status"] == FAILED
+
+
+def test_lost_lease():
+    with tempfile.TemporaryDirectory() as directory:
+        queue = JobQueue(os.path.join(directory, "jobs.sqlite3"))
+        job_id = queue.submit("cv", "text")
+        stale_lease = queue.claim()[3]
+        # The lease expires and another worker takes the job over
+        queue._conn.execute("UPDATE jobs SET lease_until = 0")
+        lease = queue.claim()[3]
+        assert lease != stale_lease
+
+        assert not queue.complete(job_id, stale_lease, {"name": "stale"}, {})
+        assert queue.fail(job_id, stale_lease, "boom") is None
+        assert queue.complete(job_id, lease, {"name": "fresh"}, {})
+        assert queue.get(job_id)["result"] == {"name": "fresh"}
+
+
+def main():
+    test_webhook_urls()
+    test_failed_job_backs_off()
+    test_lost_lease()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+import json
+import time
+import asyncio
+import openai
+from llm import gpt, matching
+from llm.matching import score_batch, combine_scores, score_dimensions, _split_combined
+from llm.resilience import call_deadline
+from llm.scheduler import llm_priority
+
+
+def test_batch_calls_keep_bulk_priority():
+    priorities = []
+
+    def scheduled(call, prompt_tokens, max_tokens, priority, deadline=None):
+        priorities.append(priority)
+        return call()
+
+    def create(**kwargs):
+        content = json.dumps({"score": 70, "reasoning": "Fits."})
+        return openai.openai_object.OpenAIObject.construct_from({"choices": [{"message": {"content": content}}]})
+
+    original_scheduled, original_create = gpt.scheduled, openai.ChatCompletion.create
+    gpt.scheduled, openai.ChatCompletion.create = scheduled, create
+    try:
+        # /match-batch sets "bulk" on the request; the batch workers run in other threads
+        with llm_priority("bulk"):
+            results = list(score_batch([{"id": "cv-1"}, {"id": "cv-2"}], {"id": "job-1"}, max_concurrency=2,
+                                       use_prefilter=False, mode="separate"))
+    finally:
+        gpt.scheduled, openai.ChatCompletion.create = original_scheduled, original_create
+
+    assert [result["score"] for result in results] == [70, 70]
+    assert len(priorities) == 6 and set(priorities) == {"bulk"}
+
+
+def test_batch_stops_when_client_disconnects():
+    import asgi
+    from starlette.requests import Request
+    calls = []
+
+    def create(**kwargs):
+        calls.append(kwargs)
+        time.sleep(0.05)
+        content = json.dumps({"score": 70, "reasoning": "Fits."})
+        return openai.openai_object.OpenAIObject.construct_from({"choices": [{"message": {"content": content}}]})
+
+    body = json.dumps({"structured_job": {"id": "job-1"}, "structured_cvs": [{"id": f"cv-{index}"} for index in range(6)],
+                       "max_concurrency": 1, "prefilter": False, "scoring_mode": "separate", "semantic_top_n": 0}).encode()
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def disconnect():
+        response = await asgi.match_batch(Request({"type": "http", "method": "POST", "path": "/match-batch",
+                                                   "headers": []}, receive))
+        lines = response.body_iterator
+        await lines.__anext__()
+        # The client goes away while the second CV is being scored
+        reading = asyncio.ensure_future(lines.__anext__())
+        await asyncio.sleep(0.02)
+        reading.cancel()
+        await asyncio.gather(reading, return_exceptions=True)
+        await lines.aclose()
+
+    original_create = openai.ChatCompletion.create
+    openai.ChatCompletion.create = create
+    try:
+        asyncio.run(disconnect())
+        # The second CV finishes its calls; the four not started are never scored
+        time.sleep(0.3)
+    finally:
+        openai.ChatCompletion.create = original_create
+    assert len(calls) == 6
+
+
+def test_split_combined():
+    combined = {"cv_id": "cv-1", "job_id": "job-1", "domain": {"score": 80, "reasoning": "Same field."},
+                "tehnical": {"score": "high", "reasoning": "Knows Python."}}
+    outcomes = _split_combined({"result": combined, "elapsed": 1.5, "error": None})
+
+    assert outcomes["domain"] == {"result": {"cv_id": "cv-1", "job_id": "job-1", "score": 80, "reasoning": "Same field."},
+                                  "elapsed": 1.5, "error": None}
+    # A non-numeric score fails its dimension only
+    assert outcomes["tehnical"]["result"] is None
+    assert outcomes["tehnical"]["error"] == "Missing or non-numeric score in OpenAI API response."
+    # So does a dimension missing from the answer
+    assert outcomes["general"]["result"] is None
+    assert outcomes["general"]["error"] == "Empty response from OpenAI API."
+
+
+def test_split_combined_failed_call():
+    outcomes = _split_combined({"result": None, "elapsed": 75, "error": "Timed out after 75s."})
+    assert set(outcomes) == {"domain", "tehnical", "general"}
+    assert all(outcome == {"result": None, "elapsed": 75, "error": "Timed out after 75s."} for outcome in outcomes.values())
+
+
+def _outcome(score, error=None, elapsed=1.0):
+    result = None if error else {"cv_id": "cv-1", "job_id": "job-1", "score": score, "reasoning": f"{score} points."}
+    return {"result": result, "elapsed": elapsed, "error": error}
+
+
+def test_combine_scores_weighting():
+    result = combine_scores({"domain": _outcome(80), "tehnical": _outcome(50), "general": _outcome(70)})
+    # The formula /match used before the dimensions ran concurrently
+    assert result["score"] == (10 * 80 + 30 * 50 + 60 * 70) / 100
+    assert (result["cv_id"], result["job_id"]) == ("cv-1", "job-1")
+    assert result["tehnical_score"] == 50 and result["general_reasoning"] == "70 points."
+    assert "failed_dimensions" not in result
+    assert result["timings"] == {"domain": 1.0, "tehnical": 1.0, "general": 1.0}
+
+
+def test_combine_scores_with_failed_dimension():
+    result = combine_scores({"domain": _outcome(80), "tehnical": _outcome(None, "Empty response from OpenAI API."),
+                             "general": _outcome(70)})
+    assert result["score"] is None
+    assert result["failed_dimensions"] == {"tehnical": "Empty response from OpenAI API."}
+    # The dimensions that did succeed are still reported
+    assert result["domain_score"] == 80 and result["tehnical_score"] is None
+
+
+def _with_scorers(scorers, test):
+    original = matching.SCORE_DIMENSIONS
+    matching.SCORE_DIMENSIONS = {dimension: (scorers[dimension], weight) for dimension, (_, weight) in original.items()}
+    try:
+        test()
+    finally:
+        matching.SCORE_DIMENSIONS = original
+
+
+def _scorer(score, delay=0.0, deadlines=None):
+    def scorer(structured_cv, structured_job):
+        if deadlines is not None:
+            deadlines.append(call_deadline() - time.monotonic())
+        time.sleep(delay)
+        return {"score": score, "reasoning": "Fits."}
+    return scorer
+
+
+def test_dimension_timing_out_under_shared_deadline():
+    deadlines = []
+    scorers = {"domain": _scorer(80, deadlines=deadlines), "tehnical": _scorer(50, delay=0.5), "general": _scorer(70)}
+
+    def test():
+        outcomes = score_dimensions({"id": "cv-1"}, {"id": "job-1"}, concurrent=True, timeout=0.1)
+        assert outcomes["domain"]["result"]["score"] == 80 and outcomes["general"]["error"] is None
+        assert outcomes["tehnical"] == {"result": None, "elapsed": 0.1, "error": "Timed out after 0.1s."}
+        # The calls of the match carry its deadline, not a fresh LLM_CALL_DEADLINE
+        assert deadlines and deadlines[0] <= 0.1
+    _with_scorers(scorers, test)
+
+
+def test_sequential_dimensions_skipped_after_deadline():
+    called = []
+
+    def scorer(structured_cv, structured_job):
+        called.append(1)
+        time.sleep(0.15)
+        return {"score": 60, "reasoning": "Fits."}
+
+    def test():
+        outcomes = score_dimensions({"id": "cv-1"}, {"id": "job-1"}, concurrent=False, timeout=0.1)
+        assert len(called) == 1 and outcomes["domain"]["result"]["score"] == 60
+        for dimension in ("tehnical", "general"):
+            assert outcomes[dimension] == {"result": None, "elapsed": 0.0, "error": "Skipped, match deadline exceeded."}
+        assert combine_scores(outcomes)["score"] is None
+    _with_scorers({"domain": scorer, "tehnical": scorer, "general": scorer}, test)
+
+
+def main():
+    test_batch_calls_keep_bulk_priority()
+    test_batch_stops_when_client_disconnects()
+    test_split_combined()
+    test_split_combined_failed_call()
+    test_combine_scores_weighting()
+    test_combine_scores_with_failed_dimension()
+    test_dimension_timing_out_under_shared_deadline()
+    test_sequential_dimensions_skipped_after_deadline()
+
+
+if __name__ == "__main__":
+    main()
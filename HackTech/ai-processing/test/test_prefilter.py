@@ -0,0 +1,50 @@
+from llm.prefilter import job_level, required_years, prefilter, _term_pattern
+
+
+def test_job_level():
+    assert job_level({"job_title": "Senior Backend Engineer"}, None) == 2
+    assert job_level({"job_title": "Tech Lead"}, None) == 2
+    assert job_level({"job_title": "Staff Software Engineer"}, None) == 2
+    assert job_level({"job_title": "Junior Developer"}, None) == 0
+    # Generic wording is no seniority
+    assert job_level({"job_title": "Developer", "required_qualifications": ["Lead the migration to Kubernetes",
+                                                                            "Work with our staff"]}, None) is None
+    assert job_level({"job_title": "Developer", "required_qualifications": ["University graduate in CS"]}, None) is None
+    # Without a title keyword, the required years decide
+    assert job_level({"job_title": "Developer"}, 6) == 2
+
+
+def test_required_years():
+    job = {"required_qualifications": ["3+ years of Python", "2-4 yrs with Django", "Fluent English"]}
+    assert required_years(job) == 3
+    assert required_years({"required_qualifications": ["Python"]}) is None
+
+
+def test_term_pattern():
+    assert _term_pattern("Java").search("Java, SQL")
+    assert not _term_pattern("Java").search("JavaScript")
+    assert _term_pattern("C++").search("Modern C++ and C#")
+    assert not _term_pattern("C").search("C++")
+
+
+def test_seniority_gap_is_one_sided():
+    job = {"job_title": "Junior Python Developer", "required_qualifications": ["Python"]}
+    senior_cv = {"technical_skills": [{"name": "Python"}], "work_experience": [{"duration": 12}]}
+    screening = prefilter(senior_cv, job)
+    assert screening["seniority_gap"] == 0 and screening["worth_llm_call"]
+
+    senior_job = {"job_title": "Senior Python Developer", "required_qualifications": ["Python"]}
+    junior_cv = {"technical_skills": [{"name": "Python"}], "work_experience": [{"duration": 1}]}
+    screening = prefilter(junior_cv, senior_job)
+    assert screening["seniority_gap"] == 2 and not screening["worth_llm_call"]
+
+
+def main():
+    test_job_level()
+    test_required_years()
+    test_term_pattern()
+    test_seniority_gap_is_one_sided()
+
+
+if __name__ == "__main__":
+    main()
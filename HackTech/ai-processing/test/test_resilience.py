@@ -0,0 +1,164 @@
+import time
+import openai
+from contextvars import ContextVar
+from llm import resilience
+from llm.resilience import CircuitBreaker, call_with_resilience, attempt_timeout, backoff_delay, call_deadline, llm_deadline
+from llm.resilience import upstream_started
+
+
+def _with_breaker(test):
+    original = resilience.breaker
+    resilience.breaker = CircuitBreaker(failures=2, reset=0)
+    try:
+        test(resilience.breaker)
+    finally:
+        resilience.breaker = original
+
+
+def _failing(error, calls):
+    def call():
+        calls.append(error)
+        raise error
+    return call
+
+
+def test_non_retryable_errors_leave_breaker_alone():
+    def test(breaker):
+        calls = []
+        try:
+            call_with_resilience(_failing(ValueError("local bug"), calls))
+        except ValueError:
+            pass
+        assert len(calls) == 1 and breaker._consecutive == 0
+
+        breaker.record_failure()
+        try:
+            call_with_resilience(_failing(openai.error.InvalidRequestError("bad", None), calls))
+        except openai.error.InvalidRequestError:
+            pass
+        # Neither reset nor counted
+        assert breaker._consecutive == 1
+    _with_breaker(test)
+
+
+def test_half_open_probe_is_released():
+    def test(breaker):
+        breaker.record_failure()
+        breaker.record_failure()
+        assert breaker.state == "half-open"
+        try:
+            call_with_resilience(_failing(ValueError("local bug"), []))
+        except ValueError:
+            pass
+        # The next call may probe
+        assert breaker.allow()
+    _with_breaker(test)
+
+
+def test_retries_stop_at_deadline():
+    def test(breaker):
+        calls = []
+        start = time.monotonic()
+        try:
+            call_with_resilience(_failing(openai.error.Timeout("slow"), calls), deadline=time.monotonic() + 1)
+        except openai.error.Timeout:
+            pass
+        # Less than LLM_MIN_ATTEMPT_TIME left: no retry
+        assert len(calls) == 1 and time.monotonic() - start < 1
+
+        calls = []
+        original = resilience.LLM_BACKOFF_BASE
+        resilience.LLM_BACKOFF_BASE = 0
+        try:
+            call_with_resilience(_failing(openai.error.Timeout("slow"), calls), deadline=time.monotonic() + 60)
+        except openai.error.Timeout:
+            pass
+        finally:
+            resilience.LLM_BACKOFF_BASE = original
+        assert len(calls) == resilience.LLM_MAX_RETRIES + 1
+    _with_breaker(test)
+
+
+def test_attempt_timeout():
+    deadline = time.monotonic() + 20
+    assert attempt_timeout(deadline, 60) <= 20
+    assert attempt_timeout(deadline, 10) == 10
+    assert attempt_timeout(time.monotonic(), 60) == resilience.LLM_MIN_ATTEMPT_TIME
+
+
+def test_call_deadline_follows_enclosing_deadline():
+    assert call_deadline() - time.monotonic() > resilience.LLM_CALL_DEADLINE - 1
+    with llm_deadline(2):
+        assert call_deadline() - time.monotonic() <= 2
+    assert call_deadline() - time.monotonic() > resilience.LLM_CALL_DEADLINE - 1
+
+
+def _with_hedging(test):
+    original_delay, original_allowed = resilience.hedge_delay, resilience._hedge_allowed
+    resilience.hedge_delay, resilience._hedge_allowed = lambda: 0.05, lambda: True
+    try:
+        test()
+    finally:
+        resilience.hedge_delay, resilience._hedge_allowed = original_delay, original_allowed
+
+
+def test_queued_calls_are_not_hedged():
+    def test():
+        calls = []
+
+        def call():
+            calls.append(1)
+            # Waiting for rate-limit budget, then a fast upstream answer
+            time.sleep(0.2)
+            upstream_started()
+            return "ok"
+
+        hedges = resilience._stats["hedges"]
+        assert call_with_resilience(call) == "ok"
+        assert len(calls) == 1 and resilience._stats["hedges"] == hedges
+        # Only the upstream part is a latency sample
+        assert resilience._latencies._samples[-1] < 0.1
+    _with_hedging(test)
+
+
+def test_slow_upstream_is_hedged_in_callers_context():
+    request = ContextVar("request", default=None)
+
+    def test():
+        seen = []
+
+        def call():
+            seen.append(request.get())
+            upstream_started()
+            time.sleep(0.2 if len(seen) == 1 else 0)
+            return len(seen)
+
+        request.set("request-1")
+        hedges = resilience._stats["hedges"]
+        assert call_with_resilience(call) == 2
+        assert resilience._stats["hedges"] == hedges + 1
+        # Both copies ran with the request's context
+        assert seen == ["request-1", "request-1"]
+    _with_hedging(test)
+
+
+def test_backoff_delay():
+    for attempt in range(6):
+        assert 0 <= backoff_delay(attempt) <= resilience.LLM_BACKOFF_MAX
+    error = openai.error.RateLimitError("slow down", headers={"retry-after": "3"})
+    assert backoff_delay(0, error) >= 3
+
+
+def main():
+    test_non_retryable_errors_leave_breaker_alone()
+    test_half_open_probe_is_released()
+    test_retries_stop_at_deadline()
+    test_attempt_timeout()
+    test_call_deadline_follows_enclosing_deadline()
+    test_queued_calls_are_not_hedged()
+    test_slow_upstream_is_hedged_in_callers_context()
+    test_backoff_delay()
+
+
+if __name__ == "__main__":
+    main()
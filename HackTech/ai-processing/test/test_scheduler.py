@@ -0,0 +1,109 @@
+import time
+import asyncio
+import threading
+from llm.scheduler import Scheduler, DeadlineExceeded
+
+
+def test_token_bucket():
+    # 1000 tokens per second
+    scheduler = Scheduler(tpm=60000)
+    start = time.monotonic()
+    scheduler.acquire(0, 60000, "normal")
+    assert time.monotonic() - start < 0.05
+    # The bucket is empty: the next request waits for the refill
+    scheduler.acquire(100, 100, "normal")
+    assert time.monotonic() - start >= 0.15
+    assert scheduler.stats()["queued"] == 1
+
+
+def test_unused_tokens_are_given_back():
+    scheduler = Scheduler(tpm=60000)
+    ticket = scheduler.acquire(1000, 59000, "normal")
+    scheduler.settle(ticket, 1000)
+    start = time.monotonic()
+    scheduler.acquire(0, 50000, "normal")
+    assert time.monotonic() - start < 0.05
+
+
+def test_priority_order():
+    scheduler = Scheduler(tpm=60000)
+    scheduler.acquire(0, 60000, "normal")
+    admitted = []
+
+    def acquire(priority):
+        scheduler.acquire(0, 200, priority)
+        admitted.append(priority)
+
+    threads = [threading.Thread(target=acquire, args=(priority,)) for priority in ("bulk", "normal", "interactive")]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.02)
+    assert scheduler.queue_depths() == {"interactive": 1, "normal": 1, "bulk": 1}
+    for thread in threads:
+        thread.join(5)
+    # Queued last, admitted first
+    assert admitted == ["interactive", "normal", "bulk"]
+
+
+def test_pause():
+    scheduler = Scheduler(rpm=600)
+    scheduler.pause(0.2)
+    start = time.monotonic()
+    scheduler.acquire(0, 0, "interactive")
+    assert time.monotonic() - start >= 0.15
+    assert scheduler.stats()["rate_limited"] == 1
+
+
+def test_deadline_drops_waiter():
+    scheduler = Scheduler(tpm=60000)
+    scheduler.acquire(0, 60000, "normal")
+    start = time.monotonic()
+    try:
+        scheduler.acquire(0, 30000, "interactive", deadline=start + 0.1)
+        assert False, "admitted after the deadline"
+    except DeadlineExceeded:
+        pass
+    assert 0.08 <= time.monotonic() - start < 0.5
+    # The abandoned request left the queue and spent nothing
+    assert scheduler.queue_depths()["interactive"] == 0
+    assert scheduler.stats()["withdrawn"] == 1
+    scheduler.acquire(0, 100, "normal", deadline=time.monotonic() + 1)
+
+
+def test_expired_deadline_is_never_admitted():
+    scheduler = Scheduler(rpm=600)
+    try:
+        scheduler.acquire(0, 0, "interactive", deadline=time.monotonic() - 1)
+        assert False, "admitted after the deadline"
+    except DeadlineExceeded:
+        pass
+    # The budget taken at admission was given back
+    assert scheduler.stats()["requests_available"] >= 599
+
+
+def test_async_deadline_drops_waiter():
+    async def run():
+        scheduler = Scheduler(tpm=60000)
+        await scheduler.aacquire(0, 60000, "normal")
+        try:
+            await scheduler.aacquire(0, 30000, "interactive", deadline=time.monotonic() + 0.1)
+            assert False, "admitted after the deadline"
+        except DeadlineExceeded:
+            pass
+        return scheduler.queue_depths()
+
+    assert asyncio.run(run())["interactive"] == 0
+
+
+def main():
+    test_token_bucket()
+    test_unused_tokens_are_given_back()
+    test_priority_order()
+    test_pause()
+    test_deadline_drops_waiter()
+    test_expired_deadline_is_never_admitted()
+    test_async_deadline_drops_waiter()
+
+
+if __name__ == "__main__":
+    main()
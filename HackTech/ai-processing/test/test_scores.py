@@ -0,0 +1,127 @@
+import os
+import tempfile
+from llm import scores
+from llm.documents import content_hash
+from llm.scores import ScoreStore, ScoreBackfill, prompt_version, stored_match
+
+
+def test_backfill_claims():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "scores.sqlite3")
+        # Two processes sharing the store
+        first, second = ScoreStore(path), ScoreStore(path)
+
+        assert first.claim("cv-1", "job-1", "v1", "a", max_per_hour=2) == "claimed"
+        assert second.claim("cv-1", "job-1", "v1", "b", max_per_hour=2) == "taken"
+        # An expired lease can be taken over
+        assert second.claim("cv-2", "job-1", "v1", "b", lease=-1, max_per_hour=2) == "claimed"
+        assert first.claim("cv-2", "job-1", "v1", "a", max_per_hour=3) == "claimed"
+        # The hourly budget is shared
+        assert second.claim("cv-3", "job-1", "v1", "b", max_per_hour=2) == "budget"
+
+
+def test_prompt_version_follows_settings():
+    version = prompt_version("separate")
+    assert prompt_version("combined") != version
+
+    original = scores.FIELD_TOKEN_BUDGET
+    scores.FIELD_TOKEN_BUDGET = original + 1
+    try:
+        assert prompt_version("separate") != version
+    finally:
+        scores.FIELD_TOKEN_BUDGET = original
+    assert prompt_version("separate") == version
+
+
+def _result(score: float) -> dict:
+    return {"score": score, "reasoning": "Fits."}
+
+
+def test_changed_document_invalidates_its_scores():
+    with tempfile.TemporaryDirectory() as directory:
+        store = ScoreStore(os.path.join(directory, "scores.sqlite3"))
+        cv, job = {"id": "cv-1", "skills": ["python"]}, {"id": "job-1", "title": "Developer"}
+        assert store.register("cv", "cv-1", cv) and store.register("job", "job-1", job)
+        store.put("cv-1", "job-1", content_hash(cv), content_hash(job), "v1", _result(80))
+
+        # Seen again unchanged: the score holds
+        assert not store.register("cv", "cv-1", cv)
+        assert store.get("cv-1", "job-1", content_hash(cv), content_hash(job), "v1") == _result(80)
+
+        changed = {**cv, "skills": ["python", "go"]}
+        assert store.register("cv", "cv-1", changed)
+        assert store.counts()["scores"] == 0
+        assert store.document("cv", "cv-1") == changed
+
+
+def test_top_hides_stale_scores():
+    with tempfile.TemporaryDirectory() as directory:
+        store = ScoreStore(os.path.join(directory, "scores.sqlite3"))
+        job = {"id": "job-1", "title": "Developer"}
+        cvs = [{"id": f"cv-{index}", "skills": [str(index)]} for index in range(3)]
+        store.register("job", "job-1", job)
+        for index, cv in enumerate(cvs):
+            store.register("cv", cv["id"], cv)
+            store.put(cv["id"], "job-1", content_hash(cv), content_hash(job), "v1", _result(50 + index))
+        # Scored against an older version of cv-2, never registered as current
+        store.put("cv-2", "job-1", content_hash({"skills": ["old"]}), content_hash(job), "v1", _result(99))
+
+        top = store.top("job", "job-1", "v1", 5)
+        assert [(row["cv_id"], row["score"]) for row in top] == [("cv-1", 51), ("cv-0", 50)]
+        assert [row["job_id"] for row in store.top("cv", "cv-0", "v1", 5)] == ["job-1"]
+        assert store.top("job", "job-1", "v2", 5) == []
+
+
+def test_missing_pairs():
+    with tempfile.TemporaryDirectory() as directory:
+        store = ScoreStore(os.path.join(directory, "scores.sqlite3"))
+        cvs = [{"id": "cv-1", "skills": ["a"]}, {"id": "cv-2", "skills": ["b"]}]
+        jobs = [{"id": "job-1", "title": "A"}, {"id": "job-2", "title": "B"}]
+        for cv in cvs:
+            store.register("cv", cv["id"], cv)
+        for job in jobs:
+            store.register("job", job["id"], job)
+        store.put("cv-1", "job-1", content_hash(cvs[0]), content_hash(jobs[0]), "v1", _result(70))
+
+        assert sorted(store.missing_pairs("v1")) == [("cv-1", "job-2"), ("cv-2", "job-1"), ("cv-2", "job-2")]
+        assert sorted(store.missing_pairs("v1", cv_id="cv-1")) == [("cv-1", "job-2")]
+        assert sorted(store.missing_pairs("v1", job_id="job-1")) == [("cv-2", "job-1")]
+        # Another prompt version has scored nothing yet
+        assert len(store.missing_pairs("v2")) == 4
+
+
+def test_documents_without_ids_are_found_again():
+    with tempfile.TemporaryDirectory() as directory:
+        store = ScoreStore(os.path.join(directory, "scores.sqlite3"))
+        original = scores.score_store, scores.score_backfill
+        scores.score_store, scores.score_backfill = store, ScoreBackfill(store, workers=0)
+        calls = []
+
+        def score():
+            calls.append(1)
+            return {**_result(75), "cv_id": "extracted-cv", "job_id": "extracted-job"}
+
+        try:
+            cv, job = {"skills": ["python"]}, {"title": "Developer"}
+            first = stored_match(cv, job, "separate", False, score)
+            second = stored_match(cv, job, "separate", False, score)
+        finally:
+            scores.score_store, scores.score_backfill = original
+
+        assert len(calls) == 1
+        assert "stored" not in first and second["stored"] and second["score"] == 75
+        # Stored under the extracted ids
+        assert store.document("cv", "extracted-cv") is not None
+
+
+def main():
+    test_backfill_claims()
+    test_prompt_version_follows_settings()
+    test_changed_document_invalidates_its_scores()
+    test_top_hides_stale_scores()
+    test_missing_pairs()
+    test_documents_without_ids_are_found_again()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+import json
+from llm.serialization import compact, truncate_to_tokens, serialize_for_llm, count_tokens, TRUNCATION_MARKER
+
+
+def test_compact_drops_empty_values_only():
+    document = {"id": 0, "remote": False, "score": 0.0, "summary": None, "title": "  Developer  ", "notes": "",
+                "skills": [], "extra": {},
+                "education": [{"name": "BSc", "grade": None}, {"name": "", "year": None}, None, "", 0],
+                "nested": {"inner": {"empty": [], "none": None}, "kept": {"flag": False}}}
+
+    assert compact(document) == {"id": 0, "remote": False, "score": 0.0, "title": "Developer",
+                                 "education": [{"name": "BSc"}, 0], "nested": {"kept": {"flag": False}}}
+
+
+def test_long_strings_are_truncated_and_marked():
+    text = " ".join(f"word{index}" for index in range(400))
+    truncated = truncate_to_tokens(text, 20)
+
+    assert truncated.endswith(TRUNCATION_MARKER) and len(truncated) < len(text)
+    kept = truncated[:-len(TRUNCATION_MARKER)]
+    assert text.startswith(kept) and count_tokens(kept) <= 20
+    # Within budget: unchanged
+    assert truncate_to_tokens("short text", 20) == "short text"
+    assert compact({"summary": text}, budget=20) == {"summary": truncated}
+    assert compact({"summary": "short text"}, budget=20) == {"summary": "short text"}
+
+
+def test_serialize_for_llm():
+    document = {"id": "cv-1", "skills": ["Python"], "projects": [], "summary": None}
+    serialized = serialize_for_llm(document)
+    assert json.loads(serialized) == {"id": "cv-1", "skills": ["Python"]}
+    assert " " not in serialized
+    # Already serialized documents are sent as they are
+    assert serialize_for_llm(serialized) == serialized
+
+
+def main():
+    test_compact_drops_empty_values_only()
+    test_long_strings_are_truncated_and_marked()
+    test_serialize_for_llm()
+
+
+if __name__ == "__main__":
+    main()
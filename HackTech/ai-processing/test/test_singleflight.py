@@ -0,0 +1,92 @@
+import asyncio
+import threading
+import time
+from llm.singleflight import SingleFlight
+
+
+def test_concurrent_calls_collapse():
+    flight, calls, results = SingleFlight(), [], []
+
+    def call():
+        calls.append(1)
+        time.sleep(0.2)
+        return {"score": 80}
+
+    threads = [threading.Thread(target=lambda: results.append(flight.do("key", call))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert len(calls) == 1 and results == [{"score": 80}] * 4
+    assert flight.stats()["leaders"] == 1 and flight.stats()["followers"] == 3
+    # Followers get copies, so no caller sees another one's changes
+    assert len({id(result) for result in results}) == 4
+    # Nothing is kept once the call is done
+    flight.do("key", call)
+    assert len(calls) == 2
+
+
+def test_errors_reach_followers():
+    flight, errors = SingleFlight(), []
+
+    def call():
+        time.sleep(0.1)
+        raise ValueError("upstream down")
+
+    def run():
+        try:
+            flight.do("key", call)
+        except ValueError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert len(errors) == 3
+
+
+def test_async_calls_collapse():
+    flight, calls = SingleFlight(), []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"score": 80}
+
+    async def run():
+        return await asyncio.gather(*(flight.ado("key", call) for _ in range(5)), flight.ado("other", call))
+
+    results = asyncio.run(run())
+    assert len(calls) == 2 and results == [{"score": 80}] * 6
+
+
+def test_async_follower_takes_over_cancelled_leader():
+    flight, calls = SingleFlight(), []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return len(calls)
+
+    async def run():
+        leader = asyncio.ensure_future(flight.ado("key", call))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.ado("key", call))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await follower
+
+    assert asyncio.run(run()) == 2
+
+
+def main():
+    test_concurrent_calls_collapse()
+    test_errors_reach_followers()
+    test_async_calls_collapse()
+    test_async_follower_takes_over_cancelled_leader()
+
+
+if __name__ == "__main__":
+    main()
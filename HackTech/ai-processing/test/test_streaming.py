@@ -0,0 +1,87 @@
+import json
+import time
+import openai
+from llm.gpt import stream_openai_sections, parse_json_content
+from llm.streaming import SectionParser
+from llm.timing import begin_request
+
+CV = {"first_name": "Ann", "technical_skills": [{"name": "C++", "strength": 4}, {"name": "SQL"}],
+      "summary": "Says \"hi\", {braces} and [brackets], too.", "education": []}
+
+
+def _feed_all(text: str, size: int):
+    parser, sections = SectionParser(), []
+    for start in range(0, len(text), size):
+        sections += parser.feed(text[start:start + size])
+    return parser, sections
+
+
+def test_sections_in_order_whatever_the_chunking():
+    text = "```json\n" + json.dumps(CV, indent=2) + "\n```"
+    for size in (1, 3, 7, 64, len(text)):
+        parser, sections = _feed_all(text, size)
+        assert sections == list(CV.items())
+        assert parser.done and parser.text == text
+
+
+def test_member_emitted_as_soon_as_complete():
+    parser = SectionParser()
+    assert parser.feed('{"first_name": "Ann", "technical_') == [("first_name", "Ann")]
+    assert parser.feed('skills": ["Python"]') == []
+    assert parser.feed(', "x": 1}') == [("technical_skills", ["Python"]), ("x", 1)]
+    # Anything after the closing brace is ignored
+    assert parser.feed(', "y": 2}') == [] and parser.done
+
+
+def test_truncated_stream():
+    parser, sections = _feed_all('{"first_name": "Ann", "projects": [{"name": "Pay', 5)
+    # The unfinished member is left to the repair of the full answer
+    assert sections == [("first_name", "Ann")] and not parser.done
+
+
+def _streamed(pieces, delay: float = 0.0):
+    def create(**kwargs):
+        for piece in pieces:
+            time.sleep(delay)
+            yield openai.openai_object.OpenAIObject.construct_from({"choices": [{"delta": {"content": piece}}]})
+    return create
+
+
+def _stream(pieces, delay: float = 0.0, between: float = 0.0):
+    original = openai.ChatCompletion.create
+    openai.ChatCompletion.create = _streamed(pieces, delay)
+    try:
+        sections = {}
+        for key, value in stream_openai_sections([{"role": "user", "content": "CV"}], use_cache=False, schema="cv"):
+            sections[key] = value
+            time.sleep(between)
+        return sections
+    finally:
+        openai.ChatCompletion.create = original
+
+
+def test_streamed_sections_are_coerced_like_the_full_answer():
+    text = '{"id": 42, "first_name": "Ann", "technical_skills": null, "projects": ["Pay"]}'
+    sections = _stream([text[:20], text[20:45], text[45:]])
+    assert sections["id"] == "42" and sections["technical_skills"] == []
+    assert sections == parse_json_content(text, "cv")
+
+
+def test_llm_stage_covers_generation_only():
+    stages = begin_request()
+    text = '{"first_name": "Ann", "last_name": "Lee", "projects": []}'
+    _stream([text[:22], text[22:40], text[40:]], delay=0.05, between=0.1)
+    # Three chunk waits; the caller's time on each section is not the LLM's
+    assert 0.14 <= stages["llm"] < 0.3
+
+
+def main():
+    test_sections_in_order_whatever_the_chunking()
+    test_member_emitted_as_soon_as_complete()
+    test_truncated_stream()
+    test_streamed_sections_are_coerced_like_the_full_answer()
+    test_llm_stage_covers_generation_only()
+
+
+if __name__ == "__main__":
+    main()
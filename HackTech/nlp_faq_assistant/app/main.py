@@ -1,5 +1,5 @@
 from fastapi import FastAPI
-from base.retrieve import get_closest_match, assistant
+from base.retrieve import get_closest_match, assistant, db
 from fastapi.middleware.cors import CORSMiddleware
 
 
@@ -24,6 +24,13 @@ async def ask_question(query: dict):
     return get_closest_match(query['user_question'])
 
 
+@app.get("/stats")
+async def stats():
+    # Hit rates of the exact-question table and of the query embedding cache
+    return {"exact_match": db.lookup.stats() if db.lookup is not None else None,
+            "embedding_cache": db.embedding_cache.stats()}
+
+
 @app.post("/set_api_key")
 async def send_api_key(key: dict):
     success = assistant.register_key(key['apiKey'])
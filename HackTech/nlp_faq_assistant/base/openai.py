@@ -6,7 +6,10 @@ from langchain_core.output_parsers import StrOutputParser
 import os
 
 OLLAMA_HOST = os.environ.get("OLLAMA_HOST", "172.16.200.13")
+OLLAMA_PORT = os.environ.get("OLLAMA_PORT", "11434")
 OLLAMA_MODEL = os.environ.get("OLLAMA_MODEL", "orca-mini")
+# Unset means api.openai.com; point it at any OpenAI-compatible server, e.g. ai-processing/benchmarks/llm_stub.py
+OPENAI_BASE_URL = os.environ.get("OPENAI_BASE_URL")
 
 
 class Assistant:
@@ -15,16 +18,9 @@ class Assistant:
 
     @staticmethod
     def test_key(client):
+        # Listing the models authenticates the key without paying for a completion
         try:
-            client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": "This is a test"},
-                    {"role": "user", "content": "this is a test"}
-                ],
-                temperature=0.1,
-                max_tokens=5
-            )
+            client.models.list()
             return True
         except:
             return False
@@ -61,10 +57,10 @@ class Assistant:
                     "answer": self.client.invoke({"input": question})}
 
     def init_client(self):
-        client = openai.OpenAI(api_key=api_key)
+        client = openai.OpenAI(api_key=api_key, base_url=OPENAI_BASE_URL)
 
         if not self.test_key(client):
-            model = Ollama(model=OLLAMA_MODEL, base_url=f"http://{OLLAMA_HOST}:11434")
+            model = Ollama(model=OLLAMA_MODEL, base_url=f"http://{OLLAMA_HOST}:{OLLAMA_PORT}")
             prompt = ChatPromptTemplate.from_messages([
                     ("system", "You are a FAQ assistant."
                                "Your answer should be clear and straightforward."
@@ -83,7 +79,7 @@ class Assistant:
 
     def register_key(self, key):
         if self.client_type == "local":
-            client = openai.OpenAI(api_key=key)
+            client = openai.OpenAI(api_key=key, base_url=OPENAI_BASE_URL)
             if self.test_key(client):
                 self.client = client
                 self.client_type = "openai"
@@ -94,7 +90,7 @@ class Assistant:
                 return False
 
     def switch_local(self):
-        model = Ollama(model=OLLAMA_MODEL, base_url=f"http://{OLLAMA_HOST}:11434")
+        model = Ollama(model=OLLAMA_MODEL, base_url=f"http://{OLLAMA_HOST}:{OLLAMA_PORT}")
         prompt = ChatPromptTemplate.from_messages([
             ("system", "You are a FAQ assistant."
                        "Your answer should be clear and straightforward."
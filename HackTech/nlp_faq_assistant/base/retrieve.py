@@ -10,8 +10,24 @@ SIMILARITY_THRESHOLD = 0.2
 def get_closest_match(query: str):
     print("Searching for closest match to: ", query)
     query = query.strip()
+    # Verbatim, case and punctuation variants of a known question need no embedding at all
+    exact = db.find_exact(query)
+    if exact:
+        matched_question, metadata = exact
+        return {"source": "local",
+                "matched_question": matched_question,
+                "answer": metadata['answer']}
+
+    query_chg = query[:-1] if query.endswith('?') else query + '?'  # question mark status toggled
+    # Both variants are embedded up front in one go (or come from the embedding cache)
+    try:
+        embedding, embedding_chg = db.embed_queries([query, query_chg])
+    except Exception as e:
+        print("Failed to embed the question: ", e)
+        embedding = embedding_chg = None
+
     try:
-        answer, score = db.query_by_similarity(query, 1)[0]
+        answer, score = db.query_by_similarity(query, 1, embedding)[0]
     except IndexError:
         assistant_response = assistant.ask(query)
         db.insert(query, assistant_response['answer'])
@@ -22,8 +38,7 @@ def get_closest_match(query: str):
                 "matched_question": answer.page_content,
                 "answer": answer.metadata['answer']}
     else: #modify question mark status
-        query_chg = query[:-1] if query[-1] == '?' else query[:] + '?'
-        answer, score = db.query_by_similarity(query_chg, 1)[0]
+        answer, score = db.query_by_similarity(query_chg, 1, embedding_chg)[0]
         if score < SIMILARITY_THRESHOLD:
             return {"source": "local",
                     "matched_question": answer.page_content,
@@ -0,0 +1,86 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+import numpy as np
+
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))   # Query embeddings kept in memory, 0 to disable
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "")             # SQLite file to keep them across restarts, empty for memory only
+
+
+def normalize_text(text: str):
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+class EmbeddingCache:
+    """Size-bounded LRU of query embeddings keyed by (model, normalized text), optionally persisted to SQLite."""
+
+    def __init__(self, max_size=EMBEDDING_CACHE_SIZE, path=EMBEDDING_CACHE_PATH):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = self.misses = 0
+        self.conn = None
+        if path and max_size > 0:
+            self.open(path)
+
+    def open(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS query_embeddings ("
+            "model TEXT NOT NULL, text TEXT NOT NULL, vector BLOB NOT NULL, used_at REAL NOT NULL, "
+            "PRIMARY KEY (model, text))"
+        )
+        # Only the most recently used entries fit in memory; the rest are dropped from disk too
+        self.conn.execute(
+            "DELETE FROM query_embeddings WHERE rowid NOT IN "
+            "(SELECT rowid FROM query_embeddings ORDER BY used_at DESC LIMIT ?)", (self.max_size,)
+        )
+        self.conn.commit()
+        rows = self.conn.execute("SELECT model, text, vector FROM query_embeddings ORDER BY used_at").fetchall()
+        for model, text, vector in rows:
+            self.entries[(model, text)] = np.frombuffer(vector, dtype=np.float32)
+        logging.info(f"Loaded {len(rows)} cached query embeddings from {path}.")
+
+    def get(self, model: str, text: str):
+        key = (model, normalize_text(text))
+        with self.lock:
+            vector = self.entries.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def put(self, model: str, text: str, vector):
+        if self.max_size <= 0:
+            return
+        key = (model, normalize_text(text))
+        vector = np.asarray(vector, dtype=np.float32)
+        with self.lock:
+            self.entries[key] = vector
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                evicted, _ = self.entries.popitem(last=False)
+                if self.conn:
+                    self.conn.execute("DELETE FROM query_embeddings WHERE model = ? AND text = ?", evicted)
+            if self.conn:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO query_embeddings (model, text, vector, used_at) VALUES (?, ?, ?, ?)",
+                    (*key, vector.tobytes(), time.time())
+                )
+                self.conn.commit()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {"size": len(self.entries), "max_size": self.max_size, "hits": self.hits, "misses": self.misses,
+                    "hit_rate": round(self.hits / lookups, 4) if lookups else None}
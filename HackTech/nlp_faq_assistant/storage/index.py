@@ -0,0 +1,101 @@
+import os
+import threading
+import logging
+import numpy as np
+from langchain.docstore.document import Document
+
+try:
+    import hnswlib  # Installed with chroma-hnswlib
+except ImportError:
+    hnswlib = None
+
+FAQ_INDEX_ENABLED = os.getenv("FAQ_INDEX_ENABLED", "1") == "1"   # Serve similarity queries from memory, Postgres stays the source of truth
+FAQ_INDEX_HNSW = os.getenv("FAQ_INDEX_HNSW", "0") == "1"         # Approximate search, for corpora too large for an exact scan
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "200"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+class VectorIndex:
+    """In-memory mirror of a pgvector collection for cosine top-k search.
+
+    Vectors are kept normalized in one contiguous float32 matrix, so an exact search is a single
+    matrix-vector product. With use_hnsw (and hnswlib installed) queries go through an HNSW graph
+    instead. Scores are cosine distances, like PGVector with DistanceStrategy.COSINE: lower is closer.
+    """
+
+    def __init__(self, use_hnsw=FAQ_INDEX_HNSW):
+        self.use_hnsw = use_hnsw and hnswlib is not None
+        if use_hnsw and hnswlib is None:
+            logging.warning("hnswlib is not installed. Using exact search for the in-memory index.")
+        self.matrix = None
+        self.documents = []
+        self.hnsw = None
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.documents)
+
+    def add(self, embeddings, documents):
+        if not documents:
+            return
+        vectors = normalize(embeddings)
+        with self.lock:
+            count = len(self.documents)
+            if self.matrix is None:
+                self.matrix = np.zeros((max(1024, len(vectors)), vectors.shape[1]), dtype=np.float32)
+            elif count + len(vectors) > len(self.matrix):
+                # Grow geometrically so inserts stay amortized O(1)
+                grown = np.zeros((max(2 * len(self.matrix), count + len(vectors)), self.matrix.shape[1]), dtype=np.float32)
+                grown[:count] = self.matrix[:count]
+                self.matrix = grown
+            self.matrix[count:count + len(vectors)] = vectors
+            self.documents.extend(documents)
+            if self.use_hnsw:
+                self._add_to_hnsw(vectors, count)
+
+    def _add_to_hnsw(self, vectors, first_row):
+        if self.hnsw is None:
+            self.hnsw = hnswlib.Index(space="cosine", dim=vectors.shape[1])
+            self.hnsw.init_index(max_elements=len(self.matrix), ef_construction=HNSW_EF_CONSTRUCTION, M=HNSW_M)
+            self.hnsw.set_ef(HNSW_EF_SEARCH)
+        elif self.hnsw.get_max_elements() < len(self.matrix):
+            self.hnsw.resize_index(len(self.matrix))
+        self.hnsw.add_items(vectors, np.arange(first_row, first_row + len(vectors)))
+
+    def search(self, embedding, top_k=1):
+        """Return [(Document, cosine distance)] of the top_k closest entries, closest first."""
+        query = normalize(embedding)
+        with self.lock:
+            count = len(self.documents)
+            if not count or top_k < 1:
+                return []
+            top_k = min(top_k, count)
+            if self.hnsw is not None:
+                rows, distances = self.hnsw.knn_query(query, k=top_k)
+                return [(self.documents[row], float(distance)) for row, distance in zip(rows[0], distances[0])]
+            similarities = self.matrix[:count] @ query
+            if top_k < count:
+                rows = np.argpartition(-similarities, top_k - 1)[:top_k]
+            else:
+                rows = np.arange(count)
+            rows = rows[np.argsort(-similarities[rows], kind="stable")]
+            return [(self.documents[row], float(1.0 - similarities[row])) for row in rows]
+
+    def load(self, rows):
+        """Fill the index from (embedding, text, metadata) rows, e.g. those of a pgvector collection."""
+        batch_vectors, batch_documents = [], []
+        for embedding, text, metadata in rows:
+            batch_vectors.append(np.asarray(embedding, dtype=np.float32))
+            batch_documents.append(Document(page_content=text, metadata=metadata or {}))
+            if len(batch_documents) == 1000:
+                self.add(np.stack(batch_vectors), batch_documents)
+                batch_vectors, batch_documents = [], []
+        if batch_documents:
+            self.add(np.stack(batch_vectors), batch_documents)
@@ -0,0 +1,225 @@
+import os
+import json
+import uuid
+import hashlib
+import logging
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from psycopg2.extras import execute_values
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "4"))             # Embedding batches in flight at once
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "64"))      # Rows embedded and inserted (and checkpointed) together
+INGEST_CSV_DELIMITER = os.getenv("INGEST_CSV_DELIMITER", ",")
+
+
+def content_hash(question: str, metadata: dict):
+    payload = json.dumps([question, metadata], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def file_fingerprint(path: str):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class LazyHashes:
+    """Set of content hashes loaded on first use, so a load with nothing left to read never queries the collection."""
+
+    def __init__(self, load):
+        self.load = load
+        self.hashes = None
+
+    def _loaded(self):
+        if self.hashes is None:
+            self.hashes = self.load()
+        return self.hashes
+
+    def __contains__(self, key):
+        return key in self._loaded()
+
+    def add(self, key):
+        self._loaded().add(key)
+
+
+def read_batches(csv_path: str, delimiter=INGEST_CSV_DELIMITER, start_row=0, batch_size=INGEST_BATCH_SIZE, seen=None):
+    """Yield (rows read so far, [(hash, question, metadata)]) with up to batch_size rows not in seen.
+
+    The first start_row rows are skipped; every column but "question" goes into the metadata,
+    like DataFrameLoader. Hashes are added to seen, so repeated rows are only yielded once.
+    """
+    seen = set() if seen is None else seen
+    row, batch, last_yielded = 0, [], start_row
+    for chunk in pd.read_csv(csv_path, delimiter=delimiter, dtype=str, keep_default_na=False, chunksize=1000):
+        for record in chunk.to_dict("records"):
+            row += 1
+            if row <= start_row:
+                continue
+            question = record.pop("question")
+            key = content_hash(question, record)
+            if key in seen:
+                continue
+            seen.add(key)
+            batch.append((key, question, record))
+            if len(batch) == batch_size:
+                yield row, batch
+                batch, last_yielded = [], row
+    # Skipped rows at the end still move the checkpoint
+    if batch or row > last_yielded:
+        yield row, batch
+
+
+class Ingestion:
+    """Bulk load of a FAQ CSV into a PGVector collection.
+
+    Batches are embedded by a bounded thread pool and written in file order with execute_values,
+    each in one transaction with the checkpoint, so an interrupted load resumes after the last
+    written batch. Rows whose content hash is already in the collection are not embedded again.
+    """
+
+    def __init__(self, conn, collection_name: str, embed_documents, workers=INGEST_WORKERS, batch_size=INGEST_BATCH_SIZE):
+        self.conn = conn
+        self.collection_name = collection_name
+        self.embed_documents = embed_documents
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.collection_id = None
+
+    def run(self, csv_path: str, delimiter=INGEST_CSV_DELIMITER):
+        """Load the file and return the number of rows inserted."""
+        stat = os.stat(csv_path)
+        source = (os.path.basename(csv_path), stat.st_size, stat.st_mtime)
+        with self.conn.cursor() as cur:
+            cur.execute(
+                "CREATE TABLE IF NOT EXISTS faq_ingest_checkpoint ("
+                "collection TEXT NOT NULL, fingerprint TEXT NOT NULL, source TEXT NOT NULL, rows_done BIGINT NOT NULL, "
+                "completed BOOLEAN NOT NULL, updated_at TIMESTAMPTZ NOT NULL DEFAULT now(), "
+                "PRIMARY KEY (collection, fingerprint))"
+            )
+            cur.execute("ALTER TABLE faq_ingest_checkpoint ADD COLUMN IF NOT EXISTS size BIGINT, "
+                        "ADD COLUMN IF NOT EXISTS mtime DOUBLE PRECISION")
+            cur.execute("SELECT uuid FROM langchain_pg_collection WHERE name = %s", (self.collection_name,))
+            collection = cur.fetchone()
+            if not collection:
+                raise ValueError(f"Collection {self.collection_name} does not exist")
+            self.collection_id = collection[0]
+            # The same file, untouched since a completed load: neither it nor the collection needs reading
+            cur.execute(
+                "SELECT 1 FROM faq_ingest_checkpoint WHERE collection = %s AND source = %s AND size = %s AND mtime = %s "
+                "AND completed", (self.collection_name, *source)
+            )
+            unchanged = cur.fetchone()
+        self.conn.commit()
+        if unchanged:
+            logging.info(f"{csv_path} is already loaded into {self.collection_name}.")
+            return 0
+
+        fingerprint = file_fingerprint(csv_path)
+        with self.conn.cursor() as cur:
+            cur.execute(
+                "SELECT rows_done, completed FROM faq_ingest_checkpoint WHERE collection = %s AND fingerprint = %s",
+                (self.collection_name, fingerprint)
+            )
+            checkpoint = cur.fetchone()
+        self.conn.commit()
+
+        rows_done, completed = checkpoint or (0, False)
+        if completed:
+            # Same content under a new name or mtime: remember the file as it is now
+            self.mark_completed(fingerprint, source)
+            logging.info(f"{csv_path} is already loaded into {self.collection_name}.")
+            return 0
+        if rows_done:
+            logging.info(f"Resuming the load of {csv_path} after row {rows_done}.")
+
+        # Only read when a row past the checkpoint has to be checked for duplicates
+        seen = LazyHashes(self.existing_hashes)
+        inserted, pending = 0, deque()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="faq-ingest") as executor:
+            for row, batch in read_batches(csv_path, delimiter, rows_done, self.batch_size, seen):
+                questions = [question for _, question, _ in batch]
+                pending.append((row, batch, executor.submit(self.embed_documents, questions) if batch else None))
+                # Only a few batches are read ahead of the writes, whatever the size of the file
+                if len(pending) > self.workers:
+                    inserted += self.write(fingerprint, csv_path, *pending.popleft())
+            while pending:
+                inserted += self.write(fingerprint, csv_path, *pending.popleft())
+
+        self.mark_completed(fingerprint, source)
+        return inserted
+
+    def mark_completed(self, fingerprint: str, source):
+        with self.conn.cursor() as cur:
+            cur.execute(
+                "UPDATE faq_ingest_checkpoint SET completed = TRUE, source = %s, size = %s, mtime = %s, updated_at = now() "
+                "WHERE collection = %s AND fingerprint = %s",
+                (*source, self.collection_name, fingerprint)
+            )
+        self.conn.commit()
+
+    def existing_hashes(self):
+        # Rows written by this module carry their hash in custom_id; the others (inserted by the app)
+        # are hashed from their content, so they count too
+        with self.conn.cursor() as cur:
+            cur.execute(
+                "SELECT custom_id, CASE WHEN custom_id ~ '^[0-9a-f]{64}$' THEN NULL ELSE document END, "
+                "CASE WHEN custom_id ~ '^[0-9a-f]{64}$' THEN NULL ELSE cmetadata END "
+                "FROM langchain_pg_embedding WHERE collection_id = %s", (self.collection_id,)
+            )
+            return {custom_id if document is None else content_hash(document, metadata or {})
+                    for custom_id, document, metadata in cur}
+
+    def write(self, fingerprint: str, source: str, row: int, batch, future):
+        embeddings = future.result() if future else []
+        try:
+            with self.conn.cursor() as cur:
+                if batch:
+                    execute_values(
+                        cur,
+                        "INSERT INTO langchain_pg_embedding (uuid, collection_id, embedding, document, cmetadata, custom_id) "
+                        "VALUES %s",
+                        [(str(uuid.uuid4()), self.collection_id, np.asarray(embedding, dtype=np.float32), question,
+                          json.dumps(metadata, ensure_ascii=False), key)
+                         for (key, question, metadata), embedding in zip(batch, embeddings)],
+                        page_size=len(batch)
+                    )
+                cur.execute(
+                    "INSERT INTO faq_ingest_checkpoint (collection, fingerprint, source, rows_done, completed) "
+                    "VALUES (%s, %s, %s, %s, FALSE) "
+                    "ON CONFLICT (collection, fingerprint) DO UPDATE SET rows_done = EXCLUDED.rows_done, updated_at = now()",
+                    (self.collection_name, fingerprint, os.path.basename(source), row)
+                )
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        logging.info(f"Loaded {row} rows of {source} into {self.collection_name}.")
+        return len(batch)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load a FAQ CSV with a question column into the pgvector collection.")
+    parser.add_argument("csv_path")
+    parser.add_argument("--collection", default=None, help="defaults to the collection of OLLAMA_MODEL")
+    parser.add_argument("--delimiter", default=INGEST_CSV_DELIMITER)
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS)
+    parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE)
+    args = parser.parse_args()
+
+    from storage.storage import Database  # Imported here, the Database populates itself through this module
+    db = Database(collection_name=args.collection, csv_path=args.csv_path, populate=False)
+    try:
+        inserted = db.create_db(delimiter=args.delimiter, workers=args.workers, batch_size=args.batch_size)
+    finally:
+        db.close()
+    if inserted is None:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
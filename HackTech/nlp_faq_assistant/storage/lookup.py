@@ -0,0 +1,63 @@
+import os
+import re
+import threading
+import unicodedata
+
+FAQ_LOOKUP_ENABLED = os.getenv("FAQ_LOOKUP_ENABLED", "1") == "1"     # Answer exact (normalized) repeats without embedding them
+FAQ_LOOKUP_STEMMING = os.getenv("FAQ_LOOKUP_STEMMING", "0") == "1"   # Also match "change passwords" with "changing password"
+
+_SUFFIXES = ("ing", "ed", "es", "e", "s")
+
+
+def stem(word: str):
+    # Light suffix stripping; enough for plurals and verb forms in short questions
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+
+def normalize_question(text: str, stemming=FAQ_LOOKUP_STEMMING):
+    """Lowercase, drop punctuation and symbols, collapse whitespace (and optionally stem)."""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = "".join(" " if unicodedata.category(char)[0] in "PS" else char for char in text)
+    words = text.split()
+    if stemming:
+        words = [stem(word) for word in words]
+    return " ".join(words)
+
+
+class QuestionLookup:
+    """Hash table from normalized question to its stored entry, checked before any embedding or vector search."""
+
+    def __init__(self):
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, question: str, metadata):
+        key = normalize_question(question)
+        if not key:
+            return
+        with self.lock:
+            # A question already known keeps its answer
+            self.entries.setdefault(key, (question, metadata))
+
+    def get(self, question: str):
+        """Return (stored question, metadata) or None."""
+        entry = self.entries.get(normalize_question(question))
+        with self.lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return entry
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {"size": len(self.entries), "stemming": FAQ_LOOKUP_STEMMING, "hits": self.hits,
+                    "misses": self.misses, "hit_rate": round(self.hits / lookups, 4) if lookups else None}
@@ -1,13 +1,19 @@
 import os
 import time
 import logging
-import pandas as pd
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+import psycopg2
 from psycopg2 import pool
-from langchain_community.document_loaders import DataFrameLoader
+from pgvector.psycopg2 import register_vector
 from langchain_community.embeddings import OllamaEmbeddings
 from langchain_community.vectorstores import PGVector
 from langchain.vectorstores.pgvector import DistanceStrategy
 from langchain.docstore.document import Document
+from storage.index import VectorIndex, FAQ_INDEX_ENABLED
+from storage.cache import EmbeddingCache
+from storage.lookup import QuestionLookup, FAQ_LOOKUP_ENABLED
+from storage.ingest import Ingestion, INGEST_CSV_DELIMITER, INGEST_WORKERS, INGEST_BATCH_SIZE
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -21,11 +27,13 @@ PGVECTOR_USER = os.getenv("PGVECTOR_USER", "postgres")
 PGVECTOR_PASSWORD = os.getenv("PGVECTOR_PASSWORD", "postgres")
 
 OLLAMA_HOST = os.getenv("OLLAMA_HOST", "localhost")
+OLLAMA_PORT = os.getenv("OLLAMA_PORT", "11434")
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "orca-mini")
 
 
 class Database:
-    def __init__(self, collection_name=None, distance_strategy=DistanceStrategy.COSINE, csv_path='./storage/FAQ.csv'):
+    def __init__(self, collection_name=None, distance_strategy=DistanceStrategy.COSINE, csv_path='./storage/FAQ.csv',
+                 populate=True):
         self.COLLECTION_NAME = collection_name or f"questions_{OLLAMA_MODEL.replace('-', '_')}"
         self.distance_strategy = distance_strategy
         self.csv_path = csv_path
@@ -49,12 +57,19 @@ class Database:
             password=PGVECTOR_PASSWORD
         )
 
-        self.embedding_model = OllamaEmbeddings(model=OLLAMA_MODEL, base_url=f"http://{OLLAMA_HOST}:11434")
+        self.embedding_model = OllamaEmbeddings(model=OLLAMA_MODEL, base_url=f"http://{OLLAMA_HOST}:{OLLAMA_PORT}")
         self.db = None  # Initialize self.db as None first
+        self.index = None  # In-memory mirrors of the collection, see load_collection
+        self.lookup = None
+        self.embedding_cache = EmbeddingCache()
         self.wait_for_db_to_start()
         self.create_database_if_not_exists()
         self.create_extension_if_not_exists()
-        self.populate_db_if_not_populated()
+        if populate:
+            self.populate_db_if_not_populated()
+            self.load_collection()
+        else:
+            self.initialize_db()  # Still creates the collection, e.g. for an offline load
 
     def wait_for_db_to_start(self):
         """Wait for the database to be ready by attempting to acquire a connection."""
@@ -124,43 +139,118 @@ class Database:
     def populate_db_if_not_populated(self):
         self.initialize_db()  # Ensure db is initialized
         if self.db:
-            try:
-                # Use similarity_search to check if there are any documents
-                try:
-                    _ = self.db.similarity_search("Test", 1)
-                    logging.info(f"Database {PGVECTOR_DATABASE}:{self.COLLECTION_NAME} already populated.")
-                except IndexError:
-                    # No documents found, so we proceed with population
-                    self.create_db()
-                    logging.info(f"Successfully populated database {PGVECTOR_DATABASE}:{self.COLLECTION_NAME}")
-            except Exception as e:
-                logging.error(f"Failed to check or populate database: {e}")
+            # A no-op once the CSV is fully loaded; otherwise resumes an interrupted load or adds the new rows
+            self.create_db()
 
 
-    def create_db(self):
+    def create_db(self, delimiter=INGEST_CSV_DELIMITER, workers=INGEST_WORKERS, batch_size=INGEST_BATCH_SIZE):
+        """Load the CSV into the collection, see storage.ingest. Returns the number of new rows, None on failure."""
         self.initialize_db()  # Ensure db is initialized
         if not self.db:
             logging.error("Database connection is not initialized. Cannot populate the database.")
-            return
+            return None
         
         logging.info("Populating database. This may take some time.")
+        conn = None
         try:
-            for chunk in pd.read_csv(self.csv_path, delimiter=';', chunksize=1000):
-                loader = DataFrameLoader(chunk, page_content_column="question")
-                docs = loader.load()
-                self.db.add_documents(docs)
-            logging.info("Finished populating database.")
+            conn = self.connect()
+            ingestion = Ingestion(conn, self.COLLECTION_NAME, self.embedding_model.embed_documents, workers, batch_size)
+            inserted = ingestion.run(self.csv_path, delimiter)
+            logging.info(f"Finished populating database {PGVECTOR_DATABASE}:{self.COLLECTION_NAME} with {inserted} new entries.")
+            return inserted
         except Exception as e:
             logging.error(f"Error populating database: {e}")
+            return None
+        finally:
+            if conn:
+                conn.close()
+
+    def connect(self):
+        """A dedicated connection to PGVECTOR_DATABASE; the pool is connected to the maintenance database."""
+        conn = psycopg2.connect(dbname=PGVECTOR_DATABASE, user=PGVECTOR_USER, password=PGVECTOR_PASSWORD,
+                                host=PGVECTOR_HOST, port=PGVECTOR_PORT)
+        register_vector(conn)
+        return conn
+
+    def load_collection(self):
+        """Mirror the collection in memory: the normalized-question table and, unless disabled, the vector index,
+        so repeated questions and similarity queries skip the SQL round trip."""
+        index = VectorIndex() if FAQ_INDEX_ENABLED else None
+        lookup = QuestionLookup() if FAQ_LOOKUP_ENABLED else None
+        if index is None and lookup is None:
+            return
+
+        def rows(cur):
+            for embedding, text, metadata in cur:
+                if lookup is not None:
+                    lookup.add(text, metadata or {})
+                yield embedding, text, metadata
+
+        conn = None
+        try:
+            conn = self.connect()
+            with conn.cursor(name="faq_index") as cur:
+                cur.itersize = 1000
+                cur.execute(
+                    f"SELECT {'e.embedding' if index is not None else 'NULL'}, e.document, e.cmetadata "
+                    "FROM langchain_pg_embedding e JOIN langchain_pg_collection c ON e.collection_id = c.uuid "
+                    "WHERE c.name = %s",
+                    (self.COLLECTION_NAME,)
+                )
+                if index is not None:
+                    index.load(rows(cur))
+                else:
+                    for _ in rows(cur):
+                        pass
+            self.index, self.lookup = index, lookup
+            logging.info(f"Loaded {len(index if index is not None else lookup)} entries of {self.COLLECTION_NAME} into memory.")
+        except Exception as e:
+            logging.error(f"Failed to load the collection into memory, querying Postgres instead: {e}")
+            self.index = self.lookup = None
+        finally:
+            if conn:
+                conn.close()
+
+    def find_exact(self, question: str):
+        """Stored (question, answer metadata) whose normalized text equals the question's, or None."""
+        return self.lookup.get(question) if self.lookup is not None else None
+
+    def embed_queries(self, queries):
+        """Embed user questions, reusing cached embeddings; the missing ones are embedded together."""
+        vectors = [self.embedding_cache.get(OLLAMA_MODEL, query) for query in queries]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            # Ollama embeds one text per request, so the batch goes out as concurrent requests
+            with ThreadPoolExecutor(max_workers=len(missing)) as executor:
+                embedded = list(executor.map(self.embedding_model.embed_query, [queries[i] for i in missing]))
+            for i, vector in zip(missing, embedded):
+                self.embedding_cache.put(OLLAMA_MODEL, queries[i], vector)
+                vectors[i] = np.asarray(vector, dtype=np.float32)
+        return vectors
+
+    def query_by_similarity(self, query: str, top_k: int = 1, embedding=None):
+        if embedding is None:
+            try:
+                embedding = self.embed_queries([query])[0]
+            except Exception as e:
+                logging.error(f"Failed to embed the query: {e}")
+                return []
+
+        if self.index is not None and len(self.index):
+            try:
+                results = self.index.search(embedding, top_k)
+                if results:
+                    return results
+            except Exception as e:
+                logging.error(f"In-memory similarity query failed, querying Postgres instead: {e}")
 
-    def query_by_similarity(self, query: str, top_k: int = 1):
         self.initialize_db()  # Ensure db is initialized
         if not self.db:
             logging.error("Database connection is not initialized. Aborting query.")
             return []
         
         try:
-            results = self.db.similarity_search_with_score(query, top_k)
+            results = self.db.similarity_search_with_score_by_vector(embedding.tolist(), top_k)
             if results:
                 return results
             else:
@@ -178,11 +268,20 @@ class Database:
         
         logging.info("Inserting new question and answer into database")
         try:
-            entry = Document(page_content=question, metadata={"answer": answer})
-            self.db.add_documents([entry])
+            # Embedded once, for both Postgres and the in-memory index
+            embedding = self.embedding_model.embed_documents([question])[0]
+            metadata = {"answer": answer}
+            self.db.add_embeddings(texts=[question], embeddings=[embedding], metadatas=[metadata])
             logging.info("Successfully inserted new document.")
         except Exception as e:
             logging.error(f"Failed to insert document: {e}")
+            return
+
+        # Only mirrored once Postgres has it
+        if self.index is not None:
+            self.index.add([embedding], [Document(page_content=question, metadata=metadata)])
+        if self.lookup is not None:
+            self.lookup.add(question, metadata)
 
     def close(self):
         if self.connection_pool:
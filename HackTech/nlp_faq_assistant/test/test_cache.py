@@ -0,0 +1,53 @@
+import os
+import tempfile
+import numpy as np
+from storage.cache import EmbeddingCache
+
+
+def test_embedding_cache():
+    cache = EmbeddingCache(max_size=2, path="")
+    assert cache.get("model-a", "How do I reset my password?") is None
+    cache.put("model-a", "How do I reset my password?", [0.1, 0.2])
+
+    # Whitespace is normalized, case is not
+    assert np.allclose(cache.get("model-a", "  How do I reset   my password? "), [0.1, 0.2])
+    assert cache.get("model-a", "how do i reset my password?") is None
+    # Entries are keyed by model
+    assert cache.get("model-b", "How do I reset my password?") is None
+    cache.put("model-b", "How do I reset my password?", [0.3, 0.4])
+    assert np.allclose(cache.get("model-b", "How do I reset my password?"), [0.3, 0.4])
+
+    stats = cache.stats()
+    assert (stats["size"], stats["hits"], stats["misses"], stats["hit_rate"]) == (2, 2, 3, 0.4)
+
+
+def test_eviction():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "embeddings.sqlite3")
+        cache = EmbeddingCache(max_size=2, path=path)
+        cache.put("model", "first", [1.0])
+        cache.put("model", "second", [2.0])
+        cache.get("model", "first")
+        cache.put("model", "third", [3.0])
+        # The least recently used entry goes, in memory and on disk
+        assert cache.get("model", "second") is None
+        assert cache.get("model", "first") is not None
+
+        reloaded = EmbeddingCache(max_size=2, path=path)
+        assert reloaded.get("model", "second") is None
+        assert np.allclose(reloaded.get("model", "third"), [3.0])
+        # A smaller cache keeps only the most recent entries
+        assert EmbeddingCache(max_size=1, path=path).stats()["size"] == 1
+
+    disabled = EmbeddingCache(max_size=0, path="")
+    disabled.put("model", "first", [1.0])
+    assert disabled.get("model", "first") is None
+
+
+def main():
+    test_embedding_cache()
+    test_eviction()
+
+
+if __name__ == "__main__":
+    main()
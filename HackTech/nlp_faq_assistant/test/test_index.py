@@ -0,0 +1,27 @@
+import numpy as np
+from storage.index import VectorIndex
+from langchain.docstore.document import Document
+
+
+def test_index_search():
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(2000, 64))
+    index = VectorIndex(use_hnsw=False)
+    index.load((vector, f"question {i}", {"answer": f"answer {i}"}) for i, vector in enumerate(vectors))
+
+    answer, score = index.search(vectors[42] * 2, 1)[0]
+    assert answer.page_content == "question 42"
+    assert abs(score) < 1e-5
+
+    # Inserted entries are searchable right away
+    index.add([vectors[7] + 0.001], [Document(page_content="new question", metadata={"answer": "new answer"})])
+    assert len(index) == 2001
+    assert {answer.page_content for answer, _ in index.search(vectors[7], 2)} == {"question 7", "new question"}
+
+
+def main():
+    test_index_search()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+import os
+import tempfile
+from storage.ingest import read_batches, content_hash, LazyHashes
+
+
+def test_read_batches():
+    with tempfile.TemporaryDirectory() as directory:
+        csv_path = os.path.join(directory, "faq.csv")
+        with open(csv_path, "w", encoding="utf-8") as f:
+            f.write('question,answer\n'
+                    'Q1,"A1, with a comma"\n'
+                    'Q2,"A2\nover two lines"\n'
+                    'Q1,"A1, with a comma"\n'
+                    'Q3,A3\n'
+                    'Q4,A4\n')
+
+        batches = list(read_batches(csv_path, batch_size=2))
+        assert [(row, [question for _, question, _ in batch]) for row, batch in batches] == [(2, ["Q1", "Q2"]), (5, ["Q3", "Q4"])]
+        key, question, metadata = batches[0][1][1]
+        assert metadata == {"answer": "A2\nover two lines"} and key == content_hash(question, metadata)
+
+        # Resuming after a checkpoint, with the rows already in the collection
+        seen = {key for key, _, _ in batches[0][1]} | {content_hash("Q3", {"answer": "A3"})}
+        assert [[question for _, question, _ in batch] for _, batch in read_batches(csv_path, start_row=2, seen=seen)] == [["Q4"]]
+
+
+def test_hashes_loaded_only_when_needed():
+    with tempfile.TemporaryDirectory() as directory:
+        csv_path = os.path.join(directory, "faq.csv")
+        with open(csv_path, "w", encoding="utf-8") as f:
+            f.write('question,answer\nQ1,A1\nQ2,A2\n')
+
+        loads = []
+        seen = LazyHashes(lambda: loads.append(1) or {content_hash("Q1", {"answer": "A1"})})
+        # Every row is behind the checkpoint: the collection is never read
+        assert [batch for _, batch in read_batches(csv_path, start_row=2, seen=seen)] == []
+        assert loads == []
+
+        assert [[question for _, question, _ in batch] for _, batch in read_batches(csv_path, seen=seen)] == [["Q2"]]
+        assert loads == [1]
+
+
+def main():
+    test_read_batches()
+    test_hashes_loaded_only_when_needed()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+from storage.lookup import QuestionLookup, normalize_question
+
+
+def test_lookup():
+    lookup = QuestionLookup()
+    lookup.add("How do I reset my password?", {"answer": "Use the reset link."})
+
+    question, metadata = lookup.get("  how do i RESET my password ")
+    assert question == "How do I reset my password?"
+    assert metadata["answer"] == "Use the reset link."
+    assert lookup.get("How do I change my password?") is None
+
+    stats = lookup.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (1, 1, 0.5)
+
+    assert normalize_question("Changing passwords?", stemming=True) == normalize_question("change password", stemming=True)
+
+
+def main():
+    test_lookup()
+
+
+if __name__ == "__main__":
+    main()